@@ -0,0 +1,44 @@
+""" Compare per-request latency of a fresh httpx client per call against the pooled HTTPApi client.
+
+Usage: python -m benchmarks.http_pool [requests]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+from diffcord.api import HTTPApi
+from diffcord.testing import FakeDiffcordServer
+
+
+async def fresh_client_request(base_url: str, token: str) -> None:
+    async with httpx.AsyncClient(headers={"x-api-key": token}) as client:
+        response = await client.get(base_url + "/v1/votes")
+        response.json()
+
+
+async def measure(label: str, requests: int, request) -> None:
+    latencies = []
+
+    for _ in range(requests):
+        start = time.perf_counter()
+        await request()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    print(f"{label:>8}: mean={statistics.mean(latencies):.3f}ms "
+          f"p50={latencies[len(latencies) // 2]:.3f}ms p99={latencies[int(len(latencies) * 0.99) - 1]:.3f}ms")
+
+
+async def main(requests: int) -> None:
+    async with FakeDiffcordServer() as server:
+        await measure("fresh", requests, lambda: fresh_client_request(server.base_url, server.token))
+
+        async with HTTPApi(server.token, server.base_url) as api:
+            await measure("pooled", requests, lambda: api.make_request("GET", "/v1/votes"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,46 @@
+""" Measure the cold import time of the package and which heavy dependencies each import pulls in.
+
+Every statement runs in a fresh interpreter, the reported time excludes the interpreter start up.
+
+Usage: python -m benchmarks.import_time [runs]
+"""
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = [
+    "import diffcord",
+    "from diffcord import UserBotVote",
+    "from diffcord import HTTPApi",
+    "from diffcord import Client",
+    "from diffcord import VoteWebhookListener; VoteWebhookListener(0, print)",
+]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed * 1000, "httpx" in sys.modules, "tornado" in sys.modules)
+"""
+
+
+def measure(statement: str, runs: int) -> None:
+    timings = []
+
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE.format(statement=statement)], check=True,
+                                capture_output=True, text=True).stdout.split()
+        timings.append(float(output[0]))
+
+    print(f"{statement[:48]:<48} median={statistics.median(timings):7.2f}ms min={min(timings):7.2f}ms "
+          f"httpx={output[1]} tornado={output[2]}")
+
+
+def main(runs: int) -> None:
+    for statement in STATEMENTS:
+        measure(statement, runs)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,145 @@
+""" Load and latency benchmarks of the client and the webhook listener against a local FakeDiffcordServer.
+
+Reports the request throughput and p50/p99 latency of the client and the vote ingestion rate of VoteWebhookListener
+at each concurrency level, as JSON so that results can be compared between releases.
+
+Usage: python -m benchmarks.suite [--requests N] [--concurrency 1,10,50] [--latency MS] [--output FILE]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import socket
+import sys
+import time
+from typing import Awaitable, Callable, List
+
+from diffcord import Client, UserBotVote, VoteWebhookListener
+from diffcord.serialization import JSON_BACKEND
+from diffcord.testing import FakeDiffcordServer
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+async def run_load(name: str, requests: int, concurrency: int, request: Callable[[int], Awaitable[bool]]) -> dict:
+    """ Run requests calls of request with at most concurrency of them in flight.
+    request receives the index of the call and returns whether it succeeded.
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+
+        for index in counter:
+            start = time.perf_counter()
+
+            try:
+                ok = await request(index)
+            except Exception:
+                ok = False
+
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "name": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def benchmark_client(server: FakeDiffcordServer, requests: int, concurrency: int) -> List[dict]:
+    async with Client(None, server.token, None, base_url=server.base_url,
+                      max_keepalive_connections=max(20, concurrency)) as client:
+        # distinct users, so that concurrent lookups are not coalesced into one request
+        async def user_votes(index: int) -> bool:
+            await client.get_user_vote_info(100000000000000000 + index)
+            return True
+
+        async def post_stats(index: int) -> bool:
+            await client.make_request("POST", "/v1/stats", params={"guilds": index})
+            return True
+
+        return [
+            await run_load("client.get_user_vote_info", requests, concurrency, user_votes),
+            await run_load("client.post_stats", requests, concurrency, post_stats),
+        ]
+
+
+async def benchmark_webhook(server: FakeDiffcordServer, requests: int, concurrency: int) -> dict:
+    handled = 0
+
+    async def handle_vote(vote: UserBotVote):
+        nonlocal handled
+        handled += 1
+
+    port = free_port()
+    listener = VoteWebhookListener(port, handle_vote, host="127.0.0.1", silent=True, verify_code="benchmark")
+    await listener.start()
+
+    # built up front, so that only the delivery is measured
+    votes = [server.create_vote() for _ in range(requests)]
+    url = f"http://127.0.0.1:{port}/"
+
+    async def deliver(index: int) -> bool:
+        return await server.send_vote(url, "benchmark", vote=votes[index]) == 200
+
+    try:
+        return await run_load("webhook.ingest", requests, concurrency, deliver)
+    finally:
+        await listener.stop()
+
+
+async def main(requests: int, concurrency_levels: List[int], latency: float) -> dict:
+    results = []
+
+    async with FakeDiffcordServer(latency=datetime.timedelta(milliseconds=latency)) as server:
+        for concurrency in concurrency_levels:
+            results.extend(await benchmark_client(server, requests, concurrency))
+            results.append(await benchmark_webhook(server, requests, concurrency))
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": JSON_BACKEND,
+        "server_latency_ms": latency,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000, help="requests per benchmark and concurrency level")
+    parser.add_argument("--concurrency", default="1,10,50", help="comma separated concurrency levels")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency (ms) added by the fake server")
+    parser.add_argument("--output", help="file to write the JSON report to instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args.requests, [int(level) for level in args.concurrency.split(",")], args.latency))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,65 @@
+""" Measure parse + construct time and memory per vote for the webhook payload decode path.
+
+Usage: python -m benchmarks.vote_parse [votes]
+"""
+import datetime
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+
+from diffcord.serialization import JSON_BACKEND
+from diffcord.vote import UserBotVote
+
+
+class EagerUserBotVote:
+    """ The previous UserBotVote: a plain __dict__ object computing every field up front. """
+
+    def __init__(self, vote_id, user_id, bot_id, since_vote, rewarded, test, monthly_votes):
+        self.vote_id = vote_id
+        self.user_id = int(user_id)
+        self.bot_id = int(bot_id)
+        self.since_voted = datetime.timedelta(seconds=float(since_vote))
+        self.voted_at = datetime.datetime.utcnow() - self.since_voted
+        self.rewarded = rewarded
+        self.test = test
+        self.monthly_votes = monthly_votes
+
+
+def create_payloads(votes: int) -> list:
+    return [json.dumps({
+        "vote_id": str(uuid.uuid4()),
+        "user_id": str(100000000000000000 + i),
+        "bot_id": "999999999999999999",
+        "since_vote": "1.5",
+        "rewarded": False,
+        "test": False,
+        "monthly_votes": i % 50,
+    }).encode() for i in range(votes)]
+
+
+def measure(label: str, payloads: list, parse) -> None:
+    start = time.perf_counter()
+    for payload in payloads:
+        parse(payload)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    kept = [parse(payload) for payload in payloads]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:>6}: {elapsed / len(payloads) * 1e6:.2f}us/vote {size / len(kept):.0f} bytes/vote")
+
+
+def main(votes: int) -> None:
+    payloads = create_payloads(votes)
+    print(f"{votes} votes, json backend: {JSON_BACKEND}")
+
+    measure("eager", payloads, lambda payload: EagerUserBotVote(**json.loads(payload.decode("utf-8"))))
+    measure("lazy", payloads, UserBotVote.from_json)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
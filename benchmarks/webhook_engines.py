@@ -0,0 +1,85 @@
+""" Compare the webhook throughput of the tornado and asyncio listener engines.
+
+The listener runs in this process, the load is generated by a separate process over keep-alive connections, so
+requests per CPU second of the listener process approximate requests per second per core.
+
+Usage: python -m benchmarks.webhook_engines [requests] [connections]
+"""
+import asyncio
+import json
+import socket
+import sys
+import time
+import uuid
+
+from diffcord import UserBotVote, VoteWebhookListener
+
+LOAD_GENERATOR = """
+import asyncio, sys
+
+async def connection(port, requests, body):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    request = b"POST / HTTP/1.1\\r\\nHost: localhost\\r\\nAuthorization: benchmark\\r\\nContent-Length: %d\\r\\n\\r\\n" % len(body) + body
+
+    for _ in range(requests):
+        writer.write(request)
+        line = await reader.readuntil(b"\\r\\n\\r\\n")
+        length = int(line.lower().split(b"content-length: ")[1].split(b"\\r\\n")[0])
+        await reader.readexactly(length)
+
+    writer.close()
+
+async def main(port, requests, connections, body):
+    await asyncio.gather(*(connection(port, requests // connections, body) for _ in range(connections)))
+
+asyncio.run(main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), sys.argv[4].encode()))
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def measure(engine: str, requests: int, connections: int) -> None:
+    async def handle_vote(vote: UserBotVote):
+        pass
+
+    port = free_port()
+    listener = VoteWebhookListener(port, handle_vote, host="127.0.0.1", silent=True, verify_code="benchmark",
+                                   engine=engine)
+    await listener.start()
+
+    body = json.dumps({
+        "vote_id": str(uuid.uuid4()),
+        "user_id": "100000000000000000",
+        "bot_id": "999999999999999999",
+        "voted_at": "2023-03-05T20:29:46.315604-05:00",
+        "rewarded": False,
+        "test": False,
+        "monthly_votes": 1,
+    })
+
+    try:
+        start, cpu_start = time.perf_counter(), time.process_time()
+
+        process = await asyncio.create_subprocess_exec(sys.executable, "-c", LOAD_GENERATOR, str(port),
+                                                       str(requests), str(connections), body)
+        await process.wait()
+
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    finally:
+        await listener.stop()
+
+    print(f"{engine:>8}: {requests / elapsed:8.0f} req/s  {requests / cpu:8.0f} req/s per core "
+          f"({requests} requests over {connections} connections)")
+
+
+async def main(requests: int, connections: int) -> None:
+    for engine in ("tornado", "asyncio"):
+        await measure(engine, requests, connections)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000, int(sys.argv[2]) if len(sys.argv) > 2 else 16))
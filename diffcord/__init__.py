@@ -1,4 +1,104 @@
-from .api import *
-from .client import *
-from .error import *
-from .vote import *
+import importlib
+from typing import TYPE_CHECKING, Any, List
+
+# public name -> submodule, imported on first access so that "import diffcord" stays cheap and httpx or tornado
+# are only loaded once the API client or the webhook listener is used
+_EXPORTS = {
+    "HTTPApi": "api",
+    "VoteBatcher": "batch",
+    "VoteInfoCache": "cache",
+    "SharedMemoryVoteInfoCache": "cache",
+    "CapturedWebhook": "capture",
+    "WebhookCapture": "capture",
+    "ReplayReport": "capture",
+    "load_capture": "capture",
+    "synthesize_capture": "capture",
+    "replay": "capture",
+    "Client": "client",
+    "VoteDeduplicator": "dedup",
+    "DiffcordException": "error",
+    "HTTPException": "error",
+    "RateLimitException": "error",
+    "ServerException": "error",
+    "MissingTokenException": "error",
+    "InvalidTokenException": "error",
+    "CircuitOpenException": "error",
+    "RequestTimeoutException": "error",
+    "VoteHistory": "history",
+    "VoteJournal": "journal",
+    "VoteLeaderboard": "leaderboard",
+    "VoteWebhookListener": "listener",
+    "DEFAULT_BUCKETS": "metrics",
+    "Metric": "metrics",
+    "MetricsCallback": "metrics",
+    "Counter": "metrics",
+    "Histogram": "metrics",
+    "MetricsRegistry": "metrics",
+    "parse_vote": "multiprocess",
+    "read_vote_batch": "multiprocess",
+    "write_vote_statuses": "multiprocess",
+    "VoteBatchForwarder": "multiprocess",
+    "spawn_listener_process": "multiprocess",
+    "run_listener_process": "multiprocess",
+    "StageTiming": "profiling",
+    "StageHook": "profiling",
+    "Profiler": "profiling",
+    "OpenTelemetryEmitter": "profiling",
+    "SlowHandlerReport": "profiling",
+    "SlowHandlerWatchdog": "profiling",
+    "Priority": "ratelimit",
+    "RouteBucket": "ratelimit",
+    "RequestScheduler": "ratelimit",
+    "VoteReminderScheduler": "reminders",
+    "CircuitState": "resilience",
+    "CircuitBreaker": "resilience",
+    "LatencyTracker": "resilience",
+    "SingleFlight": "singleflight",
+    "GuildCountBackend": "stats",
+    "SharedMemoryGuildCountBackend": "stats",
+    "UnixSocketGuildCountBackend": "stats",
+    "StatsReporter": "stats",
+    "UserBotVote": "vote",
+    "UserVoteInformation": "vote",
+    "UserVoteInformationResult": "vote",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from .api import *
+    from .batch import *
+    from .cache import *
+    from .capture import *
+    from .client import *
+    from .dedup import *
+    from .error import *
+    from .history import *
+    from .journal import *
+    from .leaderboard import *
+    from .listener import *
+    from .metrics import *
+    from .multiprocess import *
+    from .profiling import *
+    from .ratelimit import *
+    from .reminders import *
+    from .resilience import *
+    from .singleflight import *
+    from .stats import *
+    from .vote import *
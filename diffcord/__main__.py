@@ -0,0 +1,115 @@
+""" Record vote webhooks and replay them against a listener to load test vote handlers.
+
+Usage:
+    python -m diffcord record --port 8080 --verify-code CODE --output votes.jsonl
+    python -m diffcord replay http://127.0.0.1:8080/ --capture votes.jsonl --speed 10
+    python -m diffcord replay http://127.0.0.1:8080/ --synthesize 100000 --users 5000 --distribution zipf --max-speed
+"""
+import argparse
+import asyncio
+import json
+import signal
+import sys
+from typing import List
+
+from diffcord.capture import WebhookCapture, load_capture, replay, synthesize_capture
+from diffcord.listener import VoteWebhookListener
+
+
+async def record(args: argparse.Namespace) -> int:
+    async def handle_vote(vote):
+        pass
+
+    capture = WebhookCapture(args.output)
+    listener = VoteWebhookListener(args.port, handle_vote, host=args.host, silent=True, verify_code=args.verify_code,
+                                   capture=capture, engine=args.engine)
+    stopped = asyncio.Event()
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGINT, stopped.set)
+    except NotImplementedError:
+        # not supported on Windows, where Ctrl+C raises KeyboardInterrupt instead
+        pass
+
+    await listener.start()
+    print(f"recording webhooks received on {args.host}:{args.port} to {args.output}, press Ctrl+C to stop",
+          file=sys.stderr)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + args.duration if args.duration is not None else None
+
+    try:
+        while not stopped.is_set() and (args.count is None or capture.recorded < args.count):
+            if deadline is not None and loop.time() >= deadline:
+                break
+
+            try:
+                await asyncio.wait_for(stopped.wait(), 0.1)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await listener.stop()
+
+    print(f"recorded {capture.recorded} webhooks", file=sys.stderr)
+    return 0
+
+
+async def replay_command(args: argparse.Namespace) -> int:
+    if args.capture is not None:
+        webhooks = load_capture(args.capture)
+    else:
+        webhooks = synthesize_capture(args.synthesize, rate=args.rate, users=args.users,
+                                      distribution=args.distribution, test_ratio=args.test_ratio,
+                                      verify_code=args.verify_code, seed=args.seed)
+
+    speed = 0.0 if args.max_speed else args.speed
+    report = await replay(args.url, webhooks, speed=speed, concurrency=args.concurrency,
+                          verify_code=args.verify_code if args.capture is not None else None)
+
+    if args.json:
+        print(json.dumps(report.to_dict()))
+    else:
+        print(report.summary())
+
+    return 0 if report.sent and not report.errors else 1
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m diffcord", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    record_parser = commands.add_parser("record", help="record the webhooks received by a listener to a file")
+    record_parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    record_parser.add_argument("--host", default="0.0.0.0", help="host to listen on")
+    record_parser.add_argument("--verify-code", help="verification code of the webhook")
+    record_parser.add_argument("--engine", default="asyncio", choices=("asyncio", "tornado"), help="webhook server")
+    record_parser.add_argument("--output", required=True, help="file to append the webhooks to (JSON lines)")
+    record_parser.add_argument("--count", type=int, help="stop after this many webhooks")
+    record_parser.add_argument("--duration", type=float, help="stop after this many seconds")
+
+    replay_parser = commands.add_parser("replay", help="send recorded or synthesized webhooks to a listener")
+    replay_parser.add_argument("url", help="URL of the listener, e.g. http://127.0.0.1:8080/")
+    source = replay_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--capture", help="file written by the record command")
+    source.add_argument("--synthesize", type=int, metavar="COUNT", help="number of votes to synthesize")
+    replay_parser.add_argument("--rate", type=float, default=100.0, help="synthesized votes per second")
+    replay_parser.add_argument("--users", type=int, default=10000, help="number of synthesized voters")
+    replay_parser.add_argument("--distribution", default="uniform", choices=("uniform", "zipf"),
+                               help="how synthesized votes spread over the voters")
+    replay_parser.add_argument("--test-ratio", type=float, default=0.0, help="share of synthesized test votes")
+    replay_parser.add_argument("--seed", type=int, help="seed of the synthesized votes")
+    replay_parser.add_argument("--verify-code", help="Authorization header to send (overrides a capture's)")
+    speed = replay_parser.add_mutually_exclusive_group()
+    speed.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is real time")
+    speed.add_argument("--max-speed", action="store_true", help="send as fast as the listener answers")
+    replay_parser.add_argument("--concurrency", type=int, default=64, help="connections sending at once")
+    replay_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    args = parser.parse_args(argv)
+    command = record if args.command == "record" else replay_command
+    return asyncio.run(command(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,87 @@
-from typing import Any
+import asyncio
+import time
+from typing import Any, Awaitable, Optional, Tuple
 
 import httpx
 
-from diffcord.error import InvalidTokenException, ServerException, HTTPException, RateLimitException
+from diffcord.error import InvalidTokenException, ServerException, HTTPException, RateLimitException, \
+    CircuitOpenException, RequestTimeoutException
+from diffcord.metrics import MetricsRegistry
+from diffcord.profiling import Profiler
+from diffcord.ratelimit import Priority, RequestScheduler
+from diffcord.resilience import CircuitBreaker, LatencyTracker
+from diffcord.singleflight import SingleFlight
 
 
 class HTTPApi:
 
-    def __init__(self, token: str, base_url: str):
+    def __init__(self, token: str, base_url: str, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0, http2: bool = False, timeout: float = 10.0,
+                 transport: httpx.AsyncBaseTransport = None, scheduler: RequestScheduler = None,
+                 coalesce_requests: bool = True, metrics: MetricsRegistry = None,
+                 circuit_breaker: CircuitBreaker = None, request_deadline: float = None,
+                 hedge_requests: bool = False, hedge_percentile: float = 0.95, profiler: Profiler = None):
         self.token: str = token
         """ API Token """
 
         self.base_url: str = base_url
         """ Base URL of the API in which the requests will be made to """
 
+        self.limits: httpx.Limits = httpx.Limits(max_connections=max_connections,
+                                                 max_keepalive_connections=max_keepalive_connections,
+                                                 keepalive_expiry=keepalive_expiry)
+        """ The connection pool limits of the underlying HTTP client. """
+
+        self.http2: bool = http2
+        """ Whether to negotiate HTTP/2 with the API (requires the ``h2`` package). """
+
+        self.timeout: float = timeout
+        """ The default timeout (in seconds) of each request. """
+
+        self.scheduler: RequestScheduler = RequestScheduler() if scheduler is None else scheduler
+        """ Queues requests per route according to the API rate limits. """
+
+        self.coalesce_requests: bool = coalesce_requests
+        """ Whether concurrent identical GET requests share a single upstream request. """
+
+        self.single_flight: SingleFlight = SingleFlight()
+        """ Tracks the GET requests currently in flight for coalescing. """
+
+        self.metrics: Optional[MetricsRegistry] = metrics
+        """ The registry API request metrics are recorded in, None to not record metrics. """
+
+        if metrics is not None:
+            self.__requests_metric = metrics.counter("api_requests_total", "Diffcord API responses by route and status",
+                                                     ("route", "status"))
+            self.__latency_metric = metrics.histogram("api_request_duration_seconds",
+                                                      "Diffcord API request latency by route", ("route",))
+            self.__rate_limited_metric = metrics.counter("api_rate_limited_total",
+                                                         "Diffcord API 429 responses by route", ("route",))
+
+        self.circuit_breaker: Optional[CircuitBreaker] = circuit_breaker
+        """ Fails requests fast while the API keeps failing, None to always send them. """
+
+        self.request_deadline: Optional[float] = request_deadline
+        """ The default time (in seconds) a request may take including rate limit waits and retries, None for no
+        deadline. """
+
+        self.hedge_requests: bool = hedge_requests
+        """ Whether a second copy of a slow GET request is sent, the first response to arrive is used. """
+
+        self.hedge_percentile: float = hedge_percentile
+        """ The latency percentile of its route after which a GET request is hedged. """
+
+        self.latency: LatencyTracker = LatencyTracker()
+        """ The recent response latencies per route, from which the hedging delay is estimated. """
+
+        self.hedged: int = 0
+        """ The number of hedged requests sent. """
+
+        self.profiler: Optional[Profiler] = profiler
+        """ Times the stages of each request (rate limit wait, HTTP exchange, parsing), None to not time them. """
+
+        self.__transport = transport
+
         self.__headers = {
             "x-api-key": self.token,
             "Authorization": self.token,
@@ -21,42 +89,282 @@ class HTTPApi:
             "User-Agent": f"Diffcord-Python-SDK",
         }
 
-    async def make_request(self, method: str, path: str, **kwargs: Any) -> Any:
+        self.__http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """ The pooled HTTP client shared by every request, created on first use.
+        """
+        if self.__http_client is None or self.__http_client.is_closed:
+            self.__http_client = httpx.AsyncClient(base_url=self.base_url, headers=self.__headers,
+                                                   limits=self.limits, http2=self.http2, timeout=self.timeout,
+                                                   transport=self.__transport)
+
+        return self.__http_client
+
+    async def aclose(self) -> None:
+        """ Close the pooled HTTP client and release its connections.
+        """
+        if self.__http_client is not None:
+            await self.__http_client.aclose()
+            self.__http_client = None
+
+    async def __aenter__(self) -> "HTTPApi":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
+
+    async def make_request(self, method: str, path: str, priority: Priority = Priority.DEFAULT,
+                           deadline: float = None, **kwargs: Any) -> Any:
         """ Make a request to the Diffcord API.
+        Rate limited requests are queued and retried after the Retry-After delay, concurrent identical GET requests
+        are coalesced into one.
         :param: method: The method of the request
         :param: path: The path of the request
+        :param: priority: The priority of the request while it waits on the rate limit
+        :param: deadline: The time (in seconds) the request may take, defaults to request_deadline
         :param: kwargs: The kwargs of the request
         :return: The response from the Diffcord API
         """
-        async with httpx.AsyncClient() as client:
+        deadline = self.request_deadline if deadline is None else deadline
+
+        if self.coalesce_requests and method.upper() == "GET" and set(kwargs) <= {"params"}:
+            params = kwargs.get("params") or {}
+            # callers only share a call made with their own deadline, so that a short deadline cannot fail a caller
+            # which allows the request more time
+            key = (path, tuple(sorted((str(k), str(v)) for k, v in params.items())), deadline)
+            # the shared call gets the deadline too, so that an upstream call slower than it is abandoned (and counted
+            # as one failure by the circuit breaker) even though every caller waits on it shielded
+            call = self.single_flight.do(key, lambda: self.__within(self.__request(method, path, priority, **kwargs),
+                                                                    method, path, deadline))
+        else:
+            call = self.__request(method, path, priority, **kwargs)
+
+        if self.profiler is None:
+            return await self.__within(call, method, path, deadline)
+
+        with self.profiler.stage("api.request", method=method, path=path):
+            return await self.__within(call, method, path, deadline)
+
+    async def make_conditional_request(self, path: str, etag: str = None, priority: Priority = Priority.DEFAULT,
+                                       deadline: float = None) -> Tuple[Any, Optional[str]]:
+        """ Make a GET request to the Diffcord API which is only answered with data if it changed since etag.
+        Like make_request, concurrent identical requests are coalesced into one.
+        :param: path: The path of the request
+        :param: etag: The ETag of the previous response, None to always get the data
+        :param: priority: The priority of the request while it waits on the rate limit
+        :param: deadline: The time (in seconds) the request may take, defaults to request_deadline
+        :return: The response from the Diffcord API (None if it did not change) and its ETag (None if the API does
+            not send one)
+        """
+        deadline = self.request_deadline if deadline is None else deadline
+
+        if self.coalesce_requests:
+            call = self.single_flight.do((path, etag, deadline), lambda: self.__within(
+                self.__conditional_request(path, etag, priority), "GET", path, deadline))
+        else:
+            call = self.__conditional_request(path, etag, priority)
+
+        if self.profiler is None:
+            return await self.__within(call, "GET", path, deadline)
+
+        with self.profiler.stage("api.request", method="GET", path=path):
+            return await self.__within(call, "GET", path, deadline)
+
+    async def __within(self, call: Awaitable[Any], method: str, path: str, deadline: Optional[float]) -> Any:
+        if deadline is None:
+            return await call
+
+        try:
+            return await asyncio.wait_for(call, deadline)
+        except asyncio.TimeoutError:
+            raise RequestTimeoutException(method, path, deadline) from None
+
+    async def __request(self, method: str, path: str, priority: Priority, **kwargs: Any) -> Any:
+        response = await self.__call(method, path, priority, **kwargs)
+        return self.__profiled_parse(response)
+
+    async def __conditional_request(self, path: str, etag: Optional[str],
+                                    priority: Priority) -> Tuple[Any, Optional[str]]:
+        headers = {"If-None-Match": etag} if etag is not None else {}
+        response = await self.__call("GET", path, priority, headers=headers)
+
+        if response.status_code == 304:
+            return None, response.headers.get("ETag", etag)
 
-            response = await client.request(method, self.base_url + path, **kwargs, headers=self.__headers)
+        return self.__profiled_parse(response), response.headers.get("ETag")
 
-            if response.status_code == 204:
-                return None
+    def __profiled_parse(self, response: httpx.Response) -> Any:
+        if self.profiler is None:
+            return self.__parse(response)
 
-            json_data = response.json()
+        with self.profiler.stage("api.parse", status=response.status_code, size=len(response.content)):
+            return self.__parse(response)
 
-            if response.status_code == 401:
-                if json_data["error"]["code"] == "ERR_INVALID_API_KEY":
-                    raise InvalidTokenException(json_data["error"], response)
+    async def __call(self, method: str, path: str, priority: Priority, **kwargs: Any) -> httpx.Response:
+        breaker = self.circuit_breaker
 
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenException(breaker.retry_after)
+
+        try:
+            response = await self.__send(method, path, priority, **kwargs)
+        except httpx.TimeoutException as e:
+            if breaker is not None:
+                breaker.record_failure()
+
+            raise RequestTimeoutException(method, path, self.timeout) from e
+        except httpx.TransportError:
+            if breaker is not None:
+                breaker.record_failure()
+
+            raise
+        except BaseException:
+            # e.g. cancelled by a deadline, recorded as a failure by __send if the request was already sent
+            if breaker is not None:
+                breaker.release()
+
+            raise
+
+        if breaker is not None:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+        return response
+
+    @staticmethod
+    def __parse(response: httpx.Response) -> Any:
+        if response.status_code == 204:
+            return None
+
+        json_data = response.json()
+
+        if response.status_code == 401:
+            if json_data["error"]["code"] == "ERR_INVALID_API_KEY":
+                raise InvalidTokenException(json_data["error"], response)
+
+            raise HTTPException(response.status_code, json_data["error"]["message"], json_data["error"]["code"])
+
+        if response.status_code == 500:
+            raise ServerException(json_data["error"], response)
+
+        if response.status_code == 429:
+            raise RateLimitException(json_data["error"], response)
+
+        if not str(response.status_code).startswith("2"):
+
+            try:
                 raise HTTPException(response.status_code, json_data["error"]["message"], json_data["error"]["code"])
+            except Exception:
+                raise HTTPException(response.status_code, "ERROR", "ERR_CODE")
+
+        if json_data is None:
+            return
+
+        return json_data["data"]
+
+    async def __send(self, method: str, path: str, priority: Priority, **kwargs: Any) -> httpx.Response:
+        route = self.scheduler.route_key(method, path)
+        hedge = self.hedge_requests and method.upper() == "GET"
+        attempt = 0
+
+        while True:
+            if self.profiler is not None:
+                with self.profiler.stage("api.rate_limit_wait", route=route, attempt=attempt):
+                    await self.scheduler.acquire(route, priority)
+            else:
+                await self.scheduler.acquire(route, priority)
+
+            started = self.profiler.start() if self.profiler is not None else None
+
+            try:
+                start = time.perf_counter()
+
+                if hedge:
+                    response = await self.__hedged_request(route, method, path, **kwargs)
+                else:
+                    response = await self.http_client.request(method, path, **kwargs)
+
+                retry_after = self.scheduler.update(route, response, attempt)
+            except asyncio.CancelledError:
+                # abandoned while the API was answering (e.g. past a deadline), unlike time spent waiting on the rate
+                # limit this counts against the API, once per request sent
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+
+                raise
+            finally:
+                self.scheduler.release(route)
+
+            duration = time.perf_counter() - start
+
+            if self.profiler is not None:
+                self.profiler.record("api.http", started, route=route, status=response.status_code, attempt=attempt)
+
+            if hedge:
+                self.latency.record(route, duration)
+
+            if self.metrics is not None:
+                self.__record(route, response.status_code, duration)
+
+            if retry_after is None or not self.scheduler.should_retry(retry_after, attempt):
+                return response
+
+            attempt += 1
+
+    async def __hedged_request(self, route: str, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        delay = self.latency.percentile(route, self.hedge_percentile)
+        primary = asyncio.ensure_future(self.http_client.request(method, path, **kwargs))
+
+        if delay is None:
+            return await primary
+
+        tasks = {primary}
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+
+            # the hedge is a request of its own, it is skipped instead of queued when the rate limit or the concurrency
+            # limit has no slot left for it
+            if done or not self.scheduler.try_acquire(route):
+                return await primary
+
+            hedge = asyncio.ensure_future(self.http_client.request(method, path, **kwargs))
+            hedge.add_done_callback(lambda done: self.__hedge_done(route, done))
+            tasks.add(hedge)
+            self.hedged += 1
+            pending = tasks
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
 
-            if response.status_code == 500:
-                raise ServerException(json_data["error"], response)
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
 
-            if response.status_code == 429:
-                raise RateLimitException(json_data["error"], response)
+                # the exception of the copy which lost (or of both if both failed) is not raised, retrieve it so that
+                # asyncio does not log it
+                task.add_done_callback(lambda done: done.cancelled() or done.exception())
 
-            if not str(response.status_code).startswith("2"):
+    def __hedge_done(self, route: str, hedge: asyncio.Future) -> None:
+        # also learn the rate limit from a hedge that lost, its slot was consumed all the same
+        if not hedge.cancelled() and hedge.exception() is None:
+            self.scheduler.update(route, hedge.result())
 
-                try:
-                    raise HTTPException(response.status_code, json_data["error"]["message"], json_data["error"]["code"])
-                except Exception:
-                    raise HTTPException(response.status_code, "ERROR", "ERR_CODE")
+        self.scheduler.release(route)
 
-            if json_data is None:
-                return
+    def __record(self, route: str, status: int, duration: float) -> None:
+        self.__requests_metric.inc(route=route, status=status)
+        self.__latency_metric.observe(duration, route=route)
 
-            return json_data["data"]
+        if status == 429:
+            self.__rate_limited_metric.inc(route=route)
@@ -0,0 +1,93 @@
+import asyncio
+import datetime
+from typing import Awaitable, Callable, List, Optional, Set
+
+from diffcord.vote import UserBotVote
+
+
+class VoteBatcher:
+    """ Collects votes into micro-batches which are handled together.
+
+    A batch is handled once it holds max_size votes or its oldest vote waited max_delay, whichever comes first. Every
+    vote of a batch gets the outcome of that batch.
+    """
+
+    def __init__(self, handle_votes: Callable[[List[UserBotVote]], Awaitable[None]], max_size: int = 100,
+                 max_delay: datetime.timedelta = datetime.timedelta(milliseconds=50)):
+        self.handle_votes: Callable[[List[UserBotVote]], Awaitable[None]] = handle_votes
+        """ The function that will be called with each batch of votes (must be async). """
+
+        self.max_size: int = max_size
+        """ The maximum number of votes per batch. """
+
+        self.max_delay: float = max_delay.total_seconds()
+        """ The longest time (in seconds) a vote waits for its batch to fill up. """
+
+        self.batches: int = 0
+        """ The number of batches handled so far. """
+
+        self.__batch: List[UserBotVote] = []
+        self.__done: Optional[asyncio.Future] = None
+        self.__timer: Optional[asyncio.TimerHandle] = None
+        # the batches being handled, referenced so that their tasks are not garbage collected
+        self.__handling: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """ The number of votes waiting for their batch to be handled.
+        """
+        return len(self.__batch)
+
+    async def submit(self, vote: UserBotVote) -> None:
+        """ Add a vote to the current batch and wait until the batch has been handled.
+        :param: vote: The vote
+        :raises: Exception: Whatever handle_votes raised for the batch
+        """
+        loop = asyncio.get_running_loop()
+
+        if self.__done is None:
+            self.__done = loop.create_future()
+            self.__timer = loop.call_later(self.max_delay, self.__flush)
+
+        done = self.__done
+        self.__batch.append(vote)
+
+        if len(self.__batch) >= self.max_size:
+            self.__flush()
+
+        # a cancelled submitter must not cancel the outcome of the whole batch
+        await asyncio.shield(done)
+
+    def __flush(self) -> None:
+        if self.__done is None:
+            return
+
+        batch, self.__batch = self.__batch, []
+        done, self.__done = self.__done, None
+        self.__timer.cancel()
+
+        task = asyncio.ensure_future(self.__handle(batch, done))
+        self.__handling.add(task)
+        task.add_done_callback(self.__handling.discard)
+
+    async def __handle(self, batch: List[UserBotVote], done: asyncio.Future) -> None:
+        try:
+            await self.handle_votes(batch)
+        except Exception as e:
+            done.set_exception(e)
+            # every submitter may have been cancelled meanwhile
+            done.exception()
+        else:
+            done.set_result(None)
+        finally:
+            self.batches += 1
+
+            # e.g. handle_votes was cancelled, the submitters must not wait forever
+            if not done.done():
+                done.cancel()
+
+    def __repr__(self):
+        return f"<VoteBatcher max_size={self.max_size} max_delay={self.max_delay} pending={len(self.__batch)}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,430 @@
+import datetime
+import math
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from diffcord.vote import UserBotVote, UserVoteInformation
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class VoteInfoCache:
+    """ A bounded LRU cache of user vote information.
+
+    An entry lives until the user can vote again (capped by max_ttl), users who can already vote are only cached for
+    eligible_ttl since their information changes as soon as they vote. Entries are evicted when a vote webhook for the
+    user arrives, see VoteWebhookListener.add_vote_observer.
+
+    Expired entries are kept for another stale_ttl, so that they can still be served while the API is unavailable,
+    see get(allow_stale=True).
+    """
+
+    def __init__(self, max_size: int = 10000, max_ttl: datetime.timedelta = datetime.timedelta(hours=12),
+                 eligible_ttl: datetime.timedelta = datetime.timedelta(minutes=1),
+                 stale_ttl: datetime.timedelta = datetime.timedelta(0)):
+        self.max_size: int = max_size
+        """ The maximum number of users kept in the cache. """
+
+        self.max_ttl: float = max_ttl.total_seconds()
+        """ The longest time (in seconds) an entry is kept. """
+
+        self.eligible_ttl: float = eligible_ttl.total_seconds()
+        """ The time (in seconds) an entry is kept for a user who can currently vote. """
+
+        self.stale_ttl: float = stale_ttl.total_seconds()
+        """ The time (in seconds) an expired entry is kept to be served when the API is unavailable. """
+
+        self.hits: int = 0
+        """ The number of lookups answered from the cache. """
+
+        self.misses: int = 0
+        """ The number of lookups not found in the cache (or expired). """
+
+        self.stale_hits: int = 0
+        """ The number of lookups answered with an expired entry. """
+
+        self.evictions: int = 0
+        """ The number of entries dropped because they expired or the cache was full. """
+
+        self.invalidations: int = 0
+        """ The number of entries dropped because the user voted. """
+
+        # user id -> (vote info payload, fetched at, expires at)
+        self.__entries: "OrderedDict[int, Tuple[dict, float, float]]" = OrderedDict()
+
+    @property
+    def hit_ratio(self) -> float:
+        """ The share of lookups answered from the cache.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, user_id: Union[str, int], allow_stale: bool = False) -> Optional[UserVoteInformation]:
+        """ Get the cached vote information of a user.
+        :param: user_id: The id of the user
+        :param: allow_stale: Whether an expired entry still kept for stale_ttl may be returned
+        :return: A UserVoteInformation adjusted to the current time, or None if the user is not cached
+        """
+        key = int(user_id)
+        entry = self.__entries.get(key)
+        now = time.monotonic()
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        vote_info, fetched_at, expires_at = entry
+
+        if expires_at <= now:
+            if expires_at + self.stale_ttl > now:
+                if allow_stale:
+                    self.__entries.move_to_end(key)
+                    self.stale_hits += 1
+                    return self.__build(vote_info, now - fetched_at)
+
+                self.misses += 1
+                return None
+
+            del self.__entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return None
+
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return self.__build(vote_info, now - fetched_at)
+
+    def put(self, user_id: Union[str, int], vote_info: dict) -> None:
+        """ Cache the vote information of a user.
+        :param: user_id: The id of the user
+        :param: vote_info: The vote information payload returned by the API
+        """
+        key = int(user_id)
+        now = time.monotonic()
+        until_next_vote = vote_info.get("until_next_vote") or 0
+        ttl = min(until_next_vote, self.max_ttl) if until_next_vote > 0 else self.eligible_ttl
+
+        if ttl <= 0:
+            return
+
+        self.__entries[key] = (vote_info, now, now + ttl)
+        self.__entries.move_to_end(key)
+
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: Union[str, int]) -> bool:
+        """ Drop the cached vote information of a user.
+        :param: user_id: The id of the user
+        :return: Whether the user was cached
+        """
+        if self.__entries.pop(int(user_id), None) is None:
+            return False
+
+        self.invalidations += 1
+        return True
+
+    def observe_vote(self, vote: UserBotVote) -> None:
+        """ Drop the cached vote information of a user who just voted.
+        :param: vote: The incoming vote
+        """
+        self.invalidate(vote.user_id)
+
+    def clear(self) -> None:
+        """ Drop every cached entry.
+        """
+        self.__entries.clear()
+
+    @staticmethod
+    def __build(vote_info: dict, elapsed: float) -> UserVoteInformation:
+        since_last_vote = vote_info.get("since_last_vote")
+
+        return UserVoteInformation(
+            user_id=vote_info["user_id"],
+            bot_id=vote_info["bot_id"],
+            monthly_votes=vote_info["monthly_votes"],
+            since_last_vote=since_last_vote + elapsed if since_last_vote is not None else None,
+            until_next_vote=max((vote_info["until_next_vote"] or 0) - elapsed, 0),
+        )
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, user_id: Union[str, int]):
+        return int(user_id) in self.__entries
+
+    def __repr__(self):
+        return f"<VoteInfoCache size={len(self.__entries)} hits={self.hits} misses={self.misses} evictions={self.evictions}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class _Record(NamedTuple):
+    """ A record of SharedMemoryVoteInfoCache, in the order of its fields in the file.
+    """
+
+    version: int
+    state: int
+    monthly_votes: int
+    user_id: int
+    bot_id: int
+    since_last_vote: float
+    until_next_vote: float
+    fetched_at: float
+    expires_at: float
+
+
+class SharedMemoryVoteInfoCache(VoteInfoCache):
+    """ A VoteInfoCache in a memory-mapped file shared by every process on the host.
+
+    The file holds a fixed size open addressing hash table of 64 byte records keyed by user id. Lookups never lock,
+    they retry while a record is being written (every record carries a version which is odd during writes), writers
+    take a lock on the file. An entry cached by one process is served to every other, and invalidating it in the
+    process running the VoteWebhookListener removes it for all of them.
+
+    Only the user id, bot id, vote count and vote times are kept. When the records a user id can be stored in
+    (max_probes of them) are taken, the one expiring first is replaced. The counters (hits, misses, ...) are counted
+    per process.
+    """
+
+    # record: version (odd while being written), state, monthly votes, user id, bot id, since last vote (NaN if never
+    # voted), until next vote, unix time the information was fetched at, unix time it expires at
+    __RECORD = struct.Struct("<QBxxxiqqdddd")
+    # magic, format version, capacity
+    __HEADER = struct.Struct("<4sHxxI")
+    __MAGIC = b"DCVC"
+    __VERSION = 1
+
+    __EMPTY = 0
+    __USED = 1
+    __DELETED = 2
+
+    def __init__(self, path: str, capacity: int = 65536, max_ttl: datetime.timedelta = datetime.timedelta(hours=12),
+                 eligible_ttl: datetime.timedelta = datetime.timedelta(minutes=1),
+                 stale_ttl: datetime.timedelta = datetime.timedelta(0), max_probes: int = 16):
+        super().__init__(capacity, max_ttl, eligible_ttl, stale_ttl)
+
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryVoteInfoCache is not supported on this platform")
+
+        if capacity < 1 or capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+
+        self.path: str = path
+        """ The shared file. """
+
+        self.capacity: int = capacity
+        """ The number of records in the file, every process must use the same. """
+
+        self.max_probes: int = min(max_probes, capacity)
+        """ The number of records a user id can be stored in. """
+
+        self.__shift: int = 64 - capacity.bit_length() + 1
+        self.__file = open(path, "a+b")
+        self.__map: Optional[mmap.mmap] = None
+        size = self.__HEADER.size + self.__RECORD.size * capacity
+
+        with self.__locked():
+            if os.fstat(self.__file.fileno()).st_size == 0:
+                # sparse, pages are only allocated once records are written to them
+                self.__file.truncate(size)
+                self.__map = mmap.mmap(self.__file.fileno(), size)
+                self.__HEADER.pack_into(self.__map, 0, self.__MAGIC, self.__VERSION, capacity)
+            elif os.fstat(self.__file.fileno()).st_size == size:
+                self.__map = mmap.mmap(self.__file.fileno(), size)
+
+        if self.__map is None or self.__HEADER.unpack_from(self.__map) != (self.__MAGIC, self.__VERSION, capacity):
+            self.close()
+            raise ValueError(f"{path} is not a vote info cache with a capacity of {capacity}")
+
+    def get(self, user_id: Union[str, int], allow_stale: bool = False) -> Optional[UserVoteInformation]:
+        key = int(user_id)
+        record = self.__find(key)
+        now = time.time()
+
+        if record is None:
+            self.misses += 1
+            return None
+
+        if record.expires_at <= now:
+            if allow_stale and record.expires_at + self.stale_ttl > now:
+                self.stale_hits += 1
+            else:
+                self.misses += 1
+                return None
+        else:
+            self.hits += 1
+
+        elapsed = now - record.fetched_at
+
+        return UserVoteInformation(
+            user_id=str(key),
+            bot_id=str(record.bot_id),
+            monthly_votes=record.monthly_votes,
+            since_last_vote=record.since_last_vote + elapsed if not math.isnan(record.since_last_vote) else None,
+            until_next_vote=max(record.until_next_vote - elapsed, 0),
+        )
+
+    def put(self, user_id: Union[str, int], vote_info: dict) -> None:
+        key = int(user_id)
+        now = time.time()
+        until_next_vote = vote_info.get("until_next_vote") or 0
+        ttl = min(until_next_vote, self.max_ttl) if until_next_vote > 0 else self.eligible_ttl
+
+        if ttl <= 0:
+            return
+
+        since_last_vote = vote_info.get("since_last_vote")
+
+        with self.__locked():
+            index, evicted = self.__slot_for(key, now)
+            self.__write(index, self.__USED, vote_info["monthly_votes"], key, int(vote_info["bot_id"]),
+                         since_last_vote if since_last_vote is not None else math.nan, until_next_vote, now,
+                         now + ttl)
+
+        if evicted:
+            self.evictions += 1
+
+    def invalidate(self, user_id: Union[str, int]) -> bool:
+        key = int(user_id)
+
+        with self.__locked():
+            for index in self.__probe(key):
+                record = self.__unpack(index)
+
+                if record.state == self.__EMPTY:
+                    return False
+
+                if record.state == self.__USED and record.user_id == key:
+                    # a tombstone, so that lookups keep probing past it
+                    self.__write(index, self.__DELETED, 0, 0, 0, math.nan, 0.0, 0.0, 0.0)
+                    self.invalidations += 1
+                    return True
+
+        return False
+
+    def clear(self) -> None:
+        with self.__locked():
+            for index in range(self.capacity):
+                if self.__unpack(index).state != self.__EMPTY:
+                    self.__write(index, self.__EMPTY, 0, 0, 0, math.nan, 0.0, 0.0, 0.0)
+
+    def close(self) -> None:
+        """ Unmap the shared file, the entries stay available to the other processes.
+        """
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+
+        self.__file.close()
+
+    def __offset(self, index: int) -> int:
+        return self.__HEADER.size + index * self.__RECORD.size
+
+    def __probe(self, key: int) -> List[int]:
+        # fibonacci hashing, snowflakes differ mostly in their low bits
+        start = ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self.__shift
+        return [(start + step) & (self.capacity - 1) for step in range(self.max_probes)]
+
+    def __unpack(self, index: int) -> _Record:
+        return _Record._make(self.__RECORD.unpack_from(self.__map, self.__offset(index)))
+
+    def __read(self, index: int) -> Optional[_Record]:
+        for _ in range(1000):
+            record = self.__unpack(index)
+
+            if record.version % 2 == 0 and self.__unpack(index).version == record.version:
+                return record
+
+        # the writer died during the write, the next put of the user id repairs the record
+        return None
+
+    def __find(self, key: int) -> Optional[_Record]:
+        for index in self.__probe(key):
+            record = self.__read(index)
+
+            if record is None:
+                continue
+
+            if record.state == self.__EMPTY:
+                return None
+
+            if record.state == self.__USED and record.user_id == key:
+                return record
+
+        return None
+
+    def __slot_for(self, key: int, now: float) -> Tuple[int, bool]:
+        free = None
+        free_expired = False
+        oldest = None
+        oldest_expires_at = math.inf
+
+        for index in self.__probe(key):
+            record = self.__unpack(index)
+
+            if record.state == self.__USED and record.user_id == key:
+                return index, False
+
+            if record.state == self.__EMPTY:
+                return (free, free_expired) if free is not None else (index, False)
+
+            if free is None and (record.state == self.__DELETED or record.expires_at + self.stale_ttl <= now):
+                free, free_expired = index, record.state == self.__USED
+            elif record.state == self.__USED and record.expires_at < oldest_expires_at:
+                oldest, oldest_expires_at = index, record.expires_at
+
+        return (free, free_expired) if free is not None else (oldest, True)
+
+    def __write(self, index: int, state: int, monthly_votes: int, user_id: int, bot_id: int, since_last_vote: float,
+                until_next_vote: float, fetched_at: float, expires_at: float) -> None:
+        offset = self.__offset(index)
+        version = struct.unpack_from("<Q", self.__map, offset)[0]
+        # odd if a writer died during its write
+        version += 1 if version % 2 == 0 else 2
+
+        # readers retry while the version is odd or changed during their read
+        struct.pack_into("<Q", self.__map, offset, version)
+        self.__RECORD.pack_into(self.__map, offset, version, state, monthly_votes, user_id, bot_id, since_last_vote,
+                                until_next_vote, fetched_at, expires_at)
+        struct.pack_into("<Q", self.__map, offset, version + 1)
+
+    @contextmanager
+    def __locked(self) -> Iterator[None]:
+        fcntl.flock(self.__file.fileno(), fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+
+    def __len__(self):
+        now = time.time()
+        size = 0
+
+        for index in range(self.capacity):
+            record = self.__read(index)
+
+            if record is not None and record.state == self.__USED and record.expires_at + self.stale_ttl > now:
+                size += 1
+
+        return size
+
+    def __contains__(self, user_id: Union[str, int]):
+        record = self.__find(int(user_id))
+        return record is not None and record.expires_at + self.stale_ttl > time.time()
+
+    def __repr__(self):
+        return f"<SharedMemoryVoteInfoCache path={self.path} capacity={self.capacity} hits={self.hits} " \
+               f"misses={self.misses} evictions={self.evictions}>"
+
@@ -0,0 +1,326 @@
+import asyncio
+import datetime
+import itertools
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, TextIO
+from urllib.parse import urlsplit
+
+
+class CapturedWebhook(NamedTuple):
+    """ A raw webhook request, as recorded by WebhookCapture.
+    """
+
+    offset: float
+    """ The time (in seconds) since the first request of the capture. """
+
+    authorization: Optional[str]
+    """ The Authorization header of the request. """
+
+    body: bytes
+    """ The body of the request. """
+
+
+class WebhookCapture:
+    """ Records the raw webhook requests a VoteWebhookListener receives to a file, to replay them later.
+
+    Attach it with VoteWebhookListener(capture=...). Each request is written as one JSON line, valid or not, before the
+    listener validates it.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        """ The file the requests are written to. """
+
+        self.recorded: int = 0
+        """ The number of requests recorded. """
+
+        self.__file: Optional[TextIO] = None
+        self.__started_at: Optional[float] = None
+
+    def record(self, authorization: Optional[str], body: bytes) -> None:
+        """ Record a webhook request.
+        :param: authorization: The Authorization header of the request
+        :param: body: The body of the request
+        """
+        now = time.monotonic()
+
+        if self.__started_at is None:
+            self.__started_at = now
+
+        if self.__file is None:
+            self.__file = open(self.path, "a", encoding="utf-8")
+
+        # surrogateescape keeps bodies which are not UTF-8 byte for byte
+        self.__file.write(json.dumps({"offset": round(now - self.__started_at, 6), "authorization": authorization,
+                                      "body": body.decode("utf-8", "surrogateescape")}) + "\n")
+        self.recorded += 1
+
+    def close(self) -> None:
+        """ Write the recorded requests to disk and close the file, it is opened again by the next record.
+        """
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __repr__(self):
+        return f"<WebhookCapture path={self.path} recorded={self.recorded}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+def load_capture(path: str) -> List[CapturedWebhook]:
+    """ Load the requests recorded by a WebhookCapture.
+    :param: path: The capture file
+    :return: The requests, in the order they were received
+    """
+    webhooks = []
+
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+
+            data = json.loads(line)
+            webhooks.append(CapturedWebhook(data["offset"], data["authorization"],
+                                            data["body"].encode("utf-8", "surrogateescape")))
+
+    return webhooks
+
+
+def synthesize_capture(count: int, rate: float = 100.0, users: int = 10000, distribution: str = "uniform",
+                       test_ratio: float = 0.0, verify_code: str = None, bot_id: str = "1000000000000000000",
+                       seed: int = None) -> List[CapturedWebhook]:
+    """ Build a capture of votes, like the Diffcord API would send them.
+    :param: count: The number of votes
+    :param: rate: The average number of votes per second, the votes arrive as a Poisson process
+    :param: users: The number of distinct voting users
+    :param: distribution: How votes spread over the users, "uniform" or "zipf" (a few users vote most often)
+    :param: test_ratio: The share of test votes
+    :param: verify_code: The Authorization header of the requests
+    :param: bot_id: The id of the voted bot
+    :param: seed: The seed of the random generator, for reproducible captures
+    :return: The requests
+    """
+    if distribution not in ("uniform", "zipf"):
+        raise ValueError(f"unknown distribution {distribution!r}, expected 'uniform' or 'zipf'")
+
+    generator = random.Random(seed)
+    user_ids = [str(100000000000000000 + index) for index in range(users)]
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, users + 1))) if distribution == "zipf" else None
+    monthly_votes: Dict[str, int] = {}
+    voted_at = datetime.datetime.now(datetime.timezone.utc)
+    offset = 0.0
+    webhooks = []
+
+    for _ in range(count):
+        user_id = generator.choices(user_ids, cum_weights=weights)[0]
+        test = generator.random() < test_ratio
+
+        if not test:
+            monthly_votes[user_id] = monthly_votes.get(user_id, 0) + 1
+
+        body = json.dumps({
+            "vote_id": str(uuid.UUID(int=generator.getrandbits(128), version=4)),
+            "user_id": user_id,
+            "bot_id": bot_id,
+            "voted_at": (voted_at + datetime.timedelta(seconds=offset)).isoformat(),
+            "rewarded": False,
+            "test": test,
+            "monthly_votes": monthly_votes.get(user_id, 0),
+        }).encode()
+
+        webhooks.append(CapturedWebhook(offset, verify_code, body))
+        offset += generator.expovariate(rate)
+
+    return webhooks
+
+
+class ReplayReport:
+    """ The outcome of replaying webhooks against a listener.
+    """
+
+    def __init__(self, elapsed: float, statuses: Counter, errors: int, latencies: List[float]):
+        self.elapsed: float = elapsed
+        """ The time (in seconds) the replay took. """
+
+        self.statuses: Counter = statuses
+        """ The number of responses per status code. """
+
+        self.errors: int = errors
+        """ The number of requests which got no response (e.g. the connection was refused). """
+
+        self.latencies: List[float] = sorted(latencies)
+        """ The response times (in seconds) of the answered requests, sorted. """
+
+    @property
+    def sent(self) -> int:
+        """ The number of requests sent.
+        """
+        return sum(self.statuses.values()) + self.errors
+
+    @property
+    def throughput(self) -> float:
+        """ The number of requests answered per second.
+        """
+        return sum(self.statuses.values()) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """ A response time percentile.
+        :param: fraction: The percentile, e.g. 0.99
+        :return: The response time (in seconds), None if no request was answered
+        """
+        if not self.latencies:
+            return None
+
+        return self.latencies[min(int(len(self.latencies) * fraction), len(self.latencies) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ The report as a JSON serializable dict.
+        """
+        return {
+            "sent": self.sent,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "errors": self.errors,
+            "latency": {name: self.percentile(fraction)
+                        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+        }
+
+    def summary(self) -> str:
+        """ The report as human readable lines.
+        """
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(self.statuses.items()))
+        lines = [f"sent {self.sent} webhooks in {self.elapsed:.2f}s, {self.throughput:.0f} responses/s",
+                 f"status {statuses or '-'}, errors: {self.errors}"]
+
+        if self.latencies:
+            lines.append("latency " + " ".join(f"{name} {value * 1000:.2f}ms"
+                                               for name, value in self.to_dict()["latency"].items()))
+
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"<ReplayReport sent={self.sent} throughput={self.throughput:.0f} errors={self.errors}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class _Connection:
+    """ A minimal keep-alive HTTP/1.1 client connection, cheaper per request than a full HTTP client.
+    """
+
+    def __init__(self, host: str, port: int, ssl: bool):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.__reader: Optional[asyncio.StreamReader] = None
+        self.__writer: Optional[asyncio.StreamWriter] = None
+
+    async def post(self, request_head: bytes, authorization: Optional[str], body: bytes) -> int:
+        if self.__writer is None:
+            self.__reader, self.__writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+
+        head = request_head + b"Content-Length: %d\r\n" % len(body)
+
+        if authorization is not None:
+            head += b"Authorization: " + authorization.encode("latin-1") + b"\r\n"
+
+        try:
+            self.__writer.write(head + b"\r\n" + body)
+            response_head = await self.__reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.close()
+            raise
+
+        status_line, *header_lines = response_head.decode("latin-1").split("\r\n")
+        headers = dict(line.lower().split(": ", 1) for line in header_lines if ": " in line)
+
+        await self.__reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection") == "close":
+            self.close()
+
+        return int(status_line.split(" ", 2)[1])
+
+    def close(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__reader = self.__writer = None
+
+
+async def replay(url: str, webhooks: Iterable[CapturedWebhook], speed: float = 1.0, concurrency: int = 64,
+                 verify_code: str = None) -> ReplayReport:
+    """ Send captured webhooks to a listener and measure how it answers.
+    :param: url: The URL of the listener
+    :param: webhooks: The requests to send, e.g. from load_capture or synthesize_capture
+    :param: speed: How much faster than recorded the requests are sent (1 is real time), 0 for as fast as possible
+    :param: concurrency: The number of connections sending requests at once
+    :param: verify_code: The Authorization header to send instead of the recorded ones
+    :return: The report of the replay
+    """
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    request_head = (f"POST {parts.path or '/'}{'?' + parts.query if parts.query else ''} HTTP/1.1\r\n"
+                    f"Host: {parts.netloc}\r\nContent-Type: application/json\r\n").encode("latin-1")
+    port = parts.port or (443 if secure else 80)
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    statuses: Counter = Counter()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        connection = _Connection(parts.hostname, port, secure)
+
+        try:
+            while True:
+                webhook = await queue.get()
+
+                if webhook is None:
+                    break
+
+                authorization = webhook.authorization if verify_code is None else verify_code
+                start = time.perf_counter()
+
+                try:
+                    status = await connection.post(request_head, authorization, webhook.body)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    continue
+
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+        finally:
+            connection.close()
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(concurrency, 1))]
+    start = time.perf_counter()
+
+    try:
+        for webhook in webhooks:
+            if speed > 0:
+                delay = start + webhook.offset / speed - time.perf_counter()
+
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await queue.put(webhook)
+
+        for _ in workers:
+            await queue.put(None)
+
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+
+    return ReplayReport(time.perf_counter() - start, statuses, errors, latencies)
+
@@ -1,103 +1,19 @@
-import json
 from asyncio import Task
 from typing import Union
 import asyncio
 import datetime
-from typing import Any, Callable, Awaitable
+import time
+from typing import Any, Callable, Awaitable, AsyncIterator, Iterable, Optional
 
 from diffcord import InvalidTokenException
 from diffcord.api import HTTPApi
-from diffcord.vote import UserVoteInformation, UserBotVote
-
-import tornado.ioloop
-import tornado.web
-from tornado.httpserver import HTTPServer
-import logging
-
-
-class VoteWebhookListener:
-    """ Handles incoming POST requests from Diffcord.
-    """
-
-    def __init__(self, port: int, handle_vote: Callable[[UserBotVote], Awaitable[None]], host: str = None,
-                 silent: bool = False, verify_code: str = None, listener_sleep: int = 60,
-                 log_level: int = logging.CRITICAL):
-        self.port = port
-        """ The port of the webhook listener. """
-
-        self.handle_vote = handle_vote
-        """ The function that will be called when a vote is received. (must be async with one parameter which is of type UserBotVote) """
-
-        self.silent = silent
-        """ Whether to print various httpserver messages to the console. """
-
-        self.verify_code = verify_code
-        """ The verification code for the webhook listener. """
-
-        self.listener_sleep = listener_sleep
-        """ The amount of time to sleep between each stat update. """
-
-        self.log_level = log_level
-        """ The log level of the httpserver. """
-
-        self.host = host
-        """ The host of the webhook listener. """
-
-        if host is None:
-            self.host = "0.0.0.0"
-
-        self.__app = tornado.web.Application([(r"/", self.__handler_class(self.handle_vote))], debug=False)
-        self.__server = HTTPServer(self.__app)
-        self.__server.bind(self.port, self.host)
-
-    def __handler_class(self, handler):
-
-        verify_code = self.verify_code
-        silent = self.silent
-
-        class Handler(tornado.web.RequestHandler):
-
-            VERIFY_CODE = verify_code
-            SILENT = silent
-
-            async def post(self):
-                if self.VERIFY_CODE is not None and self.request.headers.get("Authorization") != self.VERIFY_CODE:
-                    self.set_status(403)
-                    return
-
-                # payload as dict
-                payload = json.loads(self.request.body.decode("utf-8"))
-
-                vote = UserBotVote(**payload)
-
-                try:
-                    await handler(vote)
-                except Exception as e:
-                    if not self.SILENT:
-                        print("Error handling vote:", e)
-
-                    self.set_status(500)
-                    return
-
-                self.set_status(200)
-
-        return Handler
-
-    async def start(self) -> None:
-        """ Start the webhook listener.
-        """
-        logging.getLogger("tornado.access").setLevel(self.log_level)
-
-        self.__server.start()
-
-        if not self.silent:
-            print("Webhook listener started on port", self.port)
-
-    def __repr__(self):
-        return f"<WebhookListener port={self.port}>"
-
-    def __str__(self):
-        return self.__repr__()
+from diffcord.cache import VoteInfoCache
+from diffcord.error import CircuitOpenException, RequestTimeoutException, ServerException
+from diffcord.listener import VoteWebhookListener
+from diffcord.ratelimit import Priority
+from diffcord.reminders import VoteReminderScheduler
+from diffcord.stats import GuildCountBackend, StatsReporter
+from diffcord.vote import UserBotVote, UserVoteInformation, UserVoteInformationResult
 
 
 class Client(HTTPApi):
@@ -110,8 +26,18 @@ class Client(HTTPApi):
                  send_stats_failure: Callable[[Exception], Awaitable[None]] = None,
                  base_url: str = None,
                  send_stats_interval: datetime.timedelta = None,
+                 vote_info_cache: VoteInfoCache = None,
+                 stats_debounce: datetime.timedelta = datetime.timedelta(seconds=30),
+                 stats_max_staleness: datetime.timedelta = datetime.timedelta(minutes=5),
+                 stats_jitter: float = 0.1,
+                 stats_aggregator: GuildCountBackend = None,
+                 vote_reminders: VoteReminderScheduler = None,
+                 bot_votes_soft_ttl: datetime.timedelta = None,
+                 bot_votes_refresh_failure: Callable[[Exception], Awaitable[None]] = None,
+                 silent: bool = False,
+                 **http_options: Any,
                  ) -> None:
-        super().__init__(token, "https://www.diffcord.com/api" if base_url is None else base_url)
+        super().__init__(token, "https://www.diffcord.com/api" if base_url is None else base_url, **http_options)
 
         self.bot: Any = bot
         """ The bot object. """
@@ -134,26 +60,203 @@ class Client(HTTPApi):
         self.send_stats_interval: datetime.timedelta = self.__SEND_STATS_SLEEP_DURATION if send_stats_interval is None else send_stats_interval
         """ The interval between each stat update request. """
 
-    async def get_user_vote_info(self, user_id: Union[str, int]) -> UserVoteInformation:
+        self.vote_info_cache: VoteInfoCache = vote_info_cache
+        """ The optional cache in front of get_user_vote_info, invalidated by the vote listener. """
+
+        self.vote_reminders: VoteReminderScheduler = vote_reminders
+        """ The optional scheduler reminding users when they can vote again, fed by votes and vote lookups. """
+
+        self.bot_votes_soft_ttl: Optional[float] = bot_votes_soft_ttl.total_seconds() \
+            if bot_votes_soft_ttl is not None else None
+        """ The time (in seconds) after which bot_votes_this_month refreshes its value in the background, None to
+        request it on every call. """
+
+        self.bot_votes_refresh_failure: Callable[[Exception], Awaitable[None]] = bot_votes_refresh_failure
+        """ A function to call when refreshing bot_votes_this_month in the background fails (must be async). """
+
+        self.silent: bool = silent
+        """ Whether to not print errors of background tasks without a failure callback to the console. """
+
+        self.stats_reporter: StatsReporter = StatsReporter(
+            self.__update_bot_stats, lambda: len(self.bot.guilds), poll_interval=self.send_stats_interval,
+            debounce=stats_debounce, max_staleness=stats_max_staleness, jitter=stats_jitter,
+            on_success=send_stats_success, on_failure=send_stats_failure, aggregator=stats_aggregator,
+            metrics=self.metrics)
+        """ Uploads the guild count whenever it changes, see notify_guild_count_changed. """
+
+        if self.send_stats and hasattr(self.bot, "add_listener"):
+            self.bot.add_listener(self.__on_guild_count_changed, "on_guild_join")
+            self.bot.add_listener(self.__on_guild_count_changed, "on_guild_remove")
+
+        if self.vote_info_cache is not None and self.vote_listener is not None:
+            self.vote_listener.add_vote_observer(self.vote_info_cache.observe_vote)
+
+        if self.vote_reminders is not None and self.vote_listener is not None:
+            self.vote_listener.add_vote_observer(self.vote_reminders.observe_vote)
+
+        self.__bot_votes: Optional[int] = None
+        self.__bot_votes_etag: Optional[str] = None
+        self.__bot_votes_refreshed_at: float = 0.0
+        # votes seen by the listener, to keep those arriving during a refresh on top of the refreshed value
+        self.__bot_votes_seen: int = 0
+        self.__bot_votes_refresh: Optional[asyncio.Task] = None
+
+        if self.bot_votes_soft_ttl is not None and self.vote_listener is not None:
+            self.vote_listener.add_vote_observer(self.__observe_bot_vote)
+
+    async def get_user_vote_info(self, user_id: Union[str, int], allow_stale: bool = True) -> UserVoteInformation:
         """ Get the vote information for a user.
         :param: user_id: The id of the user whose vote information is being fetched
+        :param: allow_stale: Whether an expired cache entry is returned when the API fails, times out or its circuit
+            is open (see VoteInfoCache.stale_ttl)
         :return: A UserVoteInformation object
         """
-        vote_info: dict = await self.make_request("GET", f"/v1/users/{user_id}/votes")
-        return UserVoteInformation(**vote_info)
+        return await self.__fetch_user_vote_info(user_id, Priority.INTERACTIVE, allow_stale)
+
+    async def get_many_user_vote_info(self, user_ids: Iterable[Union[str, int]], concurrency: int = 10,
+                                      priority: Priority = Priority.BACKGROUND
+                                      ) -> AsyncIterator[UserVoteInformationResult]:
+        """ Get the vote information for many users, yielding each result as soon as it is available.
+        A failed lookup is reported through its result instead of aborting the others.
+        :param: user_ids: The ids of the users whose vote information is being fetched
+        :param: concurrency: The maximum number of lookups in flight at once
+        :param: priority: The priority of the lookups while they wait on the rate limit
+        :return: An async iterator of UserVoteInformationResult objects (in completion order)
+        """
+        user_ids = iter(user_ids)
+        concurrency = max(concurrency, 1)
+        # bounded, so that lookups pause while the consumer falls behind
+        results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+        done = object()
+
+        async def worker() -> None:
+            for user_id in user_ids:
+                try:
+                    vote_info = await self.__fetch_user_vote_info(user_id, priority)
+                except Exception as e:
+                    await results.put(UserVoteInformationResult(user_id, error=e))
+                else:
+                    await results.put(UserVoteInformationResult(user_id, vote_info=vote_info))
+
+            await results.put(done)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        running = len(workers)
+
+        try:
+            while running:
+                result = await results.get()
+
+                if result is done:
+                    running -= 1
+                    continue
+
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+
+    async def __fetch_user_vote_info(self, user_id: Union[str, int], priority: Priority,
+                                     allow_stale: bool = True) -> UserVoteInformation:
+        if self.vote_info_cache is not None:
+            cached = self.vote_info_cache.get(user_id)
+            if cached is not None:
+                return cached
+
+        try:
+            vote_info: dict = await self.make_request("GET", f"/v1/users/{user_id}/votes", priority=priority)
+        except (CircuitOpenException, RequestTimeoutException, ServerException):
+            if allow_stale and self.vote_info_cache is not None:
+                stale = self.vote_info_cache.get(user_id, allow_stale=True)
+                if stale is not None:
+                    return stale
+
+            raise
+
+        if self.vote_info_cache is not None:
+            self.vote_info_cache.put(user_id, vote_info)
+
+        result = UserVoteInformation(**vote_info)
+
+        if self.vote_reminders is not None:
+            self.vote_reminders.observe_vote_info(result)
+
+        return result
 
     async def bot_votes_this_month(self) -> int:
         """ Get the number of votes this bot has received this month.
+        With bot_votes_soft_ttl the value is answered from memory, counting the votes received by the listener since,
+        and refreshed in the background once it is older than the soft TTL. Only the first call waits on the API.
         :return: The number of votes this bot has received this month
         """
-        bot_info: dict = await self.make_request("GET", f"/v1/votes")
-        return bot_info["month_votes"]
+        if self.bot_votes_soft_ttl is None:
+            bot_info: dict = await self.make_request("GET", "/v1/votes", priority=Priority.INTERACTIVE)
+            return bot_info["month_votes"]
+
+        if self.__bot_votes is None:
+            await asyncio.shield(self.__start_bot_votes_refresh())
+        elif time.monotonic() - self.__bot_votes_refreshed_at >= self.bot_votes_soft_ttl:
+            self.__start_bot_votes_refresh()
+
+        return self.__bot_votes
+
+    def __start_bot_votes_refresh(self) -> asyncio.Task:
+        if self.__bot_votes_refresh is None or self.__bot_votes_refresh.done():
+            if self.__bot_votes is None:
+                # the first read waits on the refresh and gets its exception
+                self.__bot_votes_refresh = asyncio.ensure_future(self.__refresh_bot_votes())
+            else:
+                self.__bot_votes_refresh = asyncio.ensure_future(self.__refresh_bot_votes_in_background())
+
+        return self.__bot_votes_refresh
+
+    async def __refresh_bot_votes_in_background(self) -> None:
+        try:
+            await self.__refresh_bot_votes()
+        except Exception as e:
+            # retried by the first read after another soft TTL, not by every read until the API answers again
+            self.__bot_votes_refreshed_at = time.monotonic()
+
+            if self.bot_votes_refresh_failure is not None:
+                await self.bot_votes_refresh_failure(e)
+            elif not self.silent:
+                print("Error refreshing the bot votes:", e)
+
+    async def __refresh_bot_votes(self) -> None:
+        seen = self.__bot_votes_seen
+        bot_info, etag = await self.make_conditional_request("/v1/votes", self.__bot_votes_etag,
+                                                             priority=Priority.BACKGROUND)
+
+        # not modified: the local count already includes every vote the API knows of
+        if bot_info is not None:
+            self.__bot_votes = bot_info["month_votes"] + self.__bot_votes_seen - seen
+
+        self.__bot_votes_etag = etag
+        self.__bot_votes_refreshed_at = time.monotonic()
+
+    def __observe_bot_vote(self, vote: UserBotVote) -> None:
+        if vote.test:
+            return
+
+        self.__bot_votes_seen += 1
+
+        if self.__bot_votes is not None:
+            self.__bot_votes += 1
 
     async def __update_bot_stats(self, guild_count: int) -> None:
         """ Update bot stats
         :param: guild_count: The new guild count
         """
-        await self.make_request("POST", "/v1/stats", params={"guilds": guild_count})
+        await self.make_request("POST", "/v1/stats", priority=Priority.BACKGROUND, params={"guilds": guild_count})
+
+    def notify_guild_count_changed(self) -> None:
+        """ Signal that the bot joined or left a guild, so that the new guild count is uploaded soon.
+        Called automatically on guild join/remove events for bots supporting add_listener (e.g. pycord, discord.py).
+        """
+        self.stats_reporter.notify()
+
+    async def __on_guild_count_changed(self, guild: Any) -> None:
+        self.notify_guild_count_changed()
 
     async def __start(self) -> None:
         """ Start the client
@@ -170,26 +273,36 @@ class Client(HTTPApi):
                                         response=None)
 
         if self.send_stats:
-
             # send stats to Diffcord
-            while True:
+            self.stats_reporter.start()
 
-                try:
-                    await self.__update_bot_stats(guild_count=len(self.bot.guilds))
-                except Exception as e:
-                    if self.send_stats_failure is not None:
-                        await self.send_stats_failure(e)
-                else:
-                    if self.send_stats_success is not None:
-                        await self.send_stats_success()
-
-                await asyncio.sleep(self.send_stats_interval.total_seconds())
+        if self.vote_reminders is not None:
+            self.vote_reminders.start()
 
     def start(self) -> Task:
         """ Start the client.
         """
         return asyncio.ensure_future(self.__start())
 
+    async def stop(self) -> None:
+        """ Stop sending stats, vote reminders and the webhook listener, and close the HTTP connections.
+        """
+        await self.stats_reporter.stop()
+
+        if self.__bot_votes_refresh is not None:
+            self.__bot_votes_refresh.cancel()
+
+        if self.vote_reminders is not None:
+            await self.vote_reminders.stop()
+
+        if self.vote_listener is not None:
+            await self.vote_listener.stop()
+
+        await self.aclose()
+
+    async def __aenter__(self) -> "Client":
+        return self
+
     def __repr__(self):
         return f"<Client bot={self.bot} token={self.token}>"
 
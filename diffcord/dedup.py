@@ -0,0 +1,134 @@
+import datetime
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Set
+
+
+class VoteDeduplicator:
+    """ Remembers the ids of recently delivered votes so that webhook retries are not handled twice.
+
+    Vote ids are kept for a fixed horizon (and at most max_entries of them) in insertion order, so lookups and
+    expiry are O(1). When a path is given the seen ids are appended to that file and loaded again on startup.
+    """
+
+    def __init__(self, horizon: datetime.timedelta = datetime.timedelta(hours=24), max_entries: int = 100000,
+                 path: str = None):
+        self.horizon: float = horizon.total_seconds()
+        """ How long (in seconds) a vote id is remembered. """
+
+        self.max_entries: int = max_entries
+        """ The maximum number of vote ids remembered. """
+
+        self.path: Optional[str] = path
+        """ The file in which seen vote ids are persisted, None to only keep them in memory. """
+
+        # vote id -> unix time it was seen at, oldest first
+        self.__seen: "OrderedDict[str, float]" = OrderedDict()
+        self.__in_flight: Set[str] = set()
+        self.__file = None
+        self.__file_lines: int = 0
+
+        if self.path is not None:
+            self.__load()
+
+    def begin(self, vote_id: str) -> bool:
+        """ Start delivering a vote, unless it was already delivered or is being delivered right now.
+        :param: vote_id: The id of the vote
+        :return: Whether the vote should be delivered
+        """
+        self.__expire(time.time())
+
+        if vote_id in self.__seen or vote_id in self.__in_flight:
+            return False
+
+        self.__in_flight.add(vote_id)
+        return True
+
+    def complete(self, vote_id: str, delivered: bool) -> None:
+        """ Finish delivering a vote started with begin.
+        :param: vote_id: The id of the vote
+        :param: delivered: Whether the vote was delivered, if not a later retry is delivered again
+        """
+        self.__in_flight.discard(vote_id)
+
+        if delivered:
+            self.add(vote_id)
+
+    def add(self, vote_id: str) -> None:
+        """ Remember a vote as delivered.
+        :param: vote_id: The id of the vote
+        """
+        now = time.time()
+        self.__seen[vote_id] = now
+        self.__seen.move_to_end(vote_id)
+        self.__expire(now)
+
+        if self.__file is not None:
+            self.__file.write(f"{now} {vote_id}\n")
+            self.__file.flush()
+            self.__file_lines += 1
+
+            if self.__file_lines > 2 * len(self.__seen) + 1000:
+                self.__compact()
+
+    def close(self) -> None:
+        """ Close the persistence file.
+        """
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __expire(self, now: float) -> None:
+        cutoff = now - self.horizon
+
+        while self.__seen:
+            vote_id, seen_at = next(iter(self.__seen.items()))
+
+            if seen_at > cutoff and len(self.__seen) <= self.max_entries:
+                break
+
+            del self.__seen[vote_id]
+
+    def __load(self) -> None:
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    seen_at, _, vote_id = line.rstrip("\n").partition(" ")
+
+                    try:
+                        self.__seen[vote_id] = float(seen_at)
+                    except ValueError:
+                        # a line torn by a crash
+                        continue
+
+                    self.__seen.move_to_end(vote_id)
+
+            self.__expire(time.time())
+
+        self.__compact()
+
+    def __compact(self) -> None:
+        self.close()
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            for vote_id, seen_at in self.__seen.items():
+                file.write(f"{seen_at} {vote_id}\n")
+
+        os.replace(temp_path, self.path)
+
+        self.__file = open(self.path, "a", encoding="utf-8")
+        self.__file_lines = len(self.__seen)
+
+    def __len__(self):
+        return len(self.__seen)
+
+    def __contains__(self, vote_id: str):
+        return vote_id in self.__seen
+
+    def __repr__(self):
+        return f"<VoteDeduplicator seen={len(self.__seen)} in_flight={len(self.__in_flight)} horizon={self.horizon}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -1,4 +1,7 @@
-import httpx
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import httpx
 
 
 class DiffcordException(Exception):
@@ -20,7 +23,7 @@ class HTTPException(DiffcordException):
 
 
 class RateLimitException(HTTPException):
-    def __init__(self, error: dict, response: httpx.Response):
+    def __init__(self, error: dict, response: "httpx.Response"):
         super().__init__(response.status_code, error["message"], error["code"])
 
     def __repr__(self):
@@ -31,7 +34,7 @@ class RateLimitException(HTTPException):
 
 
 class ServerException(HTTPException):
-    def __init__(self, error: dict, response: httpx.Response):
+    def __init__(self, error: dict, response: "httpx.Response"):
         super().__init__(response.status_code, error["message"], error["code"])
 
     def __repr__(self):
@@ -42,7 +45,7 @@ class ServerException(HTTPException):
 
 
 class MissingTokenException(HTTPException):
-    def __init__(self, error: dict, response: httpx.Response):
+    def __init__(self, error: dict, response: "httpx.Response"):
         super().__init__(response.status_code, error["message"], error["code"])
 
     def __repr__(self):
@@ -54,7 +57,7 @@ class MissingTokenException(HTTPException):
 
 class InvalidTokenException(HTTPException):
 
-    def __init__(self, error: dict, response: httpx.Response):
+    def __init__(self, error: dict, response: "httpx.Response"):
         super().__init__(response.status_code, error["message"], error["code"])
 
     def __repr__(self):
@@ -62,3 +65,29 @@ class InvalidTokenException(HTTPException):
 
     def __str__(self):
         return self.__repr__()
+
+
+class CircuitOpenException(DiffcordException):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"the Diffcord API is failing, requests are rejected for {retry_after:.1f}s")
+
+    def __repr__(self):
+        return f"<CircuitOpenException retry_after={self.retry_after}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class RequestTimeoutException(DiffcordException):
+    def __init__(self, method: str, path: str, deadline: float):
+        self.method = method
+        self.path = path
+        self.deadline = deadline
+        super().__init__(f"{method} {path} did not complete within {deadline}s")
+
+    def __repr__(self):
+        return f"<RequestTimeoutException method={self.method} path={self.path} deadline={self.deadline}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,300 @@
+import datetime
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from diffcord.vote import UserBotVote
+
+# (name, array typecode, numpy dtype), every column of a segment is stored as one contiguous block
+COLUMNS: Tuple[Tuple[str, str, str], ...] = (
+    ("user_id", "q", "<i8"),
+    ("bot_id", "q", "<i8"),
+    ("voted_at", "d", "<f8"),
+    ("received_at", "d", "<f8"),
+    ("monthly_votes", "i", "<i4"),
+    ("flags", "B", "u1"),
+)
+
+FLAG_REWARDED = 1
+""" The flags bit set for rewarded votes. """
+
+FLAG_TEST = 2
+""" The flags bit set for test votes. """
+
+# magic, version, capacity, row count
+_HEADER = struct.Struct("<4sHxxII")
+_MAGIC = b"DCVH"
+_VERSION = 1
+
+
+def _column_offset(name: str, capacity: int) -> int:
+    offset = _HEADER.size
+
+    for column, code, _ in COLUMNS:
+        if column == name:
+            return offset
+
+        offset += struct.calcsize(code) * capacity
+
+    raise KeyError(name)
+
+
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("vote history queries require numpy, install it with: pip install diffcord[history]") from e
+
+    return numpy
+
+
+class _Segment:
+    """ A memory mapped file holding up to capacity rows, column after column.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        exists = os.path.exists(path)
+
+        with open(path, "r+b" if exists else "w+b") as file:
+            if not exists:
+                # sparse, pages are only allocated once rows are written to them
+                file.truncate(_column_offset(COLUMNS[-1][0], capacity) + capacity)
+                file.write(_HEADER.pack(_MAGIC, _VERSION, capacity, 0))
+                file.flush()
+
+            self.__mmap = mmap.mmap(file.fileno(), 0)
+
+        magic, version, self.capacity, self.count = _HEADER.unpack_from(self.__mmap)
+
+        if magic != _MAGIC or version != _VERSION:
+            self.__mmap.close()
+            raise ValueError(f"{path} is not a vote history segment")
+
+        self.__columns: List[memoryview] = []
+
+        for name, code, _ in COLUMNS:
+            offset = _column_offset(name, self.capacity)
+            size = struct.calcsize(code) * self.capacity
+            self.__columns.append(memoryview(self.__mmap)[offset:offset + size].cast(code))
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def append(self, row: Sequence[Any]) -> None:
+        for column, value in zip(self.__columns, row):
+            column[self.count] = value
+
+        # the row only counts once every column was written
+        self.count += 1
+        _HEADER.pack_into(self.__mmap, 0, _MAGIC, _VERSION, self.capacity, self.count)
+
+    def rows(self) -> Iterator[Tuple[Any, ...]]:
+        columns = self.__columns
+
+        for index in range(self.count):
+            yield tuple(column[index] for column in columns)
+
+    def flush(self) -> None:
+        self.__mmap.flush()
+
+    def close(self) -> None:
+        for column in self.__columns:
+            column.release()
+
+        self.__columns = []
+        self.__mmap.close()
+
+
+class VoteHistory:
+    """ An append-only store of every received vote, kept in compact columns instead of Python objects.
+
+    Each vote takes 37 bytes: the user and bot ids (int64), the unix times of the vote and of its receipt (float64),
+    the monthly votes (int32) and the rewarded and test flags packed into one byte. The rows are appended to memory
+    mapped segment files of segment_size rows in the directory path, so months of votes stay on disk and in the page
+    cache rather than the Python heap.
+
+    Attach it with VoteWebhookListener(history=...). The query methods aggregate the columns with NumPy (pip install
+    diffcord[history]) directly on the mapped files, rows() iterates them without it.
+    """
+
+    def __init__(self, path: str, segment_size: int = 1 << 18):
+        self.path: str = path
+        """ The directory holding the segment files. """
+
+        self.segment_size: int = segment_size
+        """ The number of rows per segment file. """
+
+        # (path, capacity, row count) of the segments no longer appended to
+        self.__sealed: List[Tuple[str, int, int]] = []
+        self.__segment: Optional[_Segment] = None
+
+        os.makedirs(path, exist_ok=True)
+        names = sorted(name for name in os.listdir(path) if name.startswith("votes-") and name.endswith(".seg"))
+
+        for index, name in enumerate(names):
+            segment = _Segment(os.path.join(path, name), segment_size)
+
+            if index == len(names) - 1 and not segment.full:
+                self.__segment = segment
+            else:
+                self.__seal(segment)
+
+    def observe_vote(self, vote: UserBotVote) -> None:
+        """ Append an incoming vote, see VoteWebhookListener.add_vote_observer.
+        :param: vote: The incoming vote
+        """
+        self.append(vote)
+
+    def append(self, vote: UserBotVote) -> None:
+        """ Append a vote to the history.
+        :param: vote: The vote
+        """
+        if self.__segment is None or self.__segment.full:
+            self.__roll_over()
+
+        flags = (FLAG_REWARDED if vote.rewarded else 0) | (FLAG_TEST if vote.test else 0)
+        voted_at = vote.received_at - vote.since_voted.total_seconds()
+        self.__segment.append((vote.user_id, vote.bot_id, voted_at, vote.received_at, vote.monthly_votes, flags))
+
+    def rows(self) -> Iterator[Tuple[int, int, float, float, int, int]]:
+        """ Iterate the stored votes in the order they were appended, without NumPy.
+        :return: An iterator of (user id, bot id, voted at, received at, monthly votes, flags) tuples
+        """
+        for path, capacity, _ in self.__sealed:
+            segment = _Segment(path, capacity)
+
+            try:
+                yield from segment.rows()
+            finally:
+                segment.close()
+
+        if self.__segment is not None:
+            yield from self.__segment.rows()
+
+    def columns(self, start: datetime.datetime = None, end: datetime.datetime = None,
+                include_test: bool = False) -> Dict[str, Any]:
+        """ Load the columns of the votes cast in a time range as NumPy arrays.
+        :param: start: The earliest vote time (inclusive), None for no lower bound
+        :param: end: The latest vote time (exclusive), None for no upper bound
+        :param: include_test: Whether test votes are included
+        :return: The arrays by column name (see COLUMNS)
+        """
+        numpy = _numpy()
+        parts: Dict[str, list] = {name: [] for name, _, _ in COLUMNS}
+
+        for path, capacity, count in self.__segments():
+            if not count:
+                continue
+
+            # mapped read-only, so that the arrays do not pin the segment the listener appends to
+            arrays = {name: numpy.memmap(path, dtype=dtype, mode="r", shape=(count,),
+                                         offset=_column_offset(name, capacity))
+                      for name, _, dtype in COLUMNS}
+            mask = numpy.ones(count, dtype=bool)
+
+            if not include_test:
+                mask &= (arrays["flags"] & FLAG_TEST) == 0
+
+            if start is not None:
+                mask &= arrays["voted_at"] >= start.timestamp()
+
+            if end is not None:
+                mask &= arrays["voted_at"] < end.timestamp()
+
+            for name, array in arrays.items():
+                parts[name].append(array[mask])
+
+        return {name: numpy.concatenate(arrays) if arrays else numpy.empty(0, dtype=dtype)
+                for (name, _, dtype), arrays in zip(COLUMNS, parts.values())}
+
+    def votes_over_time(self, bucket: datetime.timedelta = datetime.timedelta(hours=1), **filters: Any
+                        ) -> Tuple[Any, Any]:
+        """ Count the votes per time bucket.
+        :param: bucket: The width of a bucket, buckets are aligned to the unix epoch
+        :param: filters: The start, end and include_test filters of columns
+        :return: The unix times at which the non-empty buckets start and their vote counts, as NumPy arrays
+        """
+        numpy = _numpy()
+        width = bucket.total_seconds()
+        starts = numpy.floor(self.columns(**filters)["voted_at"] / width) * width
+        return numpy.unique(starts, return_counts=True)
+
+    def votes_per_user(self, **filters: Any) -> Tuple[Any, Any]:
+        """ Count the votes of each user.
+        :param: filters: The start, end and include_test filters of columns
+        :return: The user ids and their vote counts, as NumPy arrays
+        """
+        return _numpy().unique(self.columns(**filters)["user_id"], return_counts=True)
+
+    def repeat_voter_cohorts(self, **filters: Any) -> Tuple[Any, Any]:
+        """ Group the users by how often they voted.
+        :param: filters: The start, end and include_test filters of columns
+        :return: The vote counts and the number of users who voted that often, as NumPy arrays
+        """
+        _, counts = self.votes_per_user(**filters)
+        return _numpy().unique(counts, return_counts=True)
+
+    def delivery_latency(self, percentiles: Sequence[float] = (0.5, 0.95, 0.99), rewarded: bool = None,
+                         **filters: Any) -> Any:
+        """ Estimate the delay between votes and the arrival of their webhooks.
+        :param: percentiles: The percentiles to compute, e.g. 0.95
+        :param: rewarded: Only include rewarded (True) or not rewarded (False) votes, None for both
+        :param: filters: The start, end and include_test filters of columns
+        :return: The delays (in seconds) at each percentile as a NumPy array, NaN if no vote matched
+        """
+        numpy = _numpy()
+        columns = self.columns(**filters)
+        latency = columns["received_at"] - columns["voted_at"]
+
+        if rewarded is not None:
+            latency = latency[((columns["flags"] & FLAG_REWARDED) != 0) == rewarded]
+
+        if not len(latency):
+            return numpy.full(len(percentiles), numpy.nan)
+
+        return numpy.quantile(latency, percentiles)
+
+    def flush(self) -> None:
+        """ Write the appended votes to disk.
+        """
+        if self.__segment is not None:
+            self.__segment.flush()
+
+    def close(self) -> None:
+        """ Write the appended votes to disk and unmap the open segment.
+        """
+        if self.__segment is not None:
+            self.__segment.flush()
+            self.__seal(self.__segment)
+            self.__segment = None
+
+    def __seal(self, segment: _Segment) -> None:
+        self.__sealed.append((segment.path, segment.capacity, segment.count))
+        segment.close()
+
+    def __segments(self) -> List[Tuple[str, int, int]]:
+        segments = list(self.__sealed)
+
+        if self.__segment is not None:
+            segments.append((self.__segment.path, self.__segment.capacity, self.__segment.count))
+
+        return segments
+
+    def __roll_over(self) -> None:
+        if self.__segment is not None:
+            self.close()
+
+        index = len(self.__sealed)
+        self.__segment = _Segment(os.path.join(self.path, f"votes-{index:06d}.seg"), self.segment_size)
+
+    def __len__(self):
+        return sum(count for _, _, count in self.__segments())
+
+    def __repr__(self):
+        return f"<VoteHistory path={self.path} votes={len(self)}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,335 @@
+import asyncio
+import http
+import socket
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from diffcord.metrics import MetricsRegistry
+
+# (Authorization header, body) -> (status code, headers)
+ReceiveCallback = Callable[[Optional[str], bytes], Awaitable[Tuple[int, Dict[str, str]]]]
+
+DEFAULT_MAX_BODY_SIZE = 64 * 1024
+""" The default largest accepted webhook body (in bytes), vote payloads are well below 1 KiB. """
+
+_MAX_HEADER_SIZE = 8 * 1024
+
+_STATUS_LINES: Dict[int, bytes] = {
+    status.value: f"HTTP/1.1 {status.value} {status.phrase}\r\n".encode("ascii") for status in http.HTTPStatus
+}
+
+
+def bind_sockets(port: int, host: str, reuse_port: bool = False, backlog: int = 128) -> List[socket.socket]:
+    """ Bind listening sockets for every address of a host.
+    :param: port: The port, 0 picks a free port
+    :param: host: The host
+    :param: reuse_port: Whether to share the port with other processes (SO_REUSEPORT)
+    :param: backlog: The length of the queue of pending connections
+    :return: The listening sockets
+    """
+    sockets = []
+
+    for family, socket_type, proto, _, address in sorted(set(socket.getaddrinfo(
+            host, port, socket.AF_UNSPEC, socket.SOCK_STREAM, 0, socket.AI_PASSIVE))):
+        sock = socket.socket(family, socket_type, proto)
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+            if family == socket.AF_INET6:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+
+            if port == 0 and sockets:
+                # every address shares the port picked for the first one
+                address = (address[0], sockets[0].getsockname()[1]) + tuple(address[2:])
+
+            sock.bind(address)
+            sock.listen(backlog)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+
+            for bound in sockets:
+                bound.close()
+
+            raise
+
+        sockets.append(sock)
+
+    return sockets
+
+
+class AsyncioHTTPServer:
+    """ A minimal HTTP/1.1 server on asyncio protocols, answering vote webhooks with less overhead than tornado.
+
+    It only understands what the webhook route needs: POST / with a Content-Length body (at most max_body_size
+    bytes) and optionally GET metrics_path. Connections are kept alive and pipelined requests are answered in order.
+    The methods mirror the subset of tornado's HTTPServer used by the webhook listener.
+    """
+
+    def __init__(self, receive: ReceiveCallback, metrics: MetricsRegistry = None, metrics_path: str = None,
+                 max_body_size: int = DEFAULT_MAX_BODY_SIZE):
+        self.receive: ReceiveCallback = receive
+        """ The function answering a webhook. """
+
+        self.metrics: Optional[MetricsRegistry] = metrics
+        """ The registry served at metrics_path. """
+
+        self.metrics_path: Optional[str] = metrics_path
+        """ The path at which the metrics are served, None to not serve them. """
+
+        self.max_body_size: int = max_body_size
+        """ The largest accepted request body (in bytes), larger requests are answered with 413. """
+
+        self.connections: Set["_HTTPProtocol"] = set()
+        """ The open connections. """
+
+        self.__sockets: List[socket.socket] = []
+        self.__servers: List[asyncio.AbstractServer] = []
+        self.__starting: Optional[asyncio.Task] = None
+        self.__closed: Optional[asyncio.Event] = None
+
+    def bind(self, port: int, host: str = None, reuse_port: bool = False) -> None:
+        """ Bind the port, connections are accepted once the server is started.
+        :param: port: The port
+        :param: host: The host, None for every interface
+        :param: reuse_port: Whether to share the port with other processes (SO_REUSEPORT)
+        """
+        self.__sockets.extend(bind_sockets(port, host or "0.0.0.0", reuse_port))
+
+    def add_sockets(self, sockets: List[socket.socket]) -> None:
+        """ Accept connections on already listening sockets.
+        :param: sockets: The sockets
+        """
+        self.__sockets.extend(sockets)
+        self.start()
+
+    def start(self) -> None:
+        """ Start accepting connections on the bound sockets.
+        """
+        # the sockets already listen, connections made until accepting starts wait in their backlog
+        self.__starting = asyncio.ensure_future(self.__accept())
+
+    def stop(self) -> None:
+        """ Stop accepting new connections.
+        """
+        if self.__starting is not None:
+            self.__starting.cancel()
+            self.__starting = None
+
+        for server in self.__servers:
+            server.close()
+
+        for sock in self.__sockets:
+            sock.close()
+
+        self.__servers = []
+        self.__sockets = []
+
+    async def close_all_connections(self) -> None:
+        """ Close idle connections and wait until the requests in flight have been answered.
+        """
+        for connection in list(self.connections):
+            connection.close_when_idle()
+
+        while self.connections:
+            self.__closed = asyncio.Event()
+            await self.__closed.wait()
+
+    async def __accept(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while self.__sockets:
+            server = await loop.create_server(lambda: _HTTPProtocol(self), sock=self.__sockets[0])
+            self.__sockets.pop(0)
+            self.__servers.append(server)
+
+    def _connection_lost(self, connection: "_HTTPProtocol") -> None:
+        self.connections.discard(connection)
+
+        if self.__closed is not None:
+            self.__closed.set()
+
+    def __repr__(self):
+        return f"<AsyncioHTTPServer connections={len(self.connections)} max_body_size={self.max_body_size}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class _HTTPProtocol(asyncio.Protocol):
+
+    def __init__(self, server: AsyncioHTTPServer):
+        self.__server = server
+        self.__transport: Optional[asyncio.Transport] = None
+        self.__buffer = bytearray()
+        self.__task: Optional[asyncio.Task] = None
+        self.__closing = False
+        self.__paused = False
+        self.__continued = False
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.__transport = transport
+        self.__server.connections.add(self)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        # a vote being handled is not cancelled, its response is dropped
+        self.__closing = True
+        self.__server._connection_lost(self)
+
+    def data_received(self, data: bytes) -> None:
+        self.__buffer += data
+
+        if self.__task is None:
+            self.__serve()
+
+        # pipelined requests are buffered up to one full request ahead
+        if len(self.__buffer) > _MAX_HEADER_SIZE + self.__server.max_body_size and not self.__paused:
+            self.__paused = True
+            self.__transport.pause_reading()
+
+    def close_when_idle(self) -> None:
+        self.__closing = True
+
+        if self.__task is None:
+            self.__transport.close()
+
+    def __serve(self) -> None:
+        """ Answer every complete buffered request, in the order they were received.
+        """
+        while not self.__closing:
+            request = self.__parse()
+
+            if request is None:
+                break
+
+            if isinstance(request, int):
+                # malformed or too large, the rest of the stream can not be trusted
+                self.__respond(request, {}, b"", False)
+                self.__transport.close()
+                return
+
+            method, path, authorization, body, keep_alive = request
+
+            if method == "POST" and path == "/":
+                self.__task = asyncio.ensure_future(self.__answer(authorization, body, keep_alive))
+                return
+
+            if method == "GET" and path == self.__server.metrics_path:
+                self.__respond(200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+                               self.__server.metrics.render().encode("utf-8"), keep_alive)
+            elif path == "/" or path == self.__server.metrics_path:
+                self.__respond(405, {}, b"", keep_alive)
+            else:
+                self.__respond(404, {}, b"", keep_alive)
+
+            if not keep_alive:
+                self.__transport.close()
+                return
+
+        if self.__closing and not self.__transport.is_closing():
+            self.__transport.close()
+
+        if self.__paused and not self.__closing:
+            self.__paused = False
+            self.__transport.resume_reading()
+
+    async def __answer(self, authorization: Optional[str], body: bytes, keep_alive: bool) -> None:
+        try:
+            status, headers = await self.__server.receive(authorization, body)
+        except Exception:
+            status, headers = 500, {}
+
+        self.__task = None
+        keep_alive = keep_alive and not self.__closing
+        self.__respond(status, headers, b"", keep_alive)
+
+        if not keep_alive:
+            self.__transport.close()
+        else:
+            self.__serve()
+
+    def __parse(self):
+        """ Take the next complete request off the buffer.
+        :return: None if it is incomplete, an error status if it is invalid,
+            otherwise (method, path, authorization, body, keep alive)
+        """
+        buffer = self.__buffer
+        header_end = buffer.find(b"\r\n\r\n")
+
+        if header_end < 0:
+            return 431 if len(buffer) > _MAX_HEADER_SIZE else None
+
+        if header_end > _MAX_HEADER_SIZE:
+            return 431
+
+        lines = bytes(buffer[:header_end]).split(b"\r\n")
+
+        try:
+            method, target, version = lines[0].decode("ascii").split(" ")
+        except (UnicodeDecodeError, ValueError):
+            return 400
+
+        headers: Dict[bytes, bytes] = {}
+
+        for line in lines[1:]:
+            name, separator, value = line.partition(b":")
+
+            if not separator:
+                return 400
+
+            headers[name.strip().lower()] = value.strip()
+
+        if b"transfer-encoding" in headers:
+            return 501
+
+        try:
+            length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            return 400
+
+        if length < 0:
+            return 400
+
+        if length > self.__server.max_body_size:
+            return 413
+
+        body_start = header_end + 4
+
+        if len(buffer) < body_start + length:
+            if headers.get(b"expect", b"").lower() == b"100-continue" and not self.__continued:
+                self.__continued = True
+                self.__transport.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+            return None
+
+        body = bytes(buffer[body_start:body_start + length])
+        del buffer[:body_start + length]
+        self.__continued = False
+
+        connection = headers.get(b"connection", b"").lower()
+        keep_alive = connection != b"close" if version == "HTTP/1.1" else connection == b"keep-alive"
+
+        authorization = headers.get(b"authorization")
+        path = target.split("?", 1)[0]
+
+        return method, path, authorization.decode("latin-1") if authorization is not None else None, body, \
+            keep_alive and not self.__closing
+
+    def __respond(self, status: int, headers: Dict[str, str], body: bytes, keep_alive: bool) -> None:
+        if self.__transport.is_closing():
+            return
+
+        head = [_STATUS_LINES.get(status) or f"HTTP/1.1 {status} Unknown\r\n".encode("ascii"),
+                b"Content-Length: %d\r\n" % len(body)]
+
+        if not keep_alive:
+            head.append(b"Connection: close\r\n")
+
+        for name, value in headers.items():
+            head.append(f"{name}: {value}\r\n".encode("latin-1"))
+
+        head.append(b"\r\n")
+        self.__transport.write(b"".join(head) + body)
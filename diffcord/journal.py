@@ -0,0 +1,249 @@
+import asyncio
+import datetime
+import mmap
+import os
+import struct
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+# record header: payload length, crc32 of type + payload, record type
+_HEADER = struct.Struct("<IIB")
+_VOTE_ID_LENGTH = struct.Struct("<H")
+
+_RECORD_VOTE = 1
+_RECORD_DONE = 2
+
+
+class VoteJournal:
+    """ A local append-only journal of received vote payloads, used to replay votes whose handling was interrupted.
+
+    Votes are appended before they are acknowledged and only acknowledged once the journal has been synced to disk.
+    Appends are synced together every group_commit_interval, so one fsync covers every vote received meanwhile.
+    Completion markers are not synced on their own, after a crash a vote may therefore be replayed more than once.
+
+    The journal is split into segments of about segment_size bytes. Segments without unfinished votes are deleted
+    and the few unfinished votes of older segments are moved into the newest one, so the journal stays small.
+    """
+
+    def __init__(self, directory: str, group_commit_interval: datetime.timedelta = datetime.timedelta(milliseconds=5),
+                 segment_size: int = 4 * 1024 * 1024, compaction_threshold: int = 128):
+        self.directory: str = directory
+        """ The directory in which the journal segments are stored. """
+
+        self.group_commit_interval: float = group_commit_interval.total_seconds()
+        """ The time (in seconds) appends are collected before they are synced to disk together. """
+
+        self.segment_size: int = segment_size
+        """ The size (in bytes) after which a new segment is started. """
+
+        self.compaction_threshold: int = compaction_threshold
+        """ Older segments with at most this many unfinished votes are compacted into the newest segment. """
+
+        # vote id -> (segment index, raw payload)
+        self.__pending: Dict[str, Tuple[int, bytes]] = {}
+        self.__segment_pending: Dict[int, int] = {}
+        self.__segment: int = 0
+        self.__file: Optional[BinaryIO] = None
+        self.__waiters: List[asyncio.Future] = []
+        self.__commit_task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """ The number of journaled votes whose handling has not finished.
+        """
+        return len(self.__pending)
+
+    def open(self) -> List[bytes]:
+        """ Open the journal, recovering the votes whose handling did not finish before the last shutdown.
+        :return: The raw payloads of the unfinished votes, in the order they were received
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        segments = self.__segments()
+
+        for segment in segments:
+            self.__scan(segment)
+
+        self.__segment = segments[-1] + 1 if segments else 0
+        self.__segment_pending[self.__segment] = 0
+        self.__file = open(self.__segment_path(self.__segment), "ab")
+
+        self.__compact()
+        return [payload for _, payload in self.__pending.values()]
+
+    async def append(self, vote_id: str, payload: bytes) -> None:
+        """ Append a vote to the journal and wait until it has been synced to disk.
+        :param: vote_id: The id of the vote
+        :param: payload: The raw payload of the vote
+        """
+        encoded_id = vote_id.encode("utf-8")
+        self.__write(_RECORD_VOTE, _VOTE_ID_LENGTH.pack(len(encoded_id)) + encoded_id + payload)
+
+        if vote_id not in self.__pending:
+            self.__segment_pending[self.__segment] += 1
+
+        self.__pending[vote_id] = (self.__segment, payload)
+
+        future = asyncio.get_running_loop().create_future()
+        self.__waiters.append(future)
+
+        if self.__commit_task is None:
+            self.__commit_task = asyncio.ensure_future(self.__group_commit())
+
+        await future
+
+    def mark_done(self, vote_id: str) -> None:
+        """ Mark the handling of a journaled vote as finished.
+        :param: vote_id: The id of the vote
+        """
+        entry = self.__pending.pop(vote_id, None)
+
+        if entry is None or self.__file is None:
+            return
+
+        self.__segment_pending[entry[0]] -= 1
+        self.__write(_RECORD_DONE, vote_id.encode("utf-8"))
+
+        if self.__commit_task is None:
+            self.__maybe_rotate()
+
+    def close(self) -> None:
+        """ Sync and close the journal.
+        """
+        if self.__file is not None:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+            self.__file.close()
+            self.__file = None
+
+    def __write(self, record_type: int, payload: bytes) -> None:
+        crc = zlib.crc32(payload, zlib.crc32(bytes((record_type,))))
+        self.__file.write(_HEADER.pack(len(payload), crc, record_type) + payload)
+
+    async def __group_commit(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        try:
+            while self.__waiters:
+                await asyncio.sleep(self.group_commit_interval)
+
+                waiters, self.__waiters = self.__waiters, []
+                self.__file.flush()
+                await loop.run_in_executor(None, os.fsync, self.__file.fileno())
+
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+                self.__maybe_rotate()
+        except Exception as e:
+            waiters, self.__waiters = self.__waiters, []
+
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+        finally:
+            self.__commit_task = None
+
+    def __maybe_rotate(self) -> None:
+        if self.__file.tell() < self.segment_size:
+            return
+
+        self.close()
+        self.__segment += 1
+        self.__segment_pending[self.__segment] = 0
+        self.__file = open(self.__segment_path(self.__segment), "ab")
+        self.__compact()
+
+    def __compact(self) -> None:
+        """ Delete the oldest sealed segments once they have (almost) no unfinished votes left.
+        Segments are only deleted oldest first, so a completion marker is never lost before the vote it completes.
+        """
+        removable = []
+
+        for segment in sorted(self.__segment_pending):
+            if segment == self.__segment or self.__segment_pending[segment] > self.compaction_threshold:
+                break
+
+            removable.append(segment)
+
+        if not removable:
+            return
+
+        moved = False
+
+        for vote_id, (segment, payload) in list(self.__pending.items()):
+            if segment in removable:
+                encoded_id = vote_id.encode("utf-8")
+                self.__write(_RECORD_VOTE, _VOTE_ID_LENGTH.pack(len(encoded_id)) + encoded_id + payload)
+                self.__pending[vote_id] = (self.__segment, payload)
+                self.__segment_pending[self.__segment] += 1
+                moved = True
+
+        if moved:
+            # the moved votes must be durable before their old segment disappears
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+
+        for segment in removable:
+            del self.__segment_pending[segment]
+            os.remove(self.__segment_path(segment))
+
+    def __scan(self, segment: int) -> None:
+        path = self.__segment_path(segment)
+        self.__segment_pending.setdefault(segment, 0)
+
+        if os.path.getsize(path) == 0:
+            return
+
+        with open(path, "r+b") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            size = len(data)
+
+            while offset + _HEADER.size <= size:
+                length, crc, record_type = _HEADER.unpack_from(data, offset)
+                end = offset + _HEADER.size + length
+
+                if end > size:
+                    break
+
+                payload = data[offset + _HEADER.size:end]
+
+                if zlib.crc32(payload, zlib.crc32(bytes((record_type,)))) != crc:
+                    break
+
+                if record_type == _RECORD_VOTE:
+                    id_length, = _VOTE_ID_LENGTH.unpack_from(payload, 0)
+                    vote_id = payload[_VOTE_ID_LENGTH.size:_VOTE_ID_LENGTH.size + id_length].decode("utf-8")
+                    previous = self.__pending.get(vote_id)
+
+                    if previous is not None:
+                        self.__segment_pending[previous[0]] -= 1
+
+                    self.__pending[vote_id] = (segment, payload[_VOTE_ID_LENGTH.size + id_length:])
+                    self.__segment_pending[segment] += 1
+                elif record_type == _RECORD_DONE:
+                    previous = self.__pending.pop(payload.decode("utf-8"), None)
+
+                    if previous is not None:
+                        self.__segment_pending[previous[0]] -= 1
+
+                offset = end
+
+        if offset < size:
+            # drop a record torn by a crash
+            with open(path, "r+b") as file:
+                file.truncate(offset)
+
+    def __segments(self) -> List[int]:
+        return sorted(int(name.split(".")[0]) for name in os.listdir(self.directory)
+                      if name.endswith(".journal") and name.split(".")[0].isdigit())
+
+    def __segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:08d}.journal")
+
+    def __repr__(self):
+        return f"<VoteJournal directory={self.directory} segment={self.__segment} pending={len(self.__pending)}>"
+
+    def __str__(self):
+        return self.__repr__()
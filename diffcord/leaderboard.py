@@ -0,0 +1,227 @@
+import datetime
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from diffcord.serialization import loads
+from diffcord.vote import UserBotVote
+
+
+class _FenwickTree:
+    """ Counts users per vote count, with O(log n) updates and prefix sums.
+    """
+
+    def __init__(self, size: int = 64):
+        self.size = size
+        self.__tree = [0] * (size + 1)
+
+    def add(self, index: int, delta: int) -> None:
+        while index > self.size:
+            self.__grow()
+
+        while index <= self.size:
+            self.__tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """ The sum of the counts at 1..index.
+        """
+        index = min(index, self.size)
+        total = 0
+
+        while index > 0:
+            total += self.__tree[index]
+            index -= index & -index
+
+        return total
+
+    def __grow(self) -> None:
+        counts = [self.prefix(i) - self.prefix(i - 1) for i in range(1, self.size + 1)]
+        self.size *= 2
+        self.__tree = [0] * (self.size + 1)
+
+        for index, count in enumerate(counts, 1):
+            if count:
+                self.add(index, count)
+
+
+class VoteLeaderboard:
+    """ A monthly leaderboard of voters, maintained from the monthly_votes of incoming votes without any API call.
+
+    Updates and rank lookups cost O(log n) in the highest vote count, top(k) walks the vote counts from the highest
+    down. Users with equal votes share a rank and are listed by who reached that count first. Test votes and votes
+    from a previous month are ignored, the leaderboard starts over once a vote (or query) from a new month arrives.
+
+    Attach it with VoteWebhookListener(leaderboard=...). When a path is given the leaderboard is saved there at most
+    every snapshot_interval and when the listener stops, and loaded again on creation.
+    """
+
+    def __init__(self, path: str = None, snapshot_interval: datetime.timedelta = datetime.timedelta(seconds=30)):
+        self.path: Optional[str] = path
+        """ The file in which the leaderboard is saved, None to only keep it in memory. """
+
+        self.snapshot_interval: float = snapshot_interval.total_seconds()
+        """ The shortest time (in seconds) between two saves of the leaderboard. """
+
+        self.month: str = self.__month(time.time())
+        """ The month (YYYY-MM, UTC) the leaderboard counts the votes of. """
+
+        self.__votes: Dict[int, int] = {}
+        # vote count -> users with that count, in the order they reached it
+        self.__buckets: Dict[int, Dict[int, None]] = {}
+        self.__counts = _FenwickTree()
+        self.__max_votes: int = 0
+        self.__last_snapshot: float = 0.0
+        self.__dirty: bool = False
+
+        if self.path is not None:
+            self.__load()
+
+    def observe_vote(self, vote: UserBotVote) -> None:
+        """ Update the leaderboard with an incoming vote, see VoteWebhookListener.add_vote_observer.
+        :param: vote: The incoming vote
+        """
+        if vote.test:
+            return
+
+        month = self.__month(vote.received_at - vote.since_voted.total_seconds())
+
+        if month != self.month:
+            if month < self.month:
+                return
+
+            self.__reset(month)
+
+        self.update(vote.user_id, vote.monthly_votes)
+
+        if self.path is not None and time.monotonic() - self.__last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def update(self, user_id: Union[str, int], monthly_votes: int) -> None:
+        """ Set the monthly votes of a user, counts lower than the known one (e.g. a late webhook retry) are ignored.
+        :param: user_id: The id of the user
+        :param: monthly_votes: The number of votes of the user this month
+        """
+        user_id = int(user_id)
+        current = self.__votes.get(user_id, 0)
+
+        if monthly_votes <= current:
+            return
+
+        if current:
+            del self.__buckets[current][user_id]
+            self.__counts.add(current, -1)
+
+        self.__votes[user_id] = monthly_votes
+        self.__buckets.setdefault(monthly_votes, {})[user_id] = None
+        self.__counts.add(monthly_votes, 1)
+        self.__max_votes = max(self.__max_votes, monthly_votes)
+        self.__dirty = True
+
+    def votes(self, user_id: Union[str, int]) -> int:
+        """ The number of votes of a user this month.
+        :param: user_id: The id of the user
+        """
+        self.__roll_over()
+        return self.__votes.get(int(user_id), 0)
+
+    def rank(self, user_id: Union[str, int]) -> Optional[int]:
+        """ The position of a user on the leaderboard.
+        :param: user_id: The id of the user
+        :return: The rank (1 is the top voter, users with equal votes share a rank), None if the user did not vote
+            this month
+        """
+        self.__roll_over()
+        user_id = int(user_id)
+        votes = self.__votes.get(user_id)
+
+        if votes is None:
+            return None
+
+        # users with more votes than this one
+        return len(self.__votes) - self.__counts.prefix(votes) + 1
+
+    def top(self, k: int = 10) -> List[Tuple[int, int]]:
+        """ The top voters of the month.
+        :param: k: The number of voters
+        :return: (user id, votes) tuples, the top voter first
+        """
+        self.__roll_over()
+        result = []
+        votes = self.__max_votes
+
+        while votes > 0 and len(result) < k:
+            for user_id in self.__buckets.get(votes, ()):
+                result.append((user_id, votes))
+
+                if len(result) == k:
+                    break
+
+            votes -= 1
+
+        return result
+
+    def snapshot(self) -> None:
+        """ Save the leaderboard to path.
+        """
+        temp_path = self.path + ".tmp"
+
+        # written in rank order, so that ties keep their order after loading
+        users = [(user_id, votes) for votes in sorted(self.__buckets) for user_id in self.__buckets[votes]]
+
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"month": self.month, "votes": users}, file)
+
+        os.replace(temp_path, self.path)
+        self.__last_snapshot = time.monotonic()
+        self.__dirty = False
+
+    def close(self) -> None:
+        """ Save the leaderboard if it changed since the last save.
+        """
+        if self.path is not None and self.__dirty:
+            self.snapshot()
+
+    def __roll_over(self) -> None:
+        month = self.__month(time.time())
+
+        if month > self.month:
+            self.__reset(month)
+
+    def __reset(self, month: str) -> None:
+        self.month = month
+        self.__votes = {}
+        self.__buckets = {}
+        self.__counts = _FenwickTree()
+        self.__max_votes = 0
+        self.__dirty = True
+
+    def __load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "rb") as file:
+            data = loads(file.read())
+
+        if data["month"] != self.month:
+            return
+
+        for user_id, votes in data["votes"]:
+            self.update(user_id, votes)
+
+        self.__dirty = False
+
+    @staticmethod
+    def __month(timestamp: float) -> str:
+        moment = time.gmtime(timestamp)
+        return f"{moment.tm_year:04d}-{moment.tm_mon:02d}"
+
+    def __len__(self):
+        return len(self.__votes)
+
+    def __repr__(self):
+        return f"<VoteLeaderboard month={self.month} voters={len(self.__votes)}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,524 @@
+import asyncio
+import datetime
+import logging
+import os
+import shutil
+import tempfile
+import time
+from asyncio import Task
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from diffcord.batch import VoteBatcher
+from diffcord.capture import WebhookCapture
+from diffcord.dedup import VoteDeduplicator
+from diffcord.history import VoteHistory
+from diffcord.httpserver import DEFAULT_MAX_BODY_SIZE, AsyncioHTTPServer
+from diffcord.journal import VoteJournal
+from diffcord.leaderboard import VoteLeaderboard
+from diffcord.metrics import MetricsRegistry
+from diffcord.multiprocess import parse_vote, read_vote_batch, spawn_listener_process, write_vote_statuses
+from diffcord.profiling import Profiler, SlowHandlerWatchdog
+from diffcord.vote import UserBotVote
+
+if TYPE_CHECKING:
+    from tornado.httpserver import HTTPServer
+
+
+class VoteWebhookListener:
+    """ Handles incoming POST requests from Diffcord.
+
+    By default every vote is handled before the webhook is answered. When queue_size is set, votes are instead
+    acknowledged as soon as they are queued and handled by a pool of worker tasks, webhooks received while the queue
+    is full are answered with 503 and a Retry-After header so that Diffcord delivers them again later.
+
+    With handle_votes instead of handle_vote, votes are collected into micro-batches of up to batch_max_size votes
+    (waiting at most batch_max_delay) and each webhook is answered with the outcome of its batch. With a queue, a
+    batch holds at most one vote per worker.
+
+    When processes is more than one, webhooks are accepted by that many separate processes sharing the port through
+    SO_REUSEPORT (not available on Windows). They validate the webhooks and forward the votes in batches over a unix
+    socket, so only vote handling runs in the bot's event loop. Each webhook is then answered with the status the bot
+    process sends back for its vote, the same it would be answered with by a single process.
+    """
+
+    def __init__(self, port: int, handle_vote: Callable[[UserBotVote], Awaitable[None]] = None, host: str = None,
+                 silent: bool = False, verify_code: str = None, listener_sleep: int = 60,
+                 log_level: int = logging.CRITICAL, queue_size: int = None, workers: int = 1,
+                 retry_after: int = 5, deduplicator: VoteDeduplicator = None, journal: VoteJournal = None,
+                 processes: int = 1, ipc_batch_size: int = 64,
+                 ipc_batch_delay: datetime.timedelta = datetime.timedelta(milliseconds=2),
+                 handle_votes: Callable[[List[UserBotVote]], Awaitable[None]] = None, batch_max_size: int = 100,
+                 batch_max_delay: datetime.timedelta = datetime.timedelta(milliseconds=50),
+                 metrics: MetricsRegistry = None, metrics_path: str = None, engine: str = "tornado",
+                 max_body_size: int = DEFAULT_MAX_BODY_SIZE, leaderboard: VoteLeaderboard = None,
+                 history: VoteHistory = None, capture: WebhookCapture = None, profiler: Profiler = None,
+                 watchdog: SlowHandlerWatchdog = None):
+        self.port = port
+        """ The port of the webhook listener. """
+
+        if (handle_vote is None) == (handle_votes is None):
+            raise ValueError("exactly one of handle_vote and handle_votes must be given")
+
+        if engine not in ("tornado", "asyncio"):
+            raise ValueError(f"unknown engine {engine!r}, expected 'tornado' or 'asyncio'")
+
+        if metrics_path is not None and (metrics is None or processes != 1):
+            raise ValueError("metrics_path requires a metrics registry and a single process")
+
+        if capture is not None and processes != 1:
+            raise ValueError("capture requires a single process")
+
+        self.handle_vote = handle_vote
+        """ The function that will be called when a vote is received. (must be async with one parameter which is of type UserBotVote) """
+
+        self.handle_votes = handle_votes
+        """ The function that will be called with micro-batches of received votes instead of handle_vote. (must be async with one parameter which is a list of UserBotVote) """
+
+        self.silent = silent
+        """ Whether to print various httpserver messages to the console. """
+
+        self.verify_code = verify_code
+        """ The verification code for the webhook listener. """
+
+        self.listener_sleep = listener_sleep
+        """ The amount of time to sleep between each stat update. """
+
+        self.log_level = log_level
+        """ The log level of the httpserver. """
+
+        self.host = host
+        """ The host of the webhook listener. """
+
+        if host is None:
+            self.host = "0.0.0.0"
+
+        self.queue_size: int = queue_size
+        """ The maximum number of votes waiting to be handled, None to handle each vote before answering. """
+
+        self.workers: int = workers
+        """ The number of worker tasks handling queued votes. """
+
+        self.retry_after: int = retry_after
+        """ The Retry-After (in seconds) sent when the vote queue is full. """
+
+        self.deduplicator: VoteDeduplicator = deduplicator
+        """ Remembers delivered vote ids so that retried webhooks are acknowledged without being handled again (retries arriving while the vote is still being handled are answered with 409 and Retry-After). """
+
+        self.journal: VoteJournal = journal
+        """ Journals received votes before they are acknowledged, so that unfinished votes are replayed on start. """
+
+        self.processes: int = processes
+        """ The number of processes accepting webhooks, more than one moves webhook parsing out of this process. """
+
+        self.ipc_batch_size: int = ipc_batch_size
+        """ The maximum number of votes a listener process forwards at once. """
+
+        self.ipc_batch_delay: datetime.timedelta = ipc_batch_delay
+        """ The longest time a listener process holds a vote back to forward it with others. """
+
+        self.vote_observers: List[Callable[[UserBotVote], None]] = []
+        """ Functions called with every received vote before it is handled (e.g. to update caches). """
+
+        self.leaderboard: VoteLeaderboard = leaderboard
+        """ Ranks voters by their monthly votes as votes arrive, saved when the listener stops. """
+
+        if self.leaderboard is not None:
+            self.add_vote_observer(self.leaderboard.observe_vote)
+
+        self.history: VoteHistory = history
+        """ Stores every received vote in compact columns for later analysis, closed when the listener stops. """
+
+        if self.history is not None:
+            self.add_vote_observer(self.history.observe_vote)
+
+        self.capture: WebhookCapture = capture
+        """ Records every raw webhook request to replay it later, closed when the listener stops. """
+
+        self.profiler: Optional[Profiler] = profiler
+        """ Times the stages of processing each webhook (votes received by listener processes: the handler only). """
+
+        self.watchdog: Optional[SlowHandlerWatchdog] = watchdog
+        """ Flags vote handlers running for too long, started and stopped with the listener. """
+
+        self.worker_lag: float = 0.0
+        """ The time (in seconds) the most recently dequeued vote waited in the queue. """
+
+        self.rejected: int = 0
+        """ The number of votes answered with 503 because the queue was full. """
+
+        self.duplicates: int = 0
+        """ The number of already delivered votes which were acknowledged without being handled. """
+
+        self.metrics: Optional[MetricsRegistry] = metrics
+        """ The registry webhook and vote handling metrics are recorded in, None to not record metrics. """
+
+        self.metrics_path: Optional[str] = metrics_path
+        """ The path at which the metrics are served in the Prometheus text format, None to not serve them. """
+
+        self.engine: str = engine
+        """ The HTTP server answering webhooks: "tornado", or "asyncio" for the lighter built-in AsyncioHTTPServer. """
+
+        self.max_body_size: int = max_body_size
+        """ The largest accepted webhook body (in bytes), larger webhooks are answered with 413. """
+
+        if metrics is not None:
+            self.__webhooks_metric = metrics.counter("webhook_requests_total", "Vote webhooks answered by status",
+                                                     ("status",))
+            self.__duplicates_metric = metrics.counter("vote_duplicates_total",
+                                                       "Votes acknowledged without being handled again")
+            self.__failures_metric = metrics.counter("vote_handler_failures_total", "Votes whose handler raised")
+            self.__handler_metric = metrics.histogram("vote_handler_duration_seconds", "Vote handler latency")
+
+        self.__batcher: Optional[VoteBatcher] = None
+
+        if self.handle_votes is not None:
+            self.__batcher = VoteBatcher(self.handle_votes, batch_max_size, batch_max_delay)
+
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__worker_tasks: List[Task] = []
+        self.__processes: List[asyncio.subprocess.Process] = []
+        self.__ipc_directory: Optional[str] = None
+        self.__ipc_server: Optional[asyncio.AbstractServer] = None
+        self.__ipc_writers: List[asyncio.StreamWriter] = []
+        self.__server: Optional[Union["HTTPServer", AsyncioHTTPServer]] = None
+
+        if self.processes == 1:
+            if self.engine == "asyncio":
+                self.__server = AsyncioHTTPServer(self.__receive, self.metrics, self.metrics_path, self.max_body_size)
+            else:
+                # imported here, so that tornado is only loaded once a tornado listener is created
+                from diffcord.webhook import create_webhook_server
+
+                self.__server = create_webhook_server(self.__receive, self.metrics, self.metrics_path,
+                                                      self.max_body_size)
+
+            self.__server.bind(self.port, self.host)
+
+    @property
+    def queue_depth(self) -> int:
+        """ The number of votes waiting to be handled.
+        """
+        return self.__queue.qsize() if self.__queue is not None else 0
+
+    def add_vote_observer(self, observer: Callable[[UserBotVote], None]) -> None:
+        """ Register a function which is called with every received vote before handle_vote.
+        :param: observer: The function to call (must not be async)
+        """
+        self.vote_observers.append(observer)
+
+    def remove_vote_observer(self, observer: Callable[[UserBotVote], None]) -> None:
+        """ Unregister a function previously registered with add_vote_observer.
+        :param: observer: The function to unregister
+        """
+        self.vote_observers.remove(observer)
+
+    async def __receive(self, authorization: Optional[str], body: bytes) -> Tuple[int, Dict[str, str]]:
+        """ Validate and dispatch an incoming vote webhook.
+        :param: authorization: The Authorization header of the request
+        :param: body: The body of the request
+        :return: The status code and headers to answer with
+        """
+        if self.capture is not None:
+            self.capture.record(authorization, body)
+
+        status, vote = parse_vote(self.verify_code, authorization, body, self.silent, self.profiler)
+
+        if vote is None:
+            result = status, {}
+        else:
+            result = await self.__accept(vote, body, False)
+
+        if self.metrics is not None:
+            self.__webhooks_metric.inc(status=result[0])
+
+        return result
+
+    async def __accept(self, vote: UserBotVote, body: bytes, wait_for_queue: bool) -> Tuple[int, Dict[str, str]]:
+        """ Dispatch a validated vote.
+        :param: vote: The vote
+        :param: body: The raw payload of the vote
+        :param: wait_for_queue: Whether to wait for room in a full queue instead of rejecting the vote
+        :return: The status code and headers to answer with
+        """
+        if self.deduplicator is not None and not self.deduplicator.begin(vote.vote_id):
+            self.duplicates += 1
+
+            if self.metrics is not None:
+                self.__duplicates_metric.inc()
+
+            if vote.vote_id in self.deduplicator:
+                return 200, {}
+
+            # the original delivery is still running and may fail, only acknowledge a retry arriving after it
+            return 409, {"Retry-After": str(self.retry_after)}
+
+        if self.__queue is not None and self.__queue.full() and not wait_for_queue:
+            return self.__reject(vote)
+
+        if self.journal is not None:
+            try:
+                await self.journal.append(vote.vote_id, body)
+            except Exception as e:
+                if not self.silent:
+                    print("Error journaling vote:", e)
+
+                self.__complete(vote, False)
+                return 500, {}
+
+        if self.__queue is not None:
+            if wait_for_queue:
+                await self.__queue.put((vote, asyncio.get_running_loop().time()))
+            else:
+                try:
+                    self.__queue.put_nowait((vote, asyncio.get_running_loop().time()))
+                except asyncio.QueueFull:
+                    if self.journal is not None:
+                        self.journal.mark_done(vote.vote_id)
+
+                    return self.__reject(vote)
+
+            self.__complete(vote, True)
+            self.__observe(vote)
+            return 200, {}
+
+        self.__observe(vote)
+
+        delivered = await self.__handle(vote)
+        self.__complete(vote, delivered)
+        return (200, {}) if delivered else (500, {})
+
+    async def __receive_forwarded(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """ Dispatch the votes forwarded by a listener process.
+        :param: reader: The IPC stream of the listener process
+        :param: writer: The IPC stream of the listener process
+        """
+        self.__ipc_writers.append(writer)
+
+        try:
+            while True:
+                batch = await read_vote_batch(reader)
+
+                if batch is None:
+                    break
+
+                # waiting on a full queue stops reading, which in turn slows down the listener process
+                results = await asyncio.gather(*(self.__accept(vote, body, True) for vote, body in batch))
+
+                if self.metrics is not None:
+                    for status, _ in results:
+                        self.__webhooks_metric.inc(status=status)
+
+                try:
+                    await write_vote_statuses(writer, results)
+                except ConnectionError:
+                    # the listener process exited, its webhooks were answered with 500
+                    break
+        finally:
+            self.__ipc_writers.remove(writer)
+            writer.close()
+
+    async def __handle(self, vote: UserBotVote) -> bool:
+        """ Call handle_vote with a vote.
+        :param: vote: The vote to handle
+        :return: Whether the vote was handled without raising
+        """
+        start = time.perf_counter()
+        error = None
+
+        if self.profiler is not None:
+            started = self.profiler.start()
+
+        if self.watchdog is not None:
+            token = self.watchdog.begin(vote)
+
+        try:
+            if self.__batcher is not None:
+                await self.__batcher.submit(vote)
+            else:
+                await self.handle_vote(vote)
+        except Exception as e:
+            error = e
+
+            if not self.silent:
+                print("Error handling vote:", e)
+
+            if self.metrics is not None:
+                self.__failures_metric.inc()
+
+            return False
+        finally:
+            if self.watchdog is not None:
+                self.watchdog.end(token)
+
+            if self.journal is not None:
+                self.journal.mark_done(vote.vote_id)
+
+            if self.metrics is not None:
+                self.__handler_metric.observe(time.perf_counter() - start)
+
+            if self.profiler is not None:
+                if error is not None:
+                    self.profiler.record("webhook.handler", started, vote_id=vote.vote_id,
+                                         error=type(error).__name__, message=str(error))
+                else:
+                    self.profiler.record("webhook.handler", started, vote_id=vote.vote_id)
+
+        return True
+
+    def __reject(self, vote: UserBotVote) -> Tuple[int, Dict[str, str]]:
+        self.rejected += 1
+        self.__complete(vote, False)
+        return 503, {"Retry-After": str(self.retry_after)}
+
+    def __complete(self, vote: UserBotVote, delivered: bool) -> None:
+        if self.deduplicator is not None:
+            self.deduplicator.complete(vote.vote_id, delivered)
+
+    def __observe(self, vote: UserBotVote) -> None:
+        for observer in self.vote_observers:
+            try:
+                observer(vote)
+            except Exception as e:
+                if not self.silent:
+                    print("Error observing vote:", e)
+
+    async def __worker(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            vote, queued_at = await self.__queue.get()
+            self.worker_lag = loop.time() - queued_at
+
+            try:
+                await self.__handle(vote)
+            finally:
+                self.__queue.task_done()
+
+    async def __replay(self, payloads: List[bytes]) -> None:
+        """ Handle the votes recovered from the journal.
+        :param: payloads: The raw payloads of the votes
+        """
+        votes = []
+
+        for payload in payloads:
+            vote = UserBotVote.from_json(payload)
+
+            # like a received vote, so that retries arriving while it is handled are not acknowledged yet
+            if self.deduplicator is not None and not self.deduplicator.begin(vote.vote_id):
+                self.journal.mark_done(vote.vote_id)
+                continue
+
+            self.__observe(vote)
+
+            if self.__queue is not None:
+                await self.__queue.put((vote, asyncio.get_running_loop().time()))
+                self.__complete(vote, True)
+            else:
+                votes.append(vote)
+
+        async def handle(vote: UserBotVote) -> None:
+            self.__complete(vote, await self.__handle(vote))
+
+        await asyncio.gather(*(handle(vote) for vote in votes))
+
+    async def start(self) -> None:
+        """ Start the webhook listener.
+        """
+        logging.getLogger("tornado.access").setLevel(self.log_level)
+
+        if self.queue_size is not None:
+            self.__queue = asyncio.Queue(maxsize=self.queue_size)
+            self.__worker_tasks = [asyncio.ensure_future(self.__worker()) for _ in range(self.workers)]
+
+        if self.journal is not None:
+            self.__worker_tasks.append(asyncio.ensure_future(self.__replay(self.journal.open())))
+
+        if self.__server is not None:
+            self.__server.start()
+        else:
+            await self.__start_processes()
+
+        if self.watchdog is not None:
+            self.watchdog.start()
+
+        if not self.silent:
+            print("Webhook listener started on port", self.port)
+
+    async def stop(self, drain: bool = True) -> None:
+        """ Stop the webhook listener.
+        :param: drain: Whether to wait for the queued votes to be handled before stopping the workers
+        """
+        if self.__server is not None:
+            self.__server.stop()
+            await self.__server.close_all_connections()
+        else:
+            await self.__stop_processes()
+
+        if self.__queue is not None and drain:
+            await self.__queue.join()
+
+        for task in self.__worker_tasks:
+            task.cancel()
+
+        self.__worker_tasks = []
+
+        if self.watchdog is not None:
+            await self.watchdog.stop()
+
+        if self.deduplicator is not None:
+            self.deduplicator.close()
+
+        if self.journal is not None:
+            self.journal.close()
+
+        if self.leaderboard is not None:
+            self.leaderboard.close()
+
+        if self.history is not None:
+            self.history.close()
+
+        if self.capture is not None:
+            self.capture.close()
+
+    async def __start_processes(self) -> None:
+        self.__ipc_directory = tempfile.mkdtemp(prefix="diffcord-")
+        socket_path = os.path.join(self.__ipc_directory, "votes.sock")
+        self.__ipc_server = await asyncio.start_unix_server(self.__receive_forwarded, socket_path)
+
+        self.__processes = [
+            await spawn_listener_process(self.port, self.host, self.verify_code, socket_path, self.ipc_batch_size,
+                                         self.ipc_batch_delay, self.log_level, self.silent, self.engine,
+                                         self.max_body_size)
+            for _ in range(self.processes)
+        ]
+
+    async def __stop_processes(self) -> None:
+        if self.__ipc_server is not None:
+            self.__ipc_server.close()
+
+        # listener processes exit once their IPC stream is closed
+        for writer in list(self.__ipc_writers):
+            writer.close()
+
+        for process in self.__processes:
+            try:
+                await asyncio.wait_for(process.wait(), 5)
+            except asyncio.TimeoutError:
+                process.terminate()
+                await process.wait()
+
+        self.__processes = []
+
+        if self.__ipc_server is not None:
+            await self.__ipc_server.wait_closed()
+            self.__ipc_server = None
+
+        if self.__ipc_directory is not None:
+            shutil.rmtree(self.__ipc_directory, ignore_errors=True)
+            self.__ipc_directory = None
+
+    def __repr__(self):
+        return f"<WebhookListener port={self.port}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,236 @@
+import bisect
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+""" The default upper bounds (in seconds) of latency histogram buckets. """
+
+MetricsCallback = Callable[[str, Dict[str, str], float], None]
+
+
+class Metric:
+    """ A named family of samples, one per combination of label values.
+    """
+
+    type: str = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name: str = name
+        """ The name of the metric. """
+
+        self.help: str = help
+        """ A short description of the metric. """
+
+        self.labels: Tuple[str, ...] = tuple(labels)
+        """ The names of the labels of the metric. """
+
+        self._callbacks: List[MetricsCallback] = []
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        """ The current samples of the metric.
+        :return: (sample name, labels, value) tuples
+        """
+        return ()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects the labels {self.labels}, got {tuple(labels)}")
+
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _notify(self, labels: Dict[str, str], value: float) -> None:
+        for callback in self._callbacks:
+            callback(self.name, labels, value)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} name={self.name} labels={self.labels}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class Counter(Metric):
+    """ A value that only goes up, e.g. the number of received votes.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.__values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """ Increase the counter.
+        :param: amount: The amount to increase the counter by
+        :param: labels: The label values of the sample to increase
+        """
+        key = self._key(labels)
+        self.__values[key] = self.__values.get(key, 0.0) + amount
+
+        if self._callbacks:
+            self._notify(labels, amount)
+
+    def value(self, **labels: str) -> float:
+        """ The current value of the counter.
+        :param: labels: The label values of the sample
+        """
+        return self.__values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        for key, value in self.__values.items():
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram(Metric):
+    """ Counts observations (e.g. request latencies) into buckets with upper bounds.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        """ The upper bounds of the buckets, excluding +Inf. """
+
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self.__values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """ Record an observation.
+        :param: value: The observed value
+        :param: labels: The label values of the sample
+        """
+        key = self._key(labels)
+        entry = self.__values.get(key)
+
+        if entry is None:
+            entry = self.__values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+        if self._callbacks:
+            self._notify(labels, value)
+
+    def count(self, **labels: str) -> int:
+        """ The number of observations.
+        :param: labels: The label values of the sample
+        """
+        entry = self.__values.get(self._key(labels))
+        return sum(entry[0]) if entry is not None else 0
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        for key, (counts, total) in self.__values.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield self.name + "_bucket", dict(labels, le=_format_value(bound)), cumulative
+
+            yield self.name + "_sum", labels, total[0]
+            yield self.name + "_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """ Collects the counters and histograms of the SDK (API requests, webhook votes, stats uploads).
+
+    Pass the same registry to Client(metrics=...) and VoteWebhookListener(metrics=...). Metrics can be served in the
+    Prometheus text format (see VoteWebhookListener(metrics_path=...) and render) or forwarded as they are recorded
+    through add_callback.
+    """
+
+    def __init__(self, prefix: str = "diffcord_"):
+        self.prefix: str = prefix
+        """ The prefix of every metric name. """
+
+        self.__metrics: Dict[str, Metric] = {}
+        self.__callbacks: List[MetricsCallback] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        """ Get or create a counter.
+        :param: name: The name of the counter, without the prefix
+        :param: help: A short description of the counter
+        :param: labels: The names of the labels of the counter
+        :return: The counter
+        """
+        return self.__register(Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """ Get or create a histogram.
+        :param: name: The name of the histogram, without the prefix
+        :param: help: A short description of the histogram
+        :param: labels: The names of the labels of the histogram
+        :param: buckets: The upper bounds of the buckets
+        :return: The histogram
+        """
+        return self.__register(Histogram, name, help, labels, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        """ Get a registered metric.
+        :param: name: The name of the metric, without the prefix
+        :return: The metric, None if it is not registered
+        """
+        return self.__metrics.get(self.prefix + name)
+
+    def add_callback(self, callback: MetricsCallback) -> None:
+        """ Add a callback called with (metric name, labels, value) for every counter increase and observation.
+        :param: callback: The callback, it must not block
+        """
+        self.__callbacks.append(callback)
+
+    def remove_callback(self, callback: MetricsCallback) -> None:
+        """ Remove a callback added with add_callback.
+        :param: callback: The callback
+        """
+        self.__callbacks.remove(callback)
+
+    def render(self) -> str:
+        """ Render every metric in the Prometheus text exposition format.
+        :return: The metrics
+        """
+        lines = []
+
+        for metric in self.__metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+
+            for name, labels, value in metric.samples():
+                if labels:
+                    formatted = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels.items())
+                    lines.append(f"{name}{{{formatted}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def __register(self, metric_type, name: str, help: str, labels: Sequence[str], **kwargs) -> Metric:
+        name = self.prefix + name
+        metric = self.__metrics.get(name)
+
+        if metric is None:
+            metric = self.__metrics[name] = metric_type(name, help, labels, **kwargs)
+            # shared, so that callbacks added later apply to existing metrics too
+            metric._callbacks = self.__callbacks
+        elif type(metric) is not metric_type or metric.labels != tuple(labels):
+            raise ValueError(f"{name} is already registered as a {metric.type} with the labels {metric.labels}")
+
+        return metric
+
+    def __repr__(self):
+        return f"<MetricsRegistry metrics={len(self.__metrics)}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
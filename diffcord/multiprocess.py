@@ -0,0 +1,280 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import pickle
+import struct
+import sys
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Set, Tuple
+
+from diffcord.httpserver import DEFAULT_MAX_BODY_SIZE, AsyncioHTTPServer, bind_sockets
+from diffcord.serialization import loads
+from diffcord.vote import UserBotVote
+
+if TYPE_CHECKING:
+    from diffcord.profiling import Profiler
+
+# every frame sent over the IPC socket is a length prefixed pickled list of (vote, raw payload) tuples, the bot
+# process answers each with a frame of the (status, headers) of every vote, in the same order
+_FRAME_LENGTH = struct.Struct("<I")
+
+_CONFIG_VARIABLE = "DIFFCORD_LISTENER_CONFIG"
+
+
+def parse_vote(verify_code: Optional[str], authorization: Optional[str], body: bytes,
+               silent: bool = True, profiler: "Profiler" = None) -> Tuple[int, Optional[UserBotVote]]:
+    """ Validate an incoming vote webhook.
+    :param: verify_code: The verification code of the webhook listener
+    :param: authorization: The Authorization header of the request
+    :param: body: The body of the request
+    :param: silent: Whether to not print invalid payloads to the console
+    :param: profiler: The profiler timing the auth, parse and vote stages, None to not time them
+    :return: The status code to answer with if the request is invalid (otherwise 200) and the vote
+    """
+    if profiler is not None:
+        return _parse_vote_profiled(verify_code, authorization, body, silent, profiler)
+
+    if verify_code is not None and authorization != verify_code:
+        return 403, None
+
+    try:
+        return 200, UserBotVote.from_json(body)
+    except (ValueError, TypeError) as e:
+        if not silent:
+            print("Invalid vote payload:", e)
+
+        return 400, None
+
+
+def _parse_vote_profiled(verify_code: Optional[str], authorization: Optional[str], body: bytes, silent: bool,
+                         profiler: "Profiler") -> Tuple[int, Optional[UserBotVote]]:
+    # the steps of UserBotVote.from_json, timed one by one
+    started = profiler.start()
+    authorized = verify_code is None or authorization == verify_code
+    profiler.record("webhook.auth", started, authorized=authorized)
+
+    if not authorized:
+        return 403, None
+
+    with profiler.stage("webhook.parse", size=len(body)):
+        try:
+            payload = loads(body)
+        except ValueError as e:
+            payload, error = None, e
+
+    if isinstance(payload, dict):
+        try:
+            with profiler.stage("webhook.vote"):
+                return 200, UserBotVote(**payload)
+        except TypeError as e:
+            error = e
+    elif payload is not None:
+        error = TypeError("vote payload must be an object")
+
+    if not silent:
+        print("Invalid vote payload:", error)
+
+    return 400, None
+
+
+async def read_vote_batch(reader: asyncio.StreamReader) -> Optional[List[Tuple[UserBotVote, bytes]]]:
+    """ Read a batch of votes forwarded by a listener process.
+    :param: reader: The IPC stream
+    :return: The votes and their raw payloads, None once the stream is closed
+    """
+    return await _read_frame(reader)
+
+
+async def write_vote_statuses(writer: asyncio.StreamWriter, statuses: List[Tuple[int, Dict[str, str]]]) -> None:
+    """ Answer a batch of votes read with read_vote_batch.
+    :param: writer: The IPC stream
+    :param: statuses: The status code and headers to answer the webhook of each vote of the batch with, in order
+    """
+    frame = pickle.dumps(statuses, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_FRAME_LENGTH.pack(len(frame)) + frame)
+    await writer.drain()
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Any:
+    try:
+        length, = _FRAME_LENGTH.unpack(await reader.readexactly(_FRAME_LENGTH.size))
+        return pickle.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class VoteBatchForwarder:
+    """ Forwards votes from a listener process to the bot process in batches.
+
+    A batch is sent once it holds batch_size votes or its oldest vote waited batch_delay, whichever comes first. Each
+    vote is answered with the status the bot process reports for it (e.g. 500 if journaling or handling it failed),
+    which run must be receiving.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, batch_size: int,
+                 batch_delay: float):
+        self.batch_size: int = batch_size
+        """ The maximum number of votes per batch. """
+
+        self.batch_delay: float = batch_delay
+        """ The longest time (in seconds) a vote waits for its batch to fill up. """
+
+        self.__reader = reader
+        self.__writer = writer
+        self.__batch: List[Tuple[UserBotVote, bytes]] = []
+        self.__answered: Optional[asyncio.Future] = None
+        self.__timer: Optional[asyncio.TimerHandle] = None
+        self.__lock = asyncio.Lock()
+        # the batches sent and not answered yet, oldest first
+        self.__pending: Deque[asyncio.Future] = deque()
+        self.__closed: bool = False
+        # the flushes started by the batch timer, referenced until they finish
+        self.__flushing: Set[asyncio.Task] = set()
+
+    async def forward(self, vote: UserBotVote, body: bytes) -> Tuple[int, Dict[str, str]]:
+        """ Queue a vote and wait until the bot process dispatched it.
+        :param: vote: The vote
+        :param: body: The raw payload of the vote
+        :return: The status code and headers to answer the webhook with
+        """
+        if self.__closed:
+            raise ConnectionError("the bot process closed the IPC stream")
+
+        loop = asyncio.get_running_loop()
+
+        if self.__answered is None:
+            self.__answered = loop.create_future()
+            self.__timer = loop.call_later(self.batch_delay, self.__flush_later)
+
+        answered = self.__answered
+        index = len(self.__batch)
+        self.__batch.append((vote, body))
+
+        if len(self.__batch) >= self.batch_size:
+            await self.__flush()
+
+        return (await answered)[index]
+
+    async def run(self) -> None:
+        """ Receive the statuses of the forwarded votes until the bot process closes the IPC stream.
+        """
+        try:
+            while True:
+                statuses = await _read_frame(self.__reader)
+
+                if statuses is None or not self.__pending:
+                    break
+
+                answered = self.__pending.popleft()
+
+                if not answered.done():
+                    answered.set_result(statuses)
+        finally:
+            self.__closed = True
+
+            while self.__pending:
+                answered = self.__pending.popleft()
+
+                if not answered.done():
+                    answered.set_exception(ConnectionError("the bot process closed the IPC stream"))
+
+    def __flush_later(self) -> None:
+        task = asyncio.ensure_future(self.__flush())
+        self.__flushing.add(task)
+        task.add_done_callback(self.__flushing.discard)
+
+    async def __flush(self) -> None:
+        if self.__answered is None:
+            return
+
+        batch, self.__batch = self.__batch, []
+        answered, self.__answered = self.__answered, None
+        self.__timer.cancel()
+
+        try:
+            frame = pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # batches must not interleave on the stream, and are answered in the order they were written
+            async with self.__lock:
+                if self.__closed:
+                    raise ConnectionError("the bot process closed the IPC stream")
+
+                self.__pending.append(answered)
+                self.__writer.write(_FRAME_LENGTH.pack(len(frame)) + frame)
+                await self.__writer.drain()
+        except Exception as e:
+            if not answered.done():
+                answered.set_exception(e)
+
+
+async def spawn_listener_process(port: int, host: str, verify_code: Optional[str], socket_path: str,
+                                 batch_size: int, batch_delay: datetime.timedelta, log_level: int,
+                                 silent: bool, engine: str = "tornado",
+                                 max_body_size: int = DEFAULT_MAX_BODY_SIZE) -> asyncio.subprocess.Process:
+    """ Start a webhook listener worker process, see VoteWebhookListener(processes=...).
+
+    The process binds the webhook port with SO_REUSEPORT (so that the kernel balances connections across the
+    processes), validates incoming webhooks and forwards the votes to the bot process over a unix socket. It is started
+    as a fresh interpreter, so the bot's main module is never imported again.
+    """
+    config = {
+        "port": port,
+        "host": host,
+        "verify_code": verify_code,
+        "socket_path": socket_path,
+        "batch_size": batch_size,
+        "batch_delay": batch_delay.total_seconds(),
+        "log_level": log_level,
+        "silent": silent,
+        "engine": engine,
+        "max_body_size": max_body_size,
+    }
+
+    # passed through the environment, so that the verification code does not show up in the process list
+    env = dict(os.environ, **{_CONFIG_VARIABLE: json.dumps(config)})
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-c", "from diffcord.multiprocess import run_listener_process; run_listener_process()", env=env)
+
+
+def run_listener_process() -> None:
+    """ The entry point of a webhook listener worker process started by spawn_listener_process.
+    """
+    asyncio.run(_serve(**json.loads(os.environ[_CONFIG_VARIABLE])))
+
+
+async def _serve(port: int, host: str, verify_code: Optional[str], socket_path: str, batch_size: int,
+                 batch_delay: float, log_level: int, silent: bool, engine: str, max_body_size: int) -> None:
+    logging.getLogger("tornado.access").setLevel(log_level)
+
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    forwarder = VoteBatchForwarder(reader, writer, batch_size, batch_delay)
+
+    async def receive(authorization: Optional[str], body: bytes) -> Tuple[int, Dict[str, str]]:
+        status, vote = parse_vote(verify_code, authorization, body, silent)
+
+        if vote is None:
+            return status, {}
+
+        try:
+            return await forwarder.forward(vote, body)
+        except Exception as e:
+            if not silent:
+                print("Error forwarding vote:", e)
+
+            return 500, {}
+
+    if engine == "asyncio":
+        server = AsyncioHTTPServer(receive, max_body_size=max_body_size)
+    else:
+        from diffcord.webhook import create_webhook_server
+        server = create_webhook_server(receive, max_body_size=max_body_size)
+
+    server.add_sockets(bind_sockets(port, host, reuse_port=True))
+
+    # the bot process closes the socket when it stops or dies
+    await forwarder.run()
+
+    server.stop()
+    writer.close()
@@ -0,0 +1,353 @@
+import asyncio
+import datetime
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from diffcord.metrics import MetricsRegistry
+from diffcord.vote import UserBotVote
+
+
+class StageTiming(NamedTuple):
+    """ The timing of one stage of processing a webhook or an API request.
+    """
+
+    stage: str
+    """ The name of the stage, e.g. "webhook.parse" or "api.http". """
+
+    start_time: int
+    """ The unix time (in nanoseconds) at which the stage started. """
+
+    duration: float
+    """ The time (in seconds) the stage took. """
+
+    attributes: Dict[str, Any]
+    """ Details of the stage, e.g. the route of an API request or the error raised by a vote handler. """
+
+
+StageHook = Callable[[StageTiming], None]
+
+
+class Profiler:
+    """ Times the stages of processing vote webhooks and API requests and passes each timing to hooks.
+
+    Attach it with VoteWebhookListener(profiler=...) and HTTPApi or Client(profiler=...). The webhook stages are
+    webhook.auth, webhook.parse (JSON), webhook.vote (UserBotVote construction) and webhook.handler, the API stages
+    are api.request (the whole make_request call), api.rate_limit_wait, api.http (one HTTP exchange) and api.parse.
+    Without a profiler no stage is timed.
+    """
+
+    def __init__(self, hooks: Iterable[StageHook] = (), metrics: MetricsRegistry = None):
+        self.hooks: List[StageHook] = list(hooks)
+        """ The functions called with every StageTiming (must not be async). """
+
+        self.metrics: Optional[MetricsRegistry] = metrics
+        """ The registry a stage_duration_seconds histogram is recorded in, None to not record it. """
+
+        if metrics is not None:
+            self.__stage_metric = metrics.histogram("stage_duration_seconds", "Processing time by stage", ("stage",))
+
+    def add_hook(self, hook: StageHook) -> None:
+        """ Register a function to be called with every StageTiming.
+        :param: hook: The function to call (must not be async)
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: StageHook) -> None:
+        """ Unregister a function previously registered with add_hook.
+        :param: hook: The function to unregister
+        """
+        self.hooks.remove(hook)
+
+    @staticmethod
+    def start() -> Tuple[int, float]:
+        """ Mark the start of a stage, to be passed to record once it ends.
+        :return: The start of the stage
+        """
+        return time.time_ns(), time.perf_counter()
+
+    def record(self, stage: str, started: Tuple[int, float], **attributes: Any) -> float:
+        """ Record a stage which just ended.
+        :param: stage: The name of the stage
+        :param: started: The start of the stage, as returned by start
+        :param: attributes: Details of the stage
+        :return: The time (in seconds) the stage took
+        """
+        start_time, start = started
+        duration = time.perf_counter() - start
+
+        if self.metrics is not None:
+            self.__stage_metric.observe(duration, stage=stage)
+
+        timing = StageTiming(stage, start_time, duration, attributes)
+
+        for hook in self.hooks:
+            try:
+                hook(timing)
+            except Exception as e:
+                print("Error in profiler hook:", e)
+
+        return duration
+
+    @contextmanager
+    def stage(self, stage: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """ Time the code in a with block as a stage.
+        :param: stage: The name of the stage
+        :param: attributes: Details of the stage, more can be added to the yielded dict
+        """
+        started = self.start()
+
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(stage, started, **attributes)
+
+    def __repr__(self):
+        return f"<Profiler hooks={len(self.hooks)}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class OpenTelemetryEmitter:
+    """ A Profiler hook which reports every stage as an OpenTelemetry span.
+
+    Uses the given tracer, or the tracer of the globally configured OpenTelemetry SDK (requires the opentelemetry-api
+    package, pip install diffcord[tracing]). Spans are created once their stage ended, with its actual start and end
+    time, so they appear as siblings under the span active at that moment.
+    """
+
+    def __init__(self, tracer: Any = None):
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError as e:
+                raise ImportError("the OpenTelemetry emitter requires opentelemetry-api, install it with: "
+                                  "pip install diffcord[tracing]") from e
+
+            tracer = trace.get_tracer("diffcord")
+
+        self.tracer: Any = tracer
+        """ The OpenTelemetry tracer the spans are created with. """
+
+    def __call__(self, timing: StageTiming) -> None:
+        attributes = {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+                      for key, value in timing.attributes.items()}
+        span = self.tracer.start_span(timing.stage, start_time=timing.start_time, attributes=attributes)
+        span.end(end_time=timing.start_time + int(timing.duration * 1e9))
+
+    def __repr__(self):
+        return f"<OpenTelemetryEmitter tracer={self.tracer}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class SlowHandlerReport:
+    """ A vote handler which ran longer than the threshold of a SlowHandlerWatchdog.
+    """
+
+    def __init__(self, vote: UserBotVote, task: Optional[asyncio.Task], elapsed: float, stack: str):
+        self.vote: UserBotVote = vote
+        """ The vote being handled. """
+
+        self.task: Optional[asyncio.Task] = task
+        """ The task running the handler. """
+
+        self.elapsed: float = elapsed
+        """ The time (in seconds) the handler had been running when it was flagged. """
+
+        self.stack: str = stack
+        """ The formatted stack of the handler when it was flagged, innermost call last. """
+
+    def __repr__(self):
+        return f"<SlowHandlerReport vote_id={self.vote.vote_id} elapsed={self.elapsed:.3f}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class SlowHandlerWatchdog:
+    """ Flags vote handlers running longer than a threshold, with the stack they are waiting in.
+
+    Attach it with VoteWebhookListener(watchdog=...). Running handlers are checked every half threshold, each slow
+    handler is reported once to on_slow. With sample_duration, the first slow handler of an incident also starts a
+    sampling profiler: a thread samples the stack of the event loop thread every sample_interval, which shows where
+    the time goes even when a handler blocks the loop, and passes the collapsed stacks ("outer;inner" -> samples,
+    the format of flame graph tools) to on_profile.
+
+    Handlers blocking the event loop are only flagged once they yield to it again.
+    """
+
+    def __init__(self, threshold: datetime.timedelta = datetime.timedelta(seconds=5),
+                 on_slow: Callable[[SlowHandlerReport], None] = None,
+                 sample_duration: datetime.timedelta = None,
+                 sample_interval: datetime.timedelta = datetime.timedelta(milliseconds=5),
+                 on_profile: Callable[[Counter], None] = None, stack_limit: int = 30):
+        self.threshold: float = threshold.total_seconds()
+        """ The time (in seconds) after which a running handler is flagged. """
+
+        self.on_slow: Callable[[SlowHandlerReport], None] = on_slow
+        """ A function called with every slow handler (must not be async), prints it if None. """
+
+        self.sample_duration: Optional[float] = sample_duration.total_seconds() if sample_duration is not None else None
+        """ The time (in seconds) the event loop is sampled for after a slow handler, None to not sample it. """
+
+        self.sample_interval: float = sample_interval.total_seconds()
+        """ The time (in seconds) between two samples. """
+
+        self.on_profile: Callable[[Counter], None] = on_profile
+        """ A function called with the collapsed stacks once sampling ended (must not be async). """
+
+        self.stack_limit: int = stack_limit
+        """ The maximum number of frames in a reported stack. """
+
+        self.flagged: int = 0
+        """ The number of handlers flagged as slow. """
+
+        # token -> (task, vote, started at, flagged)
+        self.__running: Dict[int, List[Any]] = {}
+        self.__next_token: int = 0
+        self.__task: Optional[asyncio.Task] = None
+        self.__sampler: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> int:
+        """ The number of handlers currently running.
+        """
+        return len(self.__running)
+
+    @property
+    def sampling(self) -> bool:
+        """ Whether the event loop is currently being sampled.
+        """
+        return self.__sampler is not None and self.__sampler.is_alive()
+
+    def begin(self, vote: UserBotVote) -> int:
+        """ Mark the start of handling a vote in the current task.
+        :param: vote: The vote being handled
+        :return: The token to pass to end
+        """
+        self.__next_token += 1
+        self.__running[self.__next_token] = [asyncio.current_task(), vote, time.monotonic(), False]
+        return self.__next_token
+
+    def end(self, token: int) -> None:
+        """ Mark the end of handling a vote.
+        :param: token: The token returned by begin
+        """
+        self.__running.pop(token, None)
+
+    def start(self) -> asyncio.Task:
+        """ Start checking the running handlers in the background.
+        """
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.ensure_future(self.__run(threading.get_ident()))
+
+        return self.__task
+
+    async def stop(self) -> None:
+        """ Stop checking the running handlers.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+
+            self.__task = None
+
+    def check(self) -> List[SlowHandlerReport]:
+        """ Flag the handlers which became slow since the last check.
+        :return: The reports of the newly flagged handlers
+        """
+        now = time.monotonic()
+        reports = []
+
+        for entry in list(self.__running.values()):
+            task, vote, started_at, flagged = entry
+
+            if flagged or now - started_at < self.threshold:
+                continue
+
+            entry[3] = True
+            self.flagged += 1
+            reports.append(SlowHandlerReport(vote, task, now - started_at, self.__format_stack(task)))
+
+        return reports
+
+    async def __run(self, loop_thread: int) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await asyncio.sleep(self.threshold / 2)
+
+            for report in self.check():
+                if self.sample_duration is not None and not self.sampling:
+                    self.__sampler = threading.Thread(target=self.__sample, args=(loop, loop_thread), daemon=True,
+                                                      name="diffcord-watchdog-sampler")
+                    self.__sampler.start()
+
+                if self.on_slow is not None:
+                    self.on_slow(report)
+                else:
+                    print(f"Vote handler for {report.vote.vote_id} running for {report.elapsed:.1f}s:\n"
+                          f"{report.stack}")
+
+    def __format_stack(self, task: Optional[asyncio.Task]) -> str:
+        if task is None:
+            return ""
+
+        # Task.get_stack only returns the outermost coroutine, follow what each coroutine awaits instead
+        awaitable = task.get_coro() if hasattr(task, "get_coro") else task._coro
+        frames = []
+
+        while awaitable is not None and len(frames) < self.stack_limit:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+
+            if frame is None:
+                break
+
+            frames.append(frame)
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+
+        return "".join(traceback.StackSummary.extract((frame, frame.f_lineno) for frame in frames).format())
+
+    def __sample(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> None:
+        samples: Counter = Counter()
+        until = time.monotonic() + self.sample_duration
+
+        while time.monotonic() < until:
+            frame = sys._current_frames().get(loop_thread)
+            names = []
+
+            while frame is not None:
+                names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                frame = frame.f_back
+
+            if names:
+                samples[";".join(reversed(names))] += 1
+
+            time.sleep(self.sample_interval)
+
+        if self.on_profile is not None:
+            try:
+                loop.call_soon_threadsafe(self.on_profile, samples)
+            except RuntimeError:
+                # the event loop was closed meanwhile
+                pass
+
+    def __repr__(self):
+        return f"<SlowHandlerWatchdog threshold={self.threshold} running={len(self.__running)} flagged={self.flagged}>"
+
+    def __str__(self):
+        return self.__repr__()
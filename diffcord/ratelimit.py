@@ -0,0 +1,286 @@
+import asyncio
+import email.utils
+import enum
+import heapq
+import itertools
+import re
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class Priority(enum.IntEnum):
+    """ The priority of a queued request, lower values are sent first.
+    """
+
+    INTERACTIVE = 0
+    """ Requests made while a user is waiting on a response (e.g. slash commands). """
+
+    DEFAULT = 1
+    """ Requests without a specific priority. """
+
+    BACKGROUND = 2
+    """ Periodic background work (e.g. stats updates). """
+
+
+class RouteBucket:
+    """ Represents the rate limit state of a single API route.
+    """
+
+    def __init__(self, route: str):
+        self.route: str = route
+        """ The route key this bucket tracks. """
+
+        self.limit: Optional[int] = None
+        """ The number of requests allowed per window, if announced by the API. """
+
+        self.remaining: Optional[int] = None
+        """ The number of requests left in the current window, None when unknown. """
+
+        self.reset_at: float = 0.0
+        """ The event loop time at which the current window resets. """
+
+    def wait_time(self, now: float) -> float:
+        """ Get the time (in seconds) until a request may be sent on this route.
+        :param: now: The current event loop time
+        :return: The time to wait, 0 when a request may be sent right away
+        """
+        if self.reset_at <= now:
+            # the window has passed, the next response announces the new one
+            self.remaining = None
+            return 0.0
+
+        if self.remaining is None or self.remaining > 0:
+            return 0.0
+
+        return self.reset_at - now
+
+    def consume(self) -> None:
+        """ Consume one request from the current window.
+        """
+        if self.remaining is not None and self.remaining > 0:
+            self.remaining -= 1
+
+    def __repr__(self):
+        return f"<RouteBucket route={self.route} limit={self.limit} remaining={self.remaining} reset_at={self.reset_at}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class RequestScheduler:
+    """ Queues requests per route and only releases them while the route's rate limit allows it.
+
+    Waiting requests are released in priority order, so interactive calls overtake background work whenever a route
+    is rate limited or the concurrency limit is reached.
+    """
+
+    __ROUTE_ID_PATTERN = re.compile(r"/\d+")
+
+    def __init__(self, max_concurrency: int = None, max_retries: int = 3, max_retry_after: float = 60.0,
+                 default_retry_after: float = 1.0):
+        self.max_concurrency: Optional[int] = max_concurrency
+        """ The maximum number of requests in flight at once, None for no limit. """
+
+        self.max_retries: int = max_retries
+        """ The number of times a rate limited (429) request is retried before RateLimitException is raised. """
+
+        self.max_retry_after: float = max_retry_after
+        """ The longest Retry-After (in seconds) that will be waited out instead of raising RateLimitException. """
+
+        self.default_retry_after: float = default_retry_after
+        """ The base backoff (in seconds) used when a 429 response has no Retry-After header. """
+
+        self.__buckets: Dict[str, RouteBucket] = {}
+        self.__waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        self.__sequence = itertools.count()
+        self.__in_flight: int = 0
+        self.__wakeup: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def in_flight(self) -> int:
+        """ The number of requests currently in flight.
+        """
+        return self.__in_flight
+
+    @property
+    def queued(self) -> int:
+        """ The number of requests waiting to be sent.
+        """
+        return sum(1 for *_, future in self.__waiters if not future.done())
+
+    @classmethod
+    def route_key(cls, method: str, path: str) -> str:
+        """ Get the rate limit key of a request, ids in the path are collapsed so that they share one bucket.
+        :param: method: The method of the request
+        :param: path: The path of the request
+        :return: The route key
+        """
+        return f"{method.upper()} {cls.__ROUTE_ID_PATTERN.sub('/{id}', path)}"
+
+    def bucket(self, route: str) -> RouteBucket:
+        """ Get the rate limit bucket of a route.
+        :param: route: The route key
+        :return: The RouteBucket of the route
+        """
+        bucket = self.__buckets.get(route)
+
+        if bucket is None:
+            bucket = self.__buckets[route] = RouteBucket(route)
+
+        return bucket
+
+    async def acquire(self, route: str, priority: Priority = Priority.DEFAULT) -> None:
+        """ Wait until a request may be sent on a route. Every acquire must be followed by a release.
+        :param: route: The route key
+        :param: priority: The priority of the request
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.__waiters, (int(priority), next(self.__sequence), route, future))
+        self.__pump()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(route)
+            raise
+
+    def try_acquire(self, route: str) -> bool:
+        """ Take a request slot on a route only if one is free right away, without overtaking waiting requests.
+        A successful try_acquire must be followed by a release.
+        :param: route: The route key
+        :return: Whether a slot was taken
+        """
+        if any(not future.done() for *_, future in self.__waiters):
+            return False
+
+        if self.max_concurrency is not None and self.__in_flight >= self.max_concurrency:
+            return False
+
+        bucket = self.bucket(route)
+
+        if bucket.wait_time(asyncio.get_running_loop().time()) > 0:
+            return False
+
+        bucket.consume()
+        self.__in_flight += 1
+        return True
+
+    def release(self, route: str) -> None:
+        """ Mark a request on a route as finished.
+        :param: route: The route key
+        """
+        self.__in_flight -= 1
+        self.__pump()
+
+    def update(self, route: str, response: "httpx.Response", attempt: int = 0) -> Optional[float]:
+        """ Update the rate limit state of a route from the headers of a response.
+        :param: route: The route key
+        :param: response: The response received on the route
+        :param: attempt: The number of times the request has already been retried
+        :return: The time (in seconds) to wait before retrying if the response is a 429, otherwise None
+        """
+        bucket = self.bucket(route)
+        now = asyncio.get_running_loop().time()
+        headers = response.headers
+
+        limit = self.__parse_float(headers.get("X-RateLimit-Limit"))
+        if limit is not None:
+            bucket.limit = int(limit)
+
+        remaining = self.__parse_float(headers.get("X-RateLimit-Remaining"))
+        if remaining is not None:
+            bucket.remaining = int(remaining)
+
+        reset_after = self.__parse_float(headers.get("X-RateLimit-Reset-After"))
+        if reset_after is None:
+            reset = self.__parse_float(headers.get("X-RateLimit-Reset"))
+            if reset is not None:
+                # large values are unix timestamps, small values are relative
+                reset_after = reset - time.time() if reset > 1e9 else reset
+
+        if reset_after is not None:
+            bucket.reset_at = now + max(reset_after, 0.0)
+
+        if response.status_code != 429:
+            return None
+
+        retry_after = self.__parse_retry_after(headers.get("Retry-After"))
+        if retry_after is None:
+            retry_after = reset_after if reset_after is not None else self.default_retry_after * 2 ** attempt
+
+        bucket.remaining = 0
+        bucket.reset_at = max(bucket.reset_at, now + retry_after)
+        return retry_after
+
+    def should_retry(self, retry_after: float, attempt: int) -> bool:
+        """ Whether a rate limited request should be queued again instead of raising.
+        :param: retry_after: The time (in seconds) the API asked to wait
+        :param: attempt: The number of times the request has already been retried
+        """
+        return attempt < self.max_retries and retry_after <= self.max_retry_after
+
+    def __pump(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        blocked = []
+        next_wakeup = None
+
+        while self.__waiters and (self.max_concurrency is None or self.__in_flight < self.max_concurrency):
+            item = heapq.heappop(self.__waiters)
+            route, future = item[2], item[3]
+
+            if future.done():
+                continue
+
+            bucket = self.bucket(route)
+            wait = bucket.wait_time(now)
+
+            if wait > 0:
+                blocked.append(item)
+                next_wakeup = wait if next_wakeup is None else min(next_wakeup, wait)
+                continue
+
+            bucket.consume()
+            self.__in_flight += 1
+            future.set_result(None)
+
+        for item in blocked:
+            heapq.heappush(self.__waiters, item)
+
+        if self.__wakeup is not None:
+            self.__wakeup.cancel()
+            self.__wakeup = None
+
+        if next_wakeup is not None:
+            self.__wakeup = loop.call_later(next_wakeup, self.__pump)
+
+    @staticmethod
+    def __parse_float(value: Optional[str]) -> Optional[float]:
+        if value is None:
+            return None
+
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @classmethod
+    def __parse_retry_after(cls, value: Optional[str]) -> Optional[float]:
+        seconds = cls.__parse_float(value)
+        if seconds is not None or value is None:
+            return seconds
+
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def __repr__(self):
+        return f"<RequestScheduler in_flight={self.__in_flight} queued={self.queued} routes={len(self.__buckets)}>"
+
+    def __str__(self):
+        return self.__repr__()
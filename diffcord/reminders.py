@@ -0,0 +1,225 @@
+import asyncio
+import datetime
+import heapq
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from diffcord.vote import UserBotVote, UserVoteInformation
+
+
+class VoteReminderScheduler:
+    """ Calls on_vote_available for each user as soon as they can vote again, e.g. to send "you can vote" reminders.
+
+    The time each user can vote again is kept in a local index, fed by vote webhooks (observe_vote) and vote
+    information lookups (observe_vote_info), so no user has to be polled. Pending reminders are ordered in a heap,
+    scheduling and firing a reminder costs O(log n). A newer vote or lookup of a user replaces their pending reminder.
+
+    When a path is given the index is saved there every snapshot_interval and on stop, and loaded again on creation.
+    Reminders which became due while the bot was offline are sent right after start.
+    """
+
+    def __init__(self, on_vote_available: Callable[[int], Awaitable[None]],
+                 vote_cooldown: datetime.timedelta = datetime.timedelta(hours=12), path: str = None,
+                 snapshot_interval: datetime.timedelta = datetime.timedelta(minutes=5), max_concurrency: int = 100,
+                 on_failure: Callable[[int, Exception], Awaitable[None]] = None):
+        self.on_vote_available: Callable[[int], Awaitable[None]] = on_vote_available
+        """ The function called with the id of a user who can vote again (must be async). """
+
+        self.vote_cooldown: float = vote_cooldown.total_seconds()
+        """ The time (in seconds) after a vote before the user can vote again. """
+
+        self.path: Optional[str] = path
+        """ The file in which the pending reminders are saved, None to only keep them in memory. """
+
+        self.snapshot_interval: float = snapshot_interval.total_seconds()
+        """ The time (in seconds) between two saves of the pending reminders. """
+
+        self.max_concurrency: int = max_concurrency
+        """ The maximum number of on_vote_available calls running at once. """
+
+        self.on_failure: Callable[[int, Exception], Awaitable[None]] = on_failure
+        """ A function to call with the user id and the exception when on_vote_available raised (must be async). """
+
+        self.fired: int = 0
+        """ The number of reminders sent. """
+
+        # user id -> unix time the user can vote again, the heap may hold outdated entries which are skipped
+        self.__available_at: Dict[int, float] = {}
+        self.__heap: List[Tuple[float, int]] = []
+        self.__changed: Optional[asyncio.Event] = None
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__task: Optional[asyncio.Task] = None
+        self.__reminders: Set[asyncio.Task] = set()
+
+        if self.path is not None:
+            self.__load()
+
+    @property
+    def pending(self) -> int:
+        """ The number of users waiting for a reminder.
+        """
+        return len(self.__available_at)
+
+    def schedule(self, user_id: Union[str, int], available_at: float) -> None:
+        """ Remind a user at a given time, replacing their pending reminder.
+        :param: user_id: The id of the user
+        :param: available_at: The unix time at which the user can vote again
+        """
+        user_id = int(user_id)
+        self.__available_at[user_id] = available_at
+
+        # only wake the scheduler when the next reminder is now earlier
+        if self.__changed is not None and (not self.__heap or available_at < self.__heap[0][0]):
+            self.__changed.set()
+
+        heapq.heappush(self.__heap, (available_at, user_id))
+
+        if len(self.__heap) > 2 * len(self.__available_at) + 1000:
+            self.__heap = [(at, user) for user, at in self.__available_at.items()]
+            heapq.heapify(self.__heap)
+
+    def cancel(self, user_id: Union[str, int]) -> None:
+        """ Drop the pending reminder of a user.
+        :param: user_id: The id of the user
+        """
+        self.__available_at.pop(int(user_id), None)
+
+    def next_vote(self, user_id: Union[str, int]) -> Optional[datetime.datetime]:
+        """ The time a user can vote again, according to the local index.
+        :param: user_id: The id of the user
+        :return: The time, None if no reminder is pending for the user
+        """
+        available_at = self.__available_at.get(int(user_id))
+        return datetime.datetime.fromtimestamp(available_at) if available_at is not None else None
+
+    def observe_vote(self, vote: UserBotVote) -> None:
+        """ Schedule the reminder of a user who just voted, see VoteWebhookListener.add_vote_observer.
+        :param: vote: The incoming vote
+        """
+        if not vote.test:
+            self.schedule(vote.user_id, vote.received_at - vote.since_voted.total_seconds() + self.vote_cooldown)
+
+    def observe_vote_info(self, vote_info: UserVoteInformation) -> None:
+        """ Schedule the reminder of a user from their looked up vote information.
+        Users who can already vote are not reminded.
+        :param: vote_info: The vote information of the user
+        """
+        if not vote_info.can_vote:
+            self.schedule(vote_info.user_id, vote_info.fetched_at + vote_info.until_next_vote.total_seconds())
+
+    def start(self) -> asyncio.Task:
+        """ Start sending reminders in the background.
+        """
+        if self.__task is None or self.__task.done():
+            # created here so that they belong to the running event loop
+            self.__changed = asyncio.Event()
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.__task = asyncio.ensure_future(self.__run())
+
+        return self.__task
+
+    async def stop(self) -> None:
+        """ Stop sending reminders, wait for the reminders being sent and save the pending ones.
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+
+            self.__task = None
+
+        if self.__reminders:
+            await asyncio.gather(*self.__reminders, return_exceptions=True)
+
+        if self.path is not None:
+            self.snapshot()
+
+    def snapshot(self) -> None:
+        """ Save the pending reminders to path.
+        """
+        temp_path = self.path + ".tmp"
+
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.writelines(f"{available_at} {user_id}\n" for user_id, available_at in self.__available_at.items())
+
+        os.replace(temp_path, self.path)
+
+    async def __run(self) -> None:
+        next_snapshot = time.monotonic() + self.snapshot_interval
+
+        while True:
+            self.__changed.clear()
+            now = time.time()
+
+            while self.__heap and self.__heap[0][0] <= now:
+                available_at, user_id = heapq.heappop(self.__heap)
+
+                # skip entries replaced by a newer vote or lookup
+                if self.__available_at.get(user_id) == available_at:
+                    del self.__available_at[user_id]
+                    self.__remind(user_id)
+
+            if self.path is not None and time.monotonic() >= next_snapshot:
+                self.snapshot()
+                next_snapshot = time.monotonic() + self.snapshot_interval
+
+            timeout = self.__heap[0][0] - now if self.__heap else None
+
+            if self.path is not None:
+                snapshot_in = next_snapshot - time.monotonic()
+                timeout = snapshot_in if timeout is None else min(timeout, snapshot_in)
+
+            try:
+                await asyncio.wait_for(self.__changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __remind(self, user_id: int) -> None:
+        task = asyncio.ensure_future(self.__send(user_id))
+        self.__reminders.add(task)
+        task.add_done_callback(self.__reminders.discard)
+
+    async def __send(self, user_id: int) -> None:
+        async with self.__semaphore:
+            try:
+                await self.on_vote_available(user_id)
+            except Exception as e:
+                if self.on_failure is not None:
+                    await self.on_failure(user_id, e)
+                else:
+                    print("Error sending vote reminder:", e)
+            else:
+                self.fired += 1
+
+    def __load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                available_at, _, user_id = line.rstrip("\n").partition(" ")
+
+                try:
+                    self.__available_at[int(user_id)] = float(available_at)
+                except ValueError:
+                    # a line torn by a crash
+                    continue
+
+        self.__heap = [(at, user) for user, at in self.__available_at.items()]
+        heapq.heapify(self.__heap)
+
+    def __len__(self):
+        return len(self.__available_at)
+
+    def __contains__(self, user_id: Union[str, int]):
+        return int(user_id) in self.__available_at
+
+    def __repr__(self):
+        return f"<VoteReminderScheduler pending={len(self.__available_at)} fired={self.fired}>"
+
+    def __str__(self):
+        return self.__repr__()
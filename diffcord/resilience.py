@@ -0,0 +1,183 @@
+import datetime
+import enum
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+
+class CircuitState(enum.Enum):
+    """ The state of a CircuitBreaker.
+    """
+
+    CLOSED = "closed"
+    """ Requests are sent normally. """
+
+    OPEN = "open"
+    """ Requests fail fast with CircuitOpenException until the recovery timeout passed. """
+
+    HALF_OPEN = "half_open"
+    """ A few probe requests are sent, their outcome closes or opens the circuit again. """
+
+
+class CircuitBreaker:
+    """ Stops sending requests to the API after repeated failures, so callers fail fast instead of waiting on it.
+
+    After failure_threshold consecutive failures (server errors, timeouts or connection errors) the circuit opens and
+    requests are rejected for recovery_timeout. Then up to half_open_max_calls probe requests are let through: a
+    success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: datetime.timedelta = datetime.timedelta(seconds=30),
+                 half_open_max_calls: int = 1,
+                 on_state_change: Callable[[CircuitState, CircuitState], None] = None):
+        self.failure_threshold: int = failure_threshold
+        """ The number of consecutive failures which open the circuit. """
+
+        self.recovery_timeout: float = recovery_timeout.total_seconds()
+        """ The time (in seconds) the circuit stays open before probe requests are sent. """
+
+        self.half_open_max_calls: int = half_open_max_calls
+        """ The maximum number of probe requests in flight while half open. """
+
+        self.on_state_change: Callable[[CircuitState, CircuitState], None] = on_state_change
+        """ A function called with the previous and the new state on every transition (must not be async). """
+
+        self.failures: int = 0
+        """ The number of consecutive failures. """
+
+        self.__state: CircuitState = CircuitState.CLOSED
+        self.__opened_at: float = 0.0
+        self.__probes: int = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """ The current state, an open circuit turns half open once the recovery timeout passed.
+        """
+        if self.__state is CircuitState.OPEN and time.monotonic() - self.__opened_at >= self.recovery_timeout:
+            self.__transition(CircuitState.HALF_OPEN)
+
+        return self.__state
+
+    @property
+    def retry_after(self) -> float:
+        """ The time (in seconds) until an open circuit lets probe requests through.
+        """
+        if self.__state is not CircuitState.OPEN:
+            return 0.0
+
+        return max(self.recovery_timeout - (time.monotonic() - self.__opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """ Check whether a request may be sent, counting it as a probe while half open.
+        Every allowed request must be followed by record_success, record_failure or release.
+        """
+        state = self.state
+
+        if state is CircuitState.CLOSED:
+            return True
+
+        if state is CircuitState.HALF_OPEN and self.__probes < self.half_open_max_calls:
+            self.__probes += 1
+            return True
+
+        return False
+
+    def record_success(self) -> None:
+        """ Record a request which succeeded.
+        """
+        self.failures = 0
+
+        if self.__state is CircuitState.HALF_OPEN:
+            self.__probes = max(self.__probes - 1, 0)
+            self.__transition(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        """ Record a request which failed.
+        """
+        self.failures += 1
+
+        if self.__state is CircuitState.HALF_OPEN:
+            self.__probes = max(self.__probes - 1, 0)
+            self.__open()
+        elif self.__state is CircuitState.CLOSED and self.failures >= self.failure_threshold:
+            self.__open()
+
+    def release(self) -> None:
+        """ Give back a request allowed by allow() which was abandoned before it completed, e.g. when cancelled.
+        """
+        if self.__state is CircuitState.HALF_OPEN:
+            self.__probes = max(self.__probes - 1, 0)
+
+    def __open(self) -> None:
+        self.__opened_at = time.monotonic()
+        self.__transition(CircuitState.OPEN)
+
+    def __transition(self, state: CircuitState) -> None:
+        previous, self.__state = self.__state, state
+
+        if state is not CircuitState.HALF_OPEN:
+            self.__probes = 0
+
+        if previous is not state and self.on_state_change is not None:
+            self.on_state_change(previous, state)
+
+    def __repr__(self):
+        return f"<CircuitBreaker state={self.__state.value} failures={self.failures}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class LatencyTracker:
+    """ Keeps the latencies of the most recent requests per route to estimate their percentiles.
+    """
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.window: int = window
+        """ The number of most recent latencies kept per route. """
+
+        self.min_samples: int = min_samples
+        """ The number of latencies needed before a percentile is estimated. """
+
+        self.__samples: Dict[str, Deque[float]] = {}
+        # route -> the samples sorted, and the number of samples added since they were sorted
+        self.__sorted: Dict[str, List[float]] = {}
+        self.__stale: Dict[str, int] = {}
+
+    def record(self, route: str, latency: float) -> None:
+        """ Record the latency of a request.
+        :param: route: The route key
+        :param: latency: The latency (in seconds)
+        """
+        samples = self.__samples.get(route)
+
+        if samples is None:
+            samples = self.__samples[route] = deque(maxlen=self.window)
+
+        samples.append(latency)
+        self.__stale[route] = self.__stale.get(route, 0) + 1
+
+    def percentile(self, route: str, fraction: float) -> Optional[float]:
+        """ Estimate a latency percentile of a route.
+        :param: route: The route key
+        :param: fraction: The percentile, e.g. 0.95
+        :return: The latency (in seconds), None until min_samples latencies were recorded
+        """
+        samples = self.__samples.get(route)
+
+        if samples is None or len(samples) < self.min_samples:
+            return None
+
+        # re-sorting on every request would cost more than the estimate is worth
+        if route not in self.__sorted or self.__stale[route] >= 16:
+            self.__sorted[route] = sorted(samples)
+            self.__stale[route] = 0
+
+        ordered = self.__sorted[route]
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def __repr__(self):
+        return f"<LatencyTracker routes={len(self.__samples)} window={self.window}>"
+
+    def __str__(self):
+        return self.__repr__()
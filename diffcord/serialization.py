@@ -0,0 +1,37 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if orjson is not None:
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+elif msgspec is not None:
+    _loads = msgspec.json.Decoder().decode
+    JSON_BACKEND = "msgspec"
+else:
+    _loads = json.loads
+    JSON_BACKEND = "json"
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """ Decode JSON using the fastest installed library (orjson, then msgspec, then the standard library).
+    :param: data: The JSON document
+    :return: The decoded document
+    :raises: ValueError: If the document is not valid JSON
+    """
+    try:
+        return _loads(data)
+    except ValueError:
+        raise
+    except Exception as e:
+        # msgspec errors do not derive from ValueError
+        raise ValueError(str(e)) from e
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """ Coalesces concurrent calls sharing the same key into a single call.
+
+    While a call is in flight, every caller using the same key waits on it and receives its result or exception.
+    """
+
+    def __init__(self):
+        self.calls: int = 0
+        """ The number of calls which were actually made. """
+
+        self.coalesced: int = 0
+        """ The number of calls which joined a call already in flight. """
+
+        self.__in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """ The number of distinct calls currently in flight.
+        """
+        return len(self.__in_flight)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """ Call a function, or join the call already in flight for the same key.
+        :param: key: The key identifying identical calls
+        :param: func: The function to call (must be async)
+        :return: The result of the call
+        """
+        future = self.__in_flight.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self.__in_flight[key] = future
+            future.add_done_callback(lambda done: self.__finish(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        # a cancelled caller must not cancel the call for everyone else waiting on it
+        return await asyncio.shield(future)
+
+    def __finish(self, key: Hashable, future: asyncio.Future) -> None:
+        if self.__in_flight.get(key) is future:
+            del self.__in_flight[key]
+
+        if not future.cancelled():
+            # mark the exception as retrieved in case every caller was cancelled
+            future.exception()
+
+    def __repr__(self):
+        return f"<SingleFlight in_flight={len(self.__in_flight)} calls={self.calls} coalesced={self.coalesced}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,504 @@
+import asyncio
+import datetime
+import mmap
+import os
+import random
+import struct
+import time
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from diffcord.metrics import MetricsRegistry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class GuildCountBackend(ABC):
+    """ Combines the guild counts of several shard processes so that only one of them uploads the total.
+
+    Every process publishes its own guild count, the backend elects one process as the reporter which uploads the
+    total of every count published recently (within stale_after).
+    """
+
+    def __init__(self, stale_after: datetime.timedelta = datetime.timedelta(hours=3)):
+        self.stale_after: float = stale_after.total_seconds()
+        """ The time (in seconds) after which a count which was not published again is left out of the total. """
+
+    async def open(self) -> None:
+        """ Join the aggregation.
+        """
+
+    async def close(self) -> None:
+        """ Leave the aggregation.
+        """
+
+    @abstractmethod
+    async def publish(self, guild_count: int) -> None:
+        """ Publish the guild count of this process.
+        :param: guild_count: The guild count of this process
+        """
+
+    @abstractmethod
+    def is_reporter(self) -> bool:
+        """ Whether this process is the one uploading the total guild count.
+        """
+
+    @abstractmethod
+    async def total(self) -> int:
+        """ Get the total guild count of every process.
+        """
+
+
+class SharedMemoryGuildCountBackend(GuildCountBackend):
+    """ Aggregates guild counts through a memory-mapped file shared by every process on the host.
+
+    Each process owns one slot of the file (e.g. its cluster id), the reporter is whichever process holds the lock on
+    the file, so a new reporter takes over as soon as the previous one exits.
+    """
+
+    # slot: version (odd while being written), guild count, unix time of the last publish
+    __SLOT = struct.Struct("<Qqd")
+
+    def __init__(self, path: str, slot: int, slots: int = 64,
+                 stale_after: datetime.timedelta = datetime.timedelta(hours=3)):
+        super().__init__(stale_after)
+
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryGuildCountBackend is not supported on this platform")
+
+        if not 0 <= slot < slots:
+            raise ValueError(f"slot must be between 0 and {slots - 1}")
+
+        self.path: str = path
+        """ The shared file. """
+
+        self.slot: int = slot
+        """ The slot of this process. """
+
+        self.slots: int = slots
+        """ The number of slots in the file. """
+
+        self.__file = None
+        self.__map: Optional[mmap.mmap] = None
+        self.__lock_file = None
+        self.__is_reporter: bool = False
+
+    async def open(self) -> None:
+        self.__file = open(self.path, "a+b")
+        size = self.__SLOT.size * self.slots
+
+        if os.fstat(self.__file.fileno()).st_size < size:
+            self.__file.truncate(size)
+
+        self.__map = mmap.mmap(self.__file.fileno(), size)
+        self.__lock_file = open(self.path + ".lock", "a+b")
+
+    async def close(self) -> None:
+        if self.__map is not None:
+            # leave the total right away instead of once the count is stale
+            self.__write(0, 0.0)
+            self.__map.close()
+            self.__file.close()
+            self.__lock_file.close()
+            self.__map = None
+            self.__is_reporter = False
+
+    async def publish(self, guild_count: int) -> None:
+        self.__write(guild_count, time.time())
+
+    def __write(self, guild_count: int, published_at: float) -> None:
+        offset = self.slot * self.__SLOT.size
+        version, _, _ = self.__SLOT.unpack_from(self.__map, offset)
+
+        # readers retry while the version is odd or changed during their read
+        struct.pack_into("<Q", self.__map, offset, version + 1)
+        struct.pack_into("<qd", self.__map, offset + 8, guild_count, published_at)
+        struct.pack_into("<Q", self.__map, offset, version + 2)
+
+    def is_reporter(self) -> bool:
+        if not self.__is_reporter:
+            try:
+                fcntl.flock(self.__lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+
+            self.__is_reporter = True
+
+        return True
+
+    async def total(self) -> int:
+        cutoff = time.time() - self.stale_after
+        total = 0
+
+        for slot in range(self.slots):
+            offset = slot * self.__SLOT.size
+
+            while True:
+                version, guild_count, published_at = self.__SLOT.unpack_from(self.__map, offset)
+
+                if version % 2 == 0 and self.__SLOT.unpack_from(self.__map, offset)[0] == version:
+                    break
+
+                await asyncio.sleep(0)
+
+            if version and published_at >= cutoff:
+                total += guild_count
+
+        return total
+
+    def __repr__(self):
+        return f"<SharedMemoryGuildCountBackend path={self.path} slot={self.slot} reporter={self.__is_reporter}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class UnixSocketGuildCountBackend(GuildCountBackend):
+    """ Aggregates guild counts through a unix socket.
+
+    The process holding the lock on a file next to the socket (path + ".lock") binds the socket and becomes the
+    reporter, collecting the counts the others send to it. If the reporter exits, the next process to publish takes
+    over the lock and the socket.
+    """
+
+    def __init__(self, path: str, shard: str = None, stale_after: datetime.timedelta = datetime.timedelta(hours=3),
+                 connect_timeout: datetime.timedelta = datetime.timedelta(seconds=1)):
+        super().__init__(stale_after)
+
+        if fcntl is None:
+            raise RuntimeError("UnixSocketGuildCountBackend is not supported on this platform")
+
+        self.path: str = path
+        """ The path of the unix socket. """
+
+        self.shard: str = str(os.getpid()) if shard is None else shard
+        """ The name identifying this process. """
+
+        self.connect_timeout: float = connect_timeout.total_seconds()
+        """ The time (in seconds) to wait for another process which won the election to bind the socket. """
+
+        # shard -> (guild count, unix time of the last publish)
+        self.__counts: Dict[str, Tuple[int, float]] = {}
+        self.__server: Optional[asyncio.AbstractServer] = None
+        self.__connections: Set[asyncio.StreamWriter] = set()
+        self.__reader: Optional[asyncio.StreamReader] = None
+        self.__writer: Optional[asyncio.StreamWriter] = None
+        self.__lock_file = None
+
+    async def open(self) -> None:
+        await self.__connect()
+
+    async def close(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            self.__server = None
+
+            for writer in list(self.__connections):
+                writer.close()
+
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+            # only once the socket is gone, so that the next reporter binds a fresh one
+            self.__lock_file.close()
+            self.__lock_file = None
+
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+    async def publish(self, guild_count: int) -> None:
+        if self.__server is None and (self.__writer is None or self.__writer.is_closing() or self.__reader.at_eof()):
+            # the reporter is gone (or was never reached), elect a new one
+            if self.__writer is not None:
+                self.__writer.close()
+
+            await self.__connect()
+
+        if self.__server is not None:
+            self.__counts[self.shard] = (guild_count, time.time())
+            return
+
+        if self.__writer is None:
+            # the elected reporter did not bind the socket in time, the next publish tries again
+            return
+
+        try:
+            self.__writer.write(f"{self.shard} {guild_count}\n".encode("utf-8"))
+            await self.__writer.drain()
+        except (ConnectionError, OSError):
+            # the next publish elects a new reporter
+            self.__writer.close()
+
+    def is_reporter(self) -> bool:
+        return self.__server is not None
+
+    async def total(self) -> int:
+        cutoff = time.time() - self.stale_after
+        return sum(guild_count for guild_count, published_at in self.__counts.values() if published_at >= cutoff)
+
+    async def __connect(self) -> None:
+        deadline = time.monotonic() + self.connect_timeout
+
+        while True:
+            try:
+                self.__reader, self.__writer = await asyncio.open_unix_connection(self.path)
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                self.__reader = self.__writer = None
+
+            # no reporter is listening, only the process holding the lock may take over
+            lock_file = open(self.path + ".lock", "a+b")
+
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+
+                # another process is taking over, connect to it once it listens
+                if time.monotonic() >= deadline:
+                    return
+
+                await asyncio.sleep(0.01)
+                continue
+
+            break
+
+        # remove the socket file of a dead reporter
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+        try:
+            self.__server = await asyncio.start_unix_server(self.__receive, self.path)
+        except BaseException:
+            lock_file.close()
+            raise
+
+        self.__lock_file = lock_file
+
+    async def __receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.__connections.add(writer)
+
+        try:
+            async for line in reader:
+                shard, _, guild_count = line.decode("utf-8").strip().rpartition(" ")
+
+                try:
+                    self.__counts[shard] = (int(guild_count), time.time())
+                except ValueError:
+                    continue
+        finally:
+            self.__connections.discard(writer)
+            writer.close()
+
+    def __repr__(self):
+        return f"<UnixSocketGuildCountBackend path={self.path} shard={self.shard} reporter={self.is_reporter()}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class StatsReporter:
+    """ Uploads the bot's guild count to Diffcord whenever it changes.
+
+    The guild count is checked every poll_interval and whenever notify is called (e.g. on guild join/leave). Bursts
+    of notifications are coalesced into one upload once no new notification arrived for debounce, but an upload is
+    never held back for longer than max_staleness. Unchanged counts are not uploaded again. Every wait is randomized by
+    +/- jitter so that a fleet of bots does not hit the API in lockstep.
+
+    With an aggregator, the guild count of this process is only published to it and the elected reporter process
+    uploads the total of every process on its own checks, so its poll_interval bounds how stale the total can get.
+    """
+
+    def __init__(self, upload: Callable[[int], Awaitable[None]], guild_count: Callable[[], int],
+                 poll_interval: datetime.timedelta = datetime.timedelta(hours=1),
+                 debounce: datetime.timedelta = datetime.timedelta(seconds=30),
+                 max_staleness: datetime.timedelta = datetime.timedelta(minutes=5), jitter: float = 0.1,
+                 on_success: Callable[[], Awaitable[None]] = None,
+                 on_failure: Callable[[Exception], Awaitable[None]] = None,
+                 aggregator: GuildCountBackend = None, metrics: MetricsRegistry = None):
+        self.upload: Callable[[int], Awaitable[None]] = upload
+        """ The function uploading a guild count (must be async). """
+
+        self.guild_count: Callable[[], int] = guild_count
+        """ The function returning the current guild count. """
+
+        self.poll_interval: float = poll_interval.total_seconds()
+        """ The time (in seconds) between checks of the guild count without notifications. """
+
+        self.debounce: float = debounce.total_seconds()
+        """ The quiet period (in seconds) after a notification before the guild count is uploaded. """
+
+        self.max_staleness: float = max_staleness.total_seconds()
+        """ The longest time (in seconds) between a notification and the upload of the guild count. """
+
+        self.jitter: float = jitter
+        """ The relative amount by which waits are randomized. """
+
+        self.on_success: Callable[[], Awaitable[None]] = on_success
+        """ A function to call when an upload succeeded (must be async). """
+
+        self.on_failure: Callable[[Exception], Awaitable[None]] = on_failure
+        """ A function to call when an upload failed (must be async). """
+
+        self.aggregator: GuildCountBackend = aggregator
+        """ Combines the guild counts of several shard processes, None to upload this process' count directly. """
+
+        self.last_reported: Optional[int] = None
+        """ The last guild count uploaded successfully. """
+
+        self.uploads: int = 0
+        """ The number of successful uploads. """
+
+        self.skipped: int = 0
+        """ The number of checks which did not upload because the guild count was unchanged. """
+
+        self.metrics: Optional[MetricsRegistry] = metrics
+        """ The registry stats upload metrics are recorded in, None to not record metrics. """
+
+        if metrics is not None:
+            self.__checks_metric = metrics.counter("stats_checks_total", "Guild count checks by result", ("result",))
+            self.__upload_metric = metrics.histogram("stats_upload_duration_seconds", "Guild count upload latency")
+
+        self.__changed: Optional[asyncio.Event] = None
+        self.__task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        """ Signal that the guild count may have changed.
+        """
+        if self.__changed is not None:
+            self.__changed.set()
+
+    def start(self) -> asyncio.Task:
+        """ Start reporting in the background.
+        """
+        if self.__task is None or self.__task.done():
+            # created here so that it belongs to the running event loop
+            self.__changed = asyncio.Event()
+            self.__task = asyncio.ensure_future(self.__run())
+
+        return self.__task
+
+    async def stop(self) -> None:
+        """ Stop reporting.
+        """
+        if self.__task is None:
+            return
+
+        self.__task.cancel()
+
+        try:
+            await self.__task
+        except asyncio.CancelledError:
+            pass
+
+        self.__task = None
+
+        if self.aggregator is not None:
+            await self.aggregator.close()
+
+    async def report(self) -> None:
+        """ Upload the guild count now, unless it is unchanged.
+        """
+        try:
+            # e.g. the bot's guilds are not available before it is ready
+            guild_count = self.guild_count()
+
+            if self.aggregator is not None:
+                await self.aggregator.publish(guild_count)
+
+                if not self.aggregator.is_reporter():
+                    return
+
+                guild_count = await self.aggregator.total()
+        except Exception as e:
+            await self.__failed(e)
+            return
+
+        if guild_count == self.last_reported:
+            self.skipped += 1
+            self.__record("skipped")
+            return
+
+        start = time.perf_counter()
+
+        try:
+            await self.upload(guild_count)
+        except Exception as e:
+            self.__record("failure", time.perf_counter() - start)
+            await self.__failed(e)
+        else:
+            self.last_reported = guild_count
+            self.uploads += 1
+            self.__record("success", time.perf_counter() - start)
+
+            if self.on_success is not None:
+                try:
+                    await self.on_success()
+                except Exception as e:
+                    print("Error in stats success callback:", e)
+
+    async def __failed(self, error: Exception) -> None:
+        if self.on_failure is None:
+            return
+
+        try:
+            await self.on_failure(error)
+        except Exception as e:
+            # must not end the reporting loop
+            print("Error in stats failure callback:", e)
+
+    def __record(self, result: str, duration: float = None) -> None:
+        if self.metrics is not None:
+            self.__checks_metric.inc(result=result)
+
+            if duration is not None:
+                self.__upload_metric.observe(duration)
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        if self.aggregator is not None:
+            await self.aggregator.open()
+
+        while True:
+            # changes made while uploading trigger another check
+            self.__changed.clear()
+            await self.report()
+
+            if not await self.__wait_for_change(self.__jittered(self.poll_interval)):
+                continue
+
+            # coalesce a burst of changes into one upload
+            deadline = loop.time() + self.__jittered(self.max_staleness)
+
+            while True:
+                self.__changed.clear()
+                timeout = min(self.__jittered(self.debounce), deadline - loop.time())
+
+                if timeout <= 0 or not await self.__wait_for_change(timeout):
+                    break
+
+    async def __wait_for_change(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.__changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+        return True
+
+    def __jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def __repr__(self):
+        return f"<StatsReporter last_reported={self.last_reported} uploads={self.uploads} skipped={self.skipped}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,263 @@
+import asyncio
+import datetime
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+
+class FakeDiffcordServer:
+    """ A local stand-in for the Diffcord API, to test and benchmark bots and the SDK without the real service.
+
+    Serves the /v1/votes, /v1/users/{id}/votes and /v1/stats routes from in-memory state on a local port. Latency,
+    server errors and rate limits can be injected, either at random (error_rate, rate_limit_rate) or for the next
+    requests (inject). Votes are recorded with send_vote, which also delivers them to a webhook listener.
+    """
+
+    def __init__(self, token: str = "token", bot_id: str = "1000000000000000000", host: str = "127.0.0.1",
+                 port: int = 0, latency: datetime.timedelta = datetime.timedelta(0), error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: datetime.timedelta = datetime.timedelta(seconds=1),
+                 vote_cooldown: datetime.timedelta = datetime.timedelta(hours=12), seed: int = None):
+        self.token: str = token
+        """ The API token requests must be authorized with. """
+
+        self.bot_id: str = bot_id
+        """ The id of the bot the server answers for. """
+
+        self.host: str = host
+        """ The host the server binds to. """
+
+        self.port: int = port
+        """ The port the server binds to, 0 picks a free port (updated once started). """
+
+        self.latency: float = latency.total_seconds()
+        """ The delay (in seconds) added to every API response. """
+
+        self.error_rate: float = error_rate
+        """ The probability of answering an API request with a 500 error. """
+
+        self.rate_limit_rate: float = rate_limit_rate
+        """ The probability of answering an API request with a 429 error. """
+
+        self.retry_after: float = retry_after.total_seconds()
+        """ The Retry-After (in seconds) sent with injected 429 errors. """
+
+        self.vote_cooldown: float = vote_cooldown.total_seconds()
+        """ The time (in seconds) after a vote before the user can vote again. """
+
+        self.month_votes: int = 0
+        """ The number of votes recorded this month. """
+
+        self.guild_count: Optional[int] = None
+        """ The last guild count posted to /v1/stats. """
+
+        self.requests: Counter = Counter()
+        """ The number of API requests received per route, e.g. requests["GET /v1/votes"]. """
+
+        # user id -> (monthly votes, unix time of the last vote)
+        self.__users: Dict[str, Tuple[int, float]] = {}
+        self.__injected: List[Tuple[int, Optional[float]]] = []
+        self.__random = random.Random(seed)
+        self.__server: Optional[HTTPServer] = None
+        self.__http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def base_url(self) -> str:
+        """ The base URL to pass to Client(base_url=...).
+        """
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        """ Start serving the API.
+        """
+        sockets = bind_sockets(self.port, self.host)
+        self.port = sockets[0].getsockname()[1]
+
+        routes = [
+            (r"/v1/votes", _BotVotesHandler, {"server": self}),
+            (r"/v1/users/(\d+)/votes", _UserVotesHandler, {"server": self}),
+            (r"/v1/stats", _StatsHandler, {"server": self}),
+        ]
+
+        self.__server = HTTPServer(tornado.web.Application(routes, log_function=lambda handler: None))
+        self.__server.add_sockets(sockets)
+
+    async def stop(self) -> None:
+        """ Stop serving the API and close the webhook sender.
+        """
+        if self.__server is not None:
+            self.__server.stop()
+            await self.__server.close_all_connections()
+            self.__server = None
+
+        if self.__http_client is not None:
+            await self.__http_client.aclose()
+            self.__http_client = None
+
+    async def __aenter__(self) -> "FakeDiffcordServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.stop()
+
+    def inject(self, status: int, count: int = 1, retry_after: datetime.timedelta = None) -> None:
+        """ Answer the next API requests with an error, regardless of the error rates.
+        :param: status: The status code to answer with (e.g. 429 or 500)
+        :param: count: The number of requests to answer with the error
+        :param: retry_after: The Retry-After sent with the error, defaults to retry_after for 429 errors
+        """
+        delay = retry_after.total_seconds() if retry_after is not None else None
+        self.__injected.extend([(status, delay)] * count)
+
+    def create_vote(self, user_id: str = None, test: bool = False) -> dict:
+        """ Record a vote and build its webhook payload.
+        :param: user_id: The id of the voting user, a random id if None
+        :param: test: Whether the vote is a test vote, test votes are not counted
+        :return: The webhook payload of the vote
+        """
+        if user_id is None:
+            user_id = str(self.__random.randint(100000000000000000, 999999999999999999))
+
+        monthly_votes, _ = self.__users.get(user_id, (0, 0.0))
+
+        if not test:
+            monthly_votes += 1
+            self.month_votes += 1
+            self.__users[user_id] = (monthly_votes, time.time())
+
+        return {
+            "vote_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "bot_id": self.bot_id,
+            "voted_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "rewarded": False,
+            "test": test,
+            "monthly_votes": monthly_votes,
+        }
+
+    async def send_vote(self, url: str, verify_code: str = None, user_id: str = None, test: bool = False,
+                        vote: dict = None) -> int:
+        """ Record a vote and deliver it to a webhook listener, like Diffcord does.
+        :param: url: The URL of the webhook listener
+        :param: verify_code: The verification code of the webhook listener
+        :param: user_id: The id of the voting user, a random id if None
+        :param: test: Whether the vote is a test vote
+        :param: vote: A payload built by create_vote to send instead of recording a new vote
+        :return: The status code the webhook listener answered with
+        """
+        if vote is None:
+            vote = self.create_vote(user_id, test)
+
+        if self.__http_client is None:
+            self.__http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=None))
+
+        headers = {"Authorization": verify_code} if verify_code is not None else {}
+        response = await self.__http_client.post(url, content=json.dumps(vote), headers=headers)
+        return response.status_code
+
+    def user_votes(self, user_id: str) -> dict:
+        """ The vote information of a user as returned by /v1/users/{id}/votes.
+        :param: user_id: The id of the user
+        """
+        monthly_votes, voted_at = self.__users.get(user_id, (0, None))
+        since_last_vote = int(time.time() - voted_at) if voted_at is not None else None
+
+        return {
+            "user_id": user_id,
+            "bot_id": self.bot_id,
+            "monthly_votes": monthly_votes,
+            "since_last_vote": since_last_vote,
+            "until_next_vote": max(0, int(self.vote_cooldown - since_last_vote)) if since_last_vote is not None else 0,
+        }
+
+    async def _prepare(self, handler: tornado.web.RequestHandler) -> bool:
+        """ Apply latency, authorization and fault injection to an API request.
+        :return: Whether the request should be answered normally
+        """
+        self.requests[f"{handler.request.method} {handler.request.path}"] += 1
+
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        if handler.request.headers.get("x-api-key") != self.token:
+            self.__error(handler, 401, "Invalid API key", "ERR_INVALID_API_KEY")
+            return False
+
+        if self.__injected:
+            status, retry_after = self.__injected.pop(0)
+        elif self.rate_limit_rate and self.__random.random() < self.rate_limit_rate:
+            status, retry_after = 429, None
+        elif self.error_rate and self.__random.random() < self.error_rate:
+            status, retry_after = 500, None
+        else:
+            return True
+
+        if status == 429:
+            handler.set_header("Retry-After", str(self.retry_after if retry_after is None else retry_after))
+            self.__error(handler, 429, "Too many requests", "ERR_RATE_LIMITED")
+        else:
+            if retry_after is not None:
+                handler.set_header("Retry-After", str(retry_after))
+            self.__error(handler, status, "Injected error", "ERR_INTERNAL")
+
+        return False
+
+    @staticmethod
+    def __error(handler: tornado.web.RequestHandler, status: int, message: str, code: str) -> None:
+        handler.set_status(status)
+        handler.finish({"error": {"message": message, "code": code}})
+
+    def __repr__(self):
+        return f"<FakeDiffcordServer base_url={self.base_url} month_votes={self.month_votes}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class _FakeApiHandler(tornado.web.RequestHandler):
+
+    def initialize(self, server: FakeDiffcordServer) -> None:
+        self.server = server
+
+    def reply(self, data: Optional[dict]) -> None:
+        if data is None:
+            self.set_status(204)
+            self.finish()
+        else:
+            self.finish({"data": data})
+
+
+class _BotVotesHandler(_FakeApiHandler):
+
+    async def get(self):
+        if await self.server._prepare(self):
+            self.reply({"month_votes": self.server.month_votes})
+
+
+class _UserVotesHandler(_FakeApiHandler):
+
+    async def get(self, user_id: str):
+        if await self.server._prepare(self):
+            self.reply(self.server.user_votes(user_id))
+
+
+class _StatsHandler(_FakeApiHandler):
+
+    async def post(self):
+        if await self.server._prepare(self):
+            try:
+                self.server.guild_count = int(self.get_query_argument("guilds"))
+            except (tornado.web.MissingArgumentError, ValueError):
+                self.set_status(400)
+                self.finish({"error": {"message": "Invalid guild count", "code": "ERR_INVALID_GUILDS"}})
+                return
+
+            self.reply(None)
@@ -1,13 +1,19 @@
 import datetime
+import time
 from typing import Union
 
+from diffcord.serialization import loads
+
 
 class UserBotVote:
     """  Represents a user vote for a bot.
     """
 
-    def __init__(self, vote_id: str, user_id: str, bot_id: str, since_vote: str, rewarded: bool, test: bool,
-                 monthly_votes: int):
+    __slots__ = ("vote_id", "user_id", "bot_id", "rewarded", "test", "monthly_votes", "received_at", "__since_vote",
+                 "__voted_at")
+
+    def __init__(self, vote_id: str, user_id: str, bot_id: str, since_vote: str = None, rewarded: bool = False,
+                 test: bool = False, monthly_votes: int = 0, voted_at: str = None):
         self.vote_id: str = vote_id
         """ The id of the vote. """
 
@@ -17,13 +23,6 @@ class UserBotVote:
         self.bot_id: int = int(bot_id)
         """ The id of the bot which the user has voted for. """
 
-        self.since_voted: datetime.timedelta = datetime.timedelta(seconds=float(since_vote))
-        """ Time when the user voted. """
-
-        self.voted_at: datetime.datetime = datetime.datetime.utcnow() - self.since_voted
-        """ Time when the user voted. 
-        """
-
         self.rewarded: bool = rewarded
         """ Whether the user vote has been rewarded and/or acknowledged. """
 
@@ -33,6 +32,50 @@ class UserBotVote:
         self.monthly_votes: int = monthly_votes
         """ The number of votes this user has given this month. """
 
+        self.received_at: float = time.time()
+        """ The unix time at which the vote was received, since_voted and voted_at are relative to it. """
+
+        # computed on first access of since_voted and voted_at
+        self.__since_vote: Union[str, float, None] = since_vote
+        self.__voted_at: Union[str, datetime.datetime, None] = voted_at
+
+    @classmethod
+    def from_json(cls, data: Union[bytes, str]) -> "UserBotVote":
+        """ Create a vote from a webhook payload.
+        :param: data: The JSON payload
+        :return: A UserBotVote object
+        :raises: ValueError: If the payload is not valid JSON
+        :raises: TypeError: If the payload is not a vote
+        """
+        payload = loads(data)
+
+        if not isinstance(payload, dict):
+            raise TypeError("vote payload must be an object")
+
+        return cls(**payload)
+
+    @property
+    def since_voted(self) -> datetime.timedelta:
+        """ Time since the user voted (when the vote was received).
+        """
+        if self.__since_vote is None:
+            self.__since_vote = self.received_at - self.voted_at.timestamp() if self.__voted_at is not None else 0.0
+        elif isinstance(self.__since_vote, str):
+            self.__since_vote = float(self.__since_vote)
+
+        return datetime.timedelta(seconds=self.__since_vote)
+
+    @property
+    def voted_at(self) -> datetime.datetime:
+        """ Time when the user voted.
+        """
+        if self.__voted_at is None:
+            self.__voted_at = datetime.datetime.utcfromtimestamp(self.received_at) - self.since_voted
+        elif isinstance(self.__voted_at, str):
+            self.__voted_at = datetime.datetime.fromisoformat(self.__voted_at)
+
+        return self.__voted_at
+
     @property
     def votes_this_month(self) -> int:
         """ Get the number of votes this user has given your bot this month.
@@ -50,6 +93,8 @@ class UserVoteInformation:
     """ Represents a user vote information.
     """
 
+    __slots__ = ("user_id", "bot_id", "monthly_votes", "fetched_at", "__since_last_vote", "__until_next_vote")
+
     def __init__(self, user_id: str, bot_id: str, monthly_votes: int, since_last_vote: Union[int, None],
                  until_next_vote: int):
         self.user_id: str = user_id
@@ -61,27 +106,74 @@ class UserVoteInformation:
         self.monthly_votes: int = monthly_votes
         """ The number of votes this user has for the given bot this month. """
 
-        self.since_last_vote: datetime.timedelta = datetime.timedelta(
-            seconds=since_last_vote) if since_last_vote is not None else None
-        """ Time in seconds since the last vote. """
+        self.fetched_at: float = time.time()
+        """ The unix time at which the information was fetched, last_vote and next_vote are relative to it. """
 
-        self.until_next_vote: datetime.timedelta = datetime.timedelta(seconds=until_next_vote)
-        """ Time in seconds till the next vote. """
+        self.__since_last_vote: Union[int, None] = since_last_vote
+        self.__until_next_vote: int = until_next_vote
 
-        self.last_vote: datetime.datetime = datetime.datetime.now() - self.since_last_vote if self.since_last_vote is not None else None
-        """ The last time the user voted. """
+    @property
+    def since_last_vote(self) -> Union[datetime.timedelta, None]:
+        """ Time since the last vote (when the information was fetched).
+        """
+        return datetime.timedelta(seconds=self.__since_last_vote) if self.__since_last_vote is not None else None
 
-        self.next_vote: datetime.datetime = datetime.datetime.now() + self.until_next_vote
-        """ The next time the user can vote. """
+    @property
+    def until_next_vote(self) -> datetime.timedelta:
+        """ Time till the next vote (when the information was fetched).
+        """
+        return datetime.timedelta(seconds=self.__until_next_vote or 0)
+
+    @property
+    def last_vote(self) -> Union[datetime.datetime, None]:
+        """ The last time the user voted.
+        """
+        if self.__since_last_vote is None:
+            return None
+
+        return datetime.datetime.fromtimestamp(self.fetched_at - self.__since_last_vote)
+
+    @property
+    def next_vote(self) -> datetime.datetime:
+        """ The next time the user can vote.
+        """
+        return datetime.datetime.fromtimestamp(self.fetched_at + (self.__until_next_vote or 0))
 
     @property
     def can_vote(self) -> bool:
         """ Whether the user can vote or not.
         """
-        return not self.until_next_vote or self.until_next_vote.total_seconds() <= 0
+        return not self.__until_next_vote or self.__until_next_vote <= 0
 
     def __repr__(self):
         return f"<UserVoteInformation user_id={self.user_id} bot_id={self.bot_id} votes_this_month={self.monthly_votes} since_last_vote={self.since_last_vote} until_next_vote={self.until_next_vote}>"
 
     def __str__(self):
         return self.__repr__()
+
+
+class UserVoteInformationResult:
+    """ Represents the outcome of looking up the vote information of one user in a bulk lookup.
+    """
+
+    def __init__(self, user_id: Union[str, int], vote_info: UserVoteInformation = None, error: Exception = None):
+        self.user_id: Union[str, int] = user_id
+        """ The id of the user which was looked up. """
+
+        self.vote_info: UserVoteInformation = vote_info
+        """ The vote information of the user, None if the lookup failed. """
+
+        self.error: Exception = error
+        """ The exception raised by the lookup, None if it succeeded. """
+
+    @property
+    def ok(self) -> bool:
+        """ Whether the lookup succeeded.
+        """
+        return self.error is None
+
+    def __repr__(self):
+        return f"<UserVoteInformationResult user_id={self.user_id} vote_info={self.vote_info} error={self.error!r}>"
+
+    def __str__(self):
+        return self.__repr__()
@@ -0,0 +1,68 @@
+try:
+    import tornado.web
+    from tornado.httpserver import HTTPServer
+except ImportError as e:
+    raise ImportError("the webhook listener requires tornado, install it with: pip install diffcord[webhook]") from e
+
+from diffcord.httpserver import DEFAULT_MAX_BODY_SIZE, ReceiveCallback
+from diffcord.metrics import MetricsRegistry
+
+
+@tornado.web.stream_request_body
+class VoteWebhookHandler(tornado.web.RequestHandler):
+    """ Answers vote webhooks with the outcome of a receive callback.
+
+    Bodies with a Content-Length above max_body_size are answered with 413 before they are read, like the asyncio
+    engine does. Chunked bodies growing past it make tornado close the connection.
+    """
+
+    def initialize(self, receive: ReceiveCallback, max_body_size: int = DEFAULT_MAX_BODY_SIZE) -> None:
+        self.receive = receive
+        self.max_body_size = max_body_size
+        self.chunks = []
+
+    def prepare(self):
+        content_length = self.request.headers.get("Content-Length")
+
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            raise tornado.web.HTTPError(413)
+
+    def data_received(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+
+    async def post(self):
+        status, headers = await self.receive(self.request.headers.get("Authorization"), b"".join(self.chunks))
+
+        for name, value in headers.items():
+            self.set_header(name, value)
+
+        self.set_status(status)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """ Serves a metrics registry in the Prometheus text format.
+    """
+
+    def initialize(self, metrics: MetricsRegistry) -> None:
+        self.metrics = metrics
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(self.metrics.render())
+
+
+def create_webhook_server(receive: ReceiveCallback, metrics: MetricsRegistry = None, metrics_path: str = None,
+                          max_body_size: int = DEFAULT_MAX_BODY_SIZE) -> HTTPServer:
+    """ Create the tornado HTTP server accepting vote webhooks at /.
+    :param: receive: The function answering a webhook
+    :param: metrics: The registry to serve at metrics_path
+    :param: metrics_path: The path at which the metrics are served, None to not serve them
+    :param: max_body_size: The largest accepted request body (in bytes)
+    :return: The HTTP server, not bound yet
+    """
+    routes = [(r"/", VoteWebhookHandler, {"receive": receive, "max_body_size": max_body_size})]
+
+    if metrics_path is not None:
+        routes.append((metrics_path, MetricsHandler, {"metrics": metrics}))
+
+    return HTTPServer(tornado.web.Application(routes, debug=False), max_body_size=max_body_size)
@@ -11,6 +11,14 @@ setup(
     author='jadelasmar4@gmail.com',
     zip_safe=False,
     install_requires=requirements,
+    extras_require={
+        # the vote webhook listener (VoteWebhookListener) and diffcord.testing
+        "webhook": ["tornado==6.2"],
+        # the VoteHistory queries
+        "history": ["numpy"],
+        # the OpenTelemetryEmitter profiler hook
+        "tracing": ["opentelemetry-api"],
+    },
     python_requires='>=3.7.0',
     long_description_content_type="text/markdown",
     long_description=open('README.md').read(),
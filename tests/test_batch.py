@@ -0,0 +1,27 @@
+import asyncio
+import unittest
+from typing import List
+
+from diffcord import UserBotVote, VoteBatcher
+
+
+class TestVoteBatcher(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def create_vote(vote_id: str) -> UserBotVote:
+        return UserBotVote(vote_id, "1234", "5678", "0", False, False, 1)
+
+    async def test_cancelled_batch_releases_submitters(self):
+        async def handle_votes(votes: List[UserBotVote]):
+            raise asyncio.CancelledError()
+
+        batcher = VoteBatcher(handle_votes, max_size=2)
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(self.create_vote(str(i))) for i in range(2)),
+                                                        return_exceptions=True), 1)
+
+        self.assertTrue(all(isinstance(result, asyncio.CancelledError) for result in results))
+        self.assertEqual(batcher.batches, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
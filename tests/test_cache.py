@@ -0,0 +1,121 @@
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from diffcord import SharedMemoryVoteInfoCache, UserBotVote
+
+
+def vote_info(user_id: int, monthly_votes: int = 1, until_next_vote: int = 3600) -> dict:
+    return {"user_id": str(user_id), "bot_id": "5678", "monthly_votes": monthly_votes, "since_last_vote": 10,
+            "until_next_vote": until_next_vote}
+
+
+class TestSharedMemoryVoteInfoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "votes")
+
+    def open_cache(self, **kwargs) -> SharedMemoryVoteInfoCache:
+        cache = SharedMemoryVoteInfoCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_shared_between_instances(self):
+        first, second = self.open_cache(capacity=64), self.open_cache(capacity=64)
+
+        self.assertIsNone(second.get(1234))
+        first.put(1234, vote_info(1234, monthly_votes=3))
+
+        info = second.get("1234")
+        self.assertEqual((info.user_id, info.bot_id, info.monthly_votes), ("1234", "5678", 3))
+        self.assertEqual(info.since_last_vote.seconds, 10)
+        self.assertLessEqual(info.until_next_vote.total_seconds(), 3600)
+        self.assertEqual((second.hits, second.misses, len(second)), (1, 1, 1))
+
+        second.observe_vote(UserBotVote("vote", "1234", "5678", "0", False, False, 4))
+        self.assertNotIn(1234, first)
+        self.assertIsNone(first.get(1234))
+        self.assertEqual(second.invalidations, 1)
+
+        with self.assertRaises(ValueError):
+            SharedMemoryVoteInfoCache(self.path, capacity=128)
+
+    def test_put_replaces_cached_entry(self):
+        first, second = self.open_cache(capacity=64), self.open_cache(capacity=64)
+
+        first.put(1, vote_info(1, monthly_votes=1))
+        second.put(1, vote_info(1, monthly_votes=5))
+
+        self.assertEqual(first.get(1).monthly_votes, 5)
+        self.assertEqual((len(first), first.evictions, second.evictions), (1, 0, 0))
+
+        # no older copy of the entry is left behind to come back
+        self.assertTrue(first.invalidate(1))
+        self.assertIsNone(second.get(1))
+        self.assertNotIn(1, first)
+        self.assertEqual(len(first), 0)
+
+    def test_probing_and_eviction(self):
+        cache = self.open_cache(capacity=16, max_probes=4)
+
+        for user_id in range(1, 101):
+            cache.put(user_id, vote_info(user_id, until_next_vote=user_id))
+
+        # every user id hashes to a window of 4 records, the entries expiring first were replaced
+        self.assertEqual(len(cache), 16)
+        self.assertEqual(cache.evictions, 84)
+        self.assertEqual(cache.get(100).monthly_votes, 1)
+
+        cache.invalidate(100)
+        cache.put(100, vote_info(100, monthly_votes=2))
+        self.assertEqual(cache.get(100).monthly_votes, 2)
+        self.assertEqual(len(cache), 16)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_probing_wraps_around(self):
+        cache = self.open_cache(capacity=16, max_probes=16)
+
+        for user_id in range(1, 17):
+            cache.put(user_id, vote_info(user_id, monthly_votes=user_id))
+
+        # with every record taken, most user ids are stored past the end of the table, in the first records
+        self.assertEqual([cache.get(user_id).monthly_votes for user_id in range(1, 17)], list(range(1, 17)))
+        self.assertFalse(cache.invalidate(100))
+
+        for user_id in range(1, 17):
+            self.assertTrue(cache.invalidate(user_id))
+
+        self.assertEqual(len(cache), 0)
+
+    def test_stale_entries(self):
+        cache = self.open_cache(capacity=16, stale_ttl=datetime.timedelta(minutes=1))
+        cache.put(1, vote_info(1, until_next_vote=0.05))
+        time.sleep(0.1)
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(1, allow_stale=True).until_next_vote.total_seconds(), 0)
+        self.assertEqual(cache.stale_hits, 1)
+
+    def test_shared_between_processes(self):
+        cache = self.open_cache(capacity=1024)
+        script = (f"from diffcord import SharedMemoryVoteInfoCache\n"
+                  f"cache = SharedMemoryVoteInfoCache({self.path!r}, capacity=1024)\n"
+                  f"for user_id in range(1, 501):\n"
+                  f"    cache.put(user_id, {{'user_id': str(user_id), 'bot_id': '5678', 'monthly_votes': user_id,"
+                  f" 'since_last_vote': None, 'until_next_vote': 3600}})\n")
+        subprocess.run([sys.executable, "-c", script], check=True, timeout=30)
+
+        self.assertEqual([cache.get(user_id).monthly_votes for user_id in range(1, 501)], list(range(1, 501)))
+        self.assertIsNone(cache.get(1).since_last_vote)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from diffcord import UserBotVote, VoteWebhookListener
+from diffcord.__main__ import main
+from diffcord.capture import WebhookCapture, load_capture, replay, synthesize_capture
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestCaptureReplay(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}/"
+
+    async def open_listener(self, **kwargs) -> list:
+        received = []
+
+        async def handle_vote(vote: UserBotVote):
+            received.append(vote)
+
+        listener = VoteWebhookListener(self.port, handle_vote, host="127.0.0.1", silent=True, verify_code="secret",
+                                       engine="asyncio", **kwargs)
+        await listener.start()
+        self.addAsyncCleanup(listener.stop)
+        return received
+
+    def test_synthesize_capture(self):
+        webhooks = synthesize_capture(2000, rate=1000, users=100, distribution="zipf", test_ratio=0.1, seed=1)
+        votes = [json.loads(webhook.body) for webhook in webhooks]
+
+        again = synthesize_capture(2000, rate=1000, users=100, distribution="zipf", test_ratio=0.1, seed=1)
+        self.assertTrue(all(a.offset == b.offset and a.body[:100] == b.body[:100] for a, b in zip(webhooks, again)))
+        self.assertTrue(all(a.offset <= b.offset for a, b in zip(webhooks, webhooks[1:])))
+        self.assertAlmostEqual(webhooks[-1].offset, 2.0, delta=0.3)
+        self.assertAlmostEqual(sum(vote["test"] for vote in votes) / len(votes), 0.1, delta=0.03)
+        # the top voter of a zipf distribution votes far more often than an average one
+        self.assertGreater(max(vote["monthly_votes"] for vote in votes), 5 * len(votes) / 100)
+
+        with self.assertRaises(ValueError):
+            synthesize_capture(1, distribution="normal")
+
+    async def test_capture_and_replay(self):
+        path = os.path.join(self.directory.name, "votes.jsonl")
+        capture = WebhookCapture(path)
+        received = await self.open_listener(capture=capture)
+
+        webhooks = synthesize_capture(50, rate=500, verify_code="secret", seed=2)
+        webhooks.append(webhooks[0]._replace(authorization="wrong", body=b"\xff not json"))
+        report = await replay(self.url, webhooks, speed=1.0, concurrency=4)
+
+        self.assertEqual(report.sent, 51)
+        self.assertEqual(report.statuses, {200: 50, 403: 1})
+        self.assertEqual(len(received), 50)
+        self.assertIsNotNone(report.percentile(0.99))
+
+        capture.close()
+        captured = load_capture(path)
+        # in the order they arrived over the concurrent connections
+        self.assertEqual(sorted((webhook.authorization, webhook.body) for webhook in captured),
+                         sorted((webhook.authorization, webhook.body) for webhook in webhooks))
+        self.assertAlmostEqual(captured[-1].offset, webhooks[-1].offset, delta=0.2)
+
+        # replayed as fast as possible, with the recorded verification codes replaced (the body stays invalid)
+        report = await replay(self.url, captured, speed=0, concurrency=8, verify_code="secret")
+        self.assertEqual(report.statuses, {200: 50, 400: 1})
+
+    async def test_replay_reports_connection_errors(self):
+        report = await replay(self.url, synthesize_capture(3, seed=3), speed=0, concurrency=2)
+
+        self.assertEqual((report.sent, report.errors, report.throughput), (3, 3, 0.0))
+        self.assertIsNone(report.percentile(0.5))
+
+    async def test_replay_command(self):
+        received = await self.open_listener()
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            status = await asyncio.get_running_loop().run_in_executor(None, main, [
+                "replay", self.url, "--synthesize", "200", "--users", "20", "--verify-code", "secret", "--max-speed",
+                "--concurrency", "8", "--json"])
+
+        report = json.loads(output.getvalue())
+        self.assertEqual(status, 0)
+        self.assertEqual(report["statuses"], {"200": 200})
+        self.assertEqual(set(report["latency"]), {"p50", "p90", "p99", "max"})
+        self.assertEqual(len(received), 200)
+
+    def test_record_command(self):
+        path = os.path.join(self.directory.name, "votes.jsonl")
+        process = subprocess.Popen([sys.executable, "-m", "diffcord", "record", "--host", "127.0.0.1", "--port",
+                                    str(self.port), "--output", path, "--count", "5", "--duration", "20"],
+                                   stderr=subprocess.PIPE)
+        self.addCleanup(process.kill)
+        self.addCleanup(process.stderr.close)
+
+        # wait for the listener to accept connections
+        deadline = time.monotonic() + 10
+
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+
+        report = asyncio.run(replay(self.url, synthesize_capture(5, seed=4), speed=0))
+
+        self.assertEqual(report.statuses, {200: 5})
+        self.assertEqual(process.wait(10), 0)
+        self.assertEqual(len(load_capture(path)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
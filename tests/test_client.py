@@ -1,7 +1,302 @@
+import asyncio
+import datetime
 import unittest
 
+import httpx
+
+from diffcord import Client, InvalidTokenException, RateLimitException, ServerException, UserBotVote, VoteInfoCache, \
+    VoteReminderScheduler, VoteWebhookListener
+from diffcord.testing import FakeDiffcordServer
+
 
 class TestClient(unittest.IsolatedAsyncioTestCase):
     __PORT = 31412
 
-    # TODO
+    @staticmethod
+    def create_client(handler, vote_listener: VoteWebhookListener = None, **kwargs) -> Client:
+        return Client(None, "token", vote_listener, base_url="http://diffcord.test/api", transport=httpx.MockTransport(handler),
+                      **kwargs)
+
+    async def test_reuses_pooled_http_client(self):
+        requested_urls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requested_urls.append(str(request.url))
+            return httpx.Response(200, json={"data": {"month_votes": 7}})
+
+        async with self.create_client(handler) as client:
+            http_client = client.http_client
+
+            self.assertEqual(await client.bot_votes_this_month(), 7)
+            self.assertEqual(await client.bot_votes_this_month(), 7)
+            self.assertIs(client.http_client, http_client)
+
+        self.assertTrue(http_client.is_closed)
+        self.assertEqual(requested_urls, ["http://diffcord.test/api/v1/votes"] * 2)
+
+    async def test_retries_after_rate_limit(self):
+        responses = [
+            httpx.Response(429, json={"error": {"message": "Too many requests", "code": "ERR_RATE_LIMITED"}},
+                           headers={"Retry-After": "0.05"}),
+            httpx.Response(200, json={"data": {"month_votes": 3}}),
+        ]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return responses.pop(0)
+
+        async with self.create_client(handler) as client:
+            self.assertEqual(await client.bot_votes_this_month(), 3)
+
+        self.assertEqual(responses, [])
+
+    async def test_raises_when_rate_limit_retries_exhausted(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(429, json={"error": {"message": "Too many requests", "code": "ERR_RATE_LIMITED"}},
+                                  headers={"Retry-After": "120"})
+
+        async with self.create_client(handler) as client:
+            with self.assertRaises(RateLimitException):
+                await client.bot_votes_this_month()
+
+    async def test_vote_info_cache_invalidated_by_votes(self):
+        requests = 0
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+            return httpx.Response(200, json={"data": {"user_id": "1234", "bot_id": "5678", "monthly_votes": requests,
+                                                      "since_last_vote": 10, "until_next_vote": 3600}})
+
+        async def handle_vote(vote: UserBotVote):
+            pass
+
+        cache = VoteInfoCache()
+        listener = VoteWebhookListener(0, handle_vote, host="127.0.0.1", silent=True)
+
+        async with self.create_client(handler, vote_listener=listener, vote_info_cache=cache) as client:
+            self.assertEqual((await client.get_user_vote_info(1234)).monthly_votes, 1)
+            self.assertEqual((await client.get_user_vote_info("1234")).monthly_votes, 1)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            for observer in listener.vote_observers:
+                observer(UserBotVote("vote", "1234", "5678", "0", False, False, 2))
+
+            self.assertEqual((await client.get_user_vote_info(1234)).monthly_votes, 2)
+            self.assertEqual(cache.invalidations, 1)
+            self.assertEqual(requests, 2)
+
+    async def test_coalesces_concurrent_identical_reads(self):
+        requests = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+            await asyncio.sleep(0.02)
+
+            if request.url.path.endswith("/2/votes"):
+                return httpx.Response(500, json={"error": {"message": "Server error", "code": "ERR_SERVER"}})
+
+            return httpx.Response(200, json={"data": {"user_id": "1", "bot_id": "5678", "monthly_votes": 4,
+                                                      "since_last_vote": None, "until_next_vote": 0}})
+
+        async with self.create_client(handler) as client:
+            results = await asyncio.gather(*(client.get_user_vote_info(1) for _ in range(10)),
+                                           *(client.get_user_vote_info(2) for _ in range(5)), return_exceptions=True)
+
+            self.assertEqual(requests, 2)
+            self.assertTrue(all(result.monthly_votes == 4 for result in results[:10]))
+            self.assertTrue(all(isinstance(result, ServerException) for result in results[10:]))
+            self.assertEqual(client.single_flight.coalesced, 13)
+
+            await client.get_user_vote_info(1)
+            self.assertEqual(requests, 3)
+
+    async def test_coalesces_concurrent_conditional_reads(self):
+        requests = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+            await asyncio.sleep(0.02)
+
+            if request.headers.get("If-None-Match") == '"1"':
+                return httpx.Response(304, headers={"ETag": '"1"'})
+
+            return httpx.Response(200, json={"data": {"month_votes": 7}}, headers={"ETag": '"1"'})
+
+        async with self.create_client(handler) as client:
+            results = await asyncio.gather(*(client.make_conditional_request("/v1/votes") for _ in range(5)),
+                                           *(client.make_conditional_request("/v1/votes", '"1"') for _ in range(5)))
+
+            self.assertEqual(requests, 2)
+            self.assertEqual(results[:5], [({"month_votes": 7}, '"1"')] * 5)
+            self.assertEqual(results[5:], [(None, '"1"')] * 5)
+
+    async def test_get_many_user_vote_info(self):
+        in_flight = 0
+        peak = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal in_flight, peak
+            user_id = request.url.path.split("/")[-2]
+
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+            if user_id == "13":
+                return httpx.Response(404, json={"error": {"message": "Unknown user", "code": "ERR_NOT_FOUND"}})
+
+            return httpx.Response(200, json={"data": {"user_id": user_id, "bot_id": "5678", "monthly_votes": 1,
+                                                      "since_last_vote": None, "until_next_vote": 0}})
+
+        async with self.create_client(handler) as client:
+            results = [result async for result in client.get_many_user_vote_info(range(50), concurrency=4)]
+
+        self.assertEqual(sorted(result.user_id for result in results), list(range(50)))
+        self.assertEqual([result.user_id for result in results if not result.ok], [13])
+        self.assertTrue(all(result.vote_info.user_id == str(result.user_id) for result in results if result.ok))
+        self.assertEqual(peak, 4)
+
+    async def test_against_fake_server(self):
+        received = []
+
+        async def handle_vote(vote: UserBotVote):
+            received.append(vote)
+
+        listener = VoteWebhookListener(TestClient.__PORT, handle_vote, host="127.0.0.1", silent=True,
+                                       verify_code="secret")
+        await listener.start()
+        self.addAsyncCleanup(listener.stop)
+
+        async with FakeDiffcordServer() as server, Client(None, "token", None, base_url=server.base_url) as client:
+            url = f"http://127.0.0.1:{TestClient.__PORT}/"
+
+            self.assertEqual(await server.send_vote(url, "secret", user_id="1234"), 200)
+            self.assertEqual(await server.send_vote(url, "wrong", user_id="1234"), 403)
+            self.assertEqual(await server.send_vote(url, "secret", user_id="1234", test=True), 200)
+
+            self.assertEqual([vote.test for vote in received], [False, True])
+            self.assertEqual(await client.bot_votes_this_month(), 2)
+
+            vote_info = await client.get_user_vote_info(1234)
+            self.assertEqual(vote_info.monthly_votes, 2)
+            self.assertFalse(vote_info.can_vote)
+
+            self.assertTrue((await client.get_user_vote_info(42)).can_vote)
+            self.assertEqual(server.requests["GET /v1/users/42/votes"], 1)
+
+    async def test_fake_server_fault_injection(self):
+        async with FakeDiffcordServer(retry_after=datetime.timedelta(milliseconds=20)) as server, \
+                Client(None, "token", None, base_url=server.base_url) as client:
+            server.inject(429, count=2)
+            self.assertEqual(await client.bot_votes_this_month(), 0)
+            self.assertEqual(server.requests["GET /v1/votes"], 3)
+
+            server.inject(500)
+            with self.assertRaises(ServerException):
+                await client.bot_votes_this_month()
+
+        async with FakeDiffcordServer(token="other") as server, \
+                Client(None, "token", None, base_url=server.base_url) as client:
+            with self.assertRaises(InvalidTokenException):
+                await client.bot_votes_this_month()
+
+    async def test_bot_votes_stale_while_revalidate(self):
+        month_votes = 5
+        statuses = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            etag = f'"{month_votes}"'
+
+            if request.headers.get("If-None-Match") == etag:
+                statuses.append(304)
+                return httpx.Response(304, headers={"ETag": etag})
+
+            statuses.append(200)
+            return httpx.Response(200, json={"data": {"month_votes": month_votes}}, headers={"ETag": etag})
+
+        async def handle_vote(vote: UserBotVote):
+            pass
+
+        listener = VoteWebhookListener(0, handle_vote, host="127.0.0.1", silent=True)
+
+        async with self.create_client(handler, vote_listener=listener,
+                                      bot_votes_soft_ttl=datetime.timedelta(milliseconds=50)) as client:
+            self.assertEqual(await client.bot_votes_this_month(), 5)
+
+            # counted locally without asking the API
+            for observer in listener.vote_observers:
+                observer(UserBotVote("vote", "1234", "5678", "0", False, False, 1))
+                observer(UserBotVote("vote", "1234", "5678", "0", False, True, 1))
+
+            self.assertEqual(await client.bot_votes_this_month(), 6)
+            self.assertEqual(statuses, [200])
+
+            # answered right away with the old value, refreshed in the background
+            month_votes = 6
+            await asyncio.sleep(0.06)
+            self.assertEqual(await client.bot_votes_this_month(), 6)
+            await asyncio.sleep(0.01)
+            self.assertEqual(statuses, [200, 200])
+
+            await asyncio.sleep(0.06)
+            await client.bot_votes_this_month()
+            await asyncio.sleep(0.01)
+            self.assertEqual(statuses, [200, 200, 304])
+
+            month_votes = 9
+            await asyncio.sleep(0.06)
+            await client.bot_votes_this_month()
+            await asyncio.sleep(0.01)
+            self.assertEqual(await client.bot_votes_this_month(), 9)
+
+    async def test_bot_votes_refresh_failures(self):
+        requests = 0
+        failures = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+
+            if requests > 1:
+                return httpx.Response(500, json={"error": {"message": "Server error", "code": "ERR_SERVER"}})
+
+            return httpx.Response(200, json={"data": {"month_votes": 5}})
+
+        async def on_failure(e: Exception):
+            failures.append(e)
+
+        async with self.create_client(handler, bot_votes_soft_ttl=datetime.timedelta(milliseconds=50),
+                                      bot_votes_refresh_failure=on_failure) as client:
+            self.assertEqual(await client.bot_votes_this_month(), 5)
+            await asyncio.sleep(0.06)
+
+            # the failed refresh is only retried after another soft TTL, the old value is served meanwhile
+            for _ in range(5):
+                self.assertEqual(await client.bot_votes_this_month(), 5)
+                await asyncio.sleep(0.005)
+
+            self.assertEqual(requests, 2)
+            self.assertEqual(len(failures), 1)
+            self.assertIsInstance(failures[0], ServerException)
+
+    async def test_vote_lookups_schedule_reminders(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            user_id = request.url.path.split("/")[-2]
+            return httpx.Response(200, json={"data": {"user_id": user_id, "bot_id": "5678", "monthly_votes": 1,
+                                                      "since_last_vote": 10, "until_next_vote": 3600 * (user_id == "1")}})
+
+        async def on_vote_available(user_id: int):
+            pass
+
+        reminders = VoteReminderScheduler(on_vote_available)
+        listener = VoteWebhookListener(0, on_vote_available, host="127.0.0.1", silent=True)
+
+        async with self.create_client(handler, vote_listener=listener, vote_reminders=reminders) as client:
+            await client.get_user_vote_info(1)
+            await client.get_user_vote_info(2)
+
+            self.assertEqual(reminders.pending, 1)
+            self.assertIn(reminders.observe_vote, listener.vote_observers)
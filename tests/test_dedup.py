@@ -0,0 +1,56 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from diffcord import VoteDeduplicator
+
+
+class TestVoteDeduplicator(unittest.TestCase):
+
+    def test_duplicate_votes_are_not_delivered_twice(self):
+        deduplicator = VoteDeduplicator()
+
+        self.assertTrue(deduplicator.begin("vote"))
+        # a retry arriving while the first delivery is still running
+        self.assertFalse(deduplicator.begin("vote"))
+
+        deduplicator.complete("vote", True)
+        self.assertFalse(deduplicator.begin("vote"))
+
+    def test_failed_votes_are_delivered_again(self):
+        deduplicator = VoteDeduplicator()
+
+        self.assertTrue(deduplicator.begin("vote"))
+        deduplicator.complete("vote", False)
+        self.assertTrue(deduplicator.begin("vote"))
+
+    def test_bounded_memory(self):
+        deduplicator = VoteDeduplicator(max_entries=3)
+
+        for vote_id in range(10):
+            deduplicator.add(str(vote_id))
+
+        self.assertEqual(len(deduplicator), 3)
+        self.assertNotIn("6", deduplicator)
+        self.assertIn("9", deduplicator)
+
+    def test_horizon(self):
+        deduplicator = VoteDeduplicator(horizon=datetime.timedelta(seconds=-1))
+        deduplicator.add("vote")
+
+        self.assertTrue(deduplicator.begin("vote"))
+
+    def test_survives_restarts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "votes.dedup")
+
+            deduplicator = VoteDeduplicator(path=path)
+            deduplicator.add("first")
+            deduplicator.add("second")
+            deduplicator.close()
+
+            deduplicator = VoteDeduplicator(path=path)
+            self.assertIn("first", deduplicator)
+            self.assertFalse(deduplicator.begin("second"))
+            deduplicator.close()
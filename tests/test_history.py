@@ -0,0 +1,86 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from diffcord import UserBotVote, VoteHistory
+from diffcord.history import FLAG_REWARDED, FLAG_TEST
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HOUR = 3600.0
+
+
+class TestVoteHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    @staticmethod
+    def vote(user_id: int, voted_at: float, delay: float = 1.0, rewarded: bool = False,
+             test: bool = False) -> UserBotVote:
+        vote = UserBotVote(f"{user_id}-{voted_at}", str(user_id), "99", since_vote=str(delay), rewarded=rewarded,
+                           test=test, monthly_votes=1)
+        vote.received_at = voted_at + delay
+        return vote
+
+    def fill(self, history: VoteHistory) -> None:
+        for user_id, hour, delay, rewarded, test in [(1, 0, 1, True, False), (2, 0, 2, False, False),
+                                                     (1, 1, 3, True, False), (3, 1, 4, False, True),
+                                                     (1, 2, 5, True, False), (2, 2, 6, False, False)]:
+            history.append(self.vote(user_id, hour * HOUR + 60, delay, rewarded, test))
+
+    def test_appends_across_segments_and_reopens(self):
+        history = VoteHistory(self.directory.name, segment_size=4)
+        self.fill(history)
+
+        self.assertEqual(len(history), 6)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["votes-000000.seg", "votes-000001.seg"])
+        history.close()
+
+        history = VoteHistory(self.directory.name, segment_size=4)
+        history.append(self.vote(4, 3 * HOUR, 0.5))
+        rows = list(history.rows())
+        history.close()
+
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0], (1, 99, 60.0, 61.0, 1, FLAG_REWARDED))
+        self.assertEqual(rows[3][-1], FLAG_TEST)
+        self.assertEqual(rows[-1][:4], (4, 99, 3 * HOUR, 3 * HOUR + 0.5))
+
+    def test_rejects_foreign_files(self):
+        with open(os.path.join(self.directory.name, "votes-000000.seg"), "wb") as file:
+            file.write(b"\0" * 64)
+
+        with self.assertRaises(ValueError):
+            VoteHistory(self.directory.name)
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_queries(self):
+        history = VoteHistory(self.directory.name, segment_size=4)
+        self.fill(history)
+        self.addCleanup(history.close)
+
+        starts, counts = history.votes_over_time(datetime.timedelta(hours=1))
+        self.assertEqual(starts.tolist(), [0.0, HOUR, 2 * HOUR])
+        self.assertEqual(counts.tolist(), [2, 1, 2])
+        self.assertEqual(history.votes_over_time(include_test=True)[1].tolist(), [2, 2, 2])
+
+        user_ids, counts = history.votes_per_user()
+        self.assertEqual(dict(zip(user_ids.tolist(), counts.tolist())), {1: 3, 2: 2})
+
+        vote_counts, users = history.repeat_voter_cohorts()
+        self.assertEqual(dict(zip(vote_counts.tolist(), users.tolist())), {2: 1, 3: 1})
+
+        start = datetime.datetime.fromtimestamp(HOUR, datetime.timezone.utc)
+        self.assertEqual(len(history.columns(start=start)["user_id"]), 3)
+        self.assertEqual(history.delivery_latency([0.5], rewarded=True).tolist(), [3.0])
+        self.assertTrue(numpy.isnan(history.delivery_latency([0.5], start=start, end=start)[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import subprocess
+import sys
+import unittest
+
+
+class TestImport(unittest.TestCase):
+
+    @staticmethod
+    def loaded_modules(statement: str) -> str:
+        probe = f"import sys\n{statement}\nprint('httpx' in sys.modules, 'tornado' in sys.modules)"
+        return subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True).stdout.strip()
+
+    def test_heavy_dependencies_load_lazily(self):
+        self.assertEqual(self.loaded_modules("import diffcord"), "False False")
+        self.assertEqual(self.loaded_modules("from diffcord import UserBotVote, VoteInfoCache, RateLimitException"),
+                         "False False")
+        self.assertEqual(self.loaded_modules("from diffcord import Client"), "True False")
+        self.assertEqual(self.loaded_modules("from diffcord import VoteWebhookListener\n"
+                                             "VoteWebhookListener(0, print, silent=True)"), "False True")
+
+    def test_lazy_exports(self):
+        import diffcord
+        from diffcord.client import Client
+        from diffcord.listener import VoteWebhookListener
+
+        self.assertIs(diffcord.Client, Client)
+        self.assertIs(diffcord.VoteWebhookListener, VoteWebhookListener)
+        self.assertIn("MetricsRegistry", dir(diffcord))
+
+        with self.assertRaises(AttributeError):
+            diffcord.Missing
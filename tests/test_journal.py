@@ -0,0 +1,58 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+
+from diffcord import VoteJournal
+
+
+class TestVoteJournal(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def open_journal(self, **kwargs) -> VoteJournal:
+        journal = VoteJournal(self.directory.name, group_commit_interval=datetime.timedelta(milliseconds=1), **kwargs)
+        self.assertEqual(journal.open(), [])
+        return journal
+
+    def reopen(self, journal: VoteJournal) -> list:
+        journal.close()
+        return VoteJournal(self.directory.name).open()
+
+    async def test_replays_unfinished_votes(self):
+        journal = self.open_journal()
+
+        await asyncio.gather(*(journal.append(f"vote-{i}", f'{{"vote": {i}}}'.encode()) for i in range(3)))
+        journal.mark_done("vote-1")
+
+        self.assertEqual(self.reopen(journal), [b'{"vote": 0}', b'{"vote": 2}'])
+
+    async def test_ignores_torn_records(self):
+        journal = self.open_journal()
+
+        await journal.append("vote", b'{"vote": 0}')
+        journal.close()
+
+        segment = os.path.join(self.directory.name, os.listdir(self.directory.name)[0])
+        with open(segment, "ab") as file:
+            file.write(b"\x10\x00\x00")
+
+        self.assertEqual(VoteJournal(self.directory.name).open(), [b'{"vote": 0}'])
+
+    async def test_rotates_and_compacts_segments(self):
+        journal = self.open_journal(segment_size=256, compaction_threshold=1)
+
+        for i in range(50):
+            await journal.append(f"vote-{i}", b"x" * 32)
+
+            if i != 7:
+                journal.mark_done(f"vote-{i}")
+
+        await journal.append("last", b"y")
+
+        self.assertLessEqual(len(os.listdir(self.directory.name)), 2)
+        self.assertEqual(journal.pending, 2)
+        self.assertEqual(self.reopen(journal), [b"x" * 32, b"y"])
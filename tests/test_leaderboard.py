@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from diffcord import UserBotVote, VoteLeaderboard, VoteWebhookListener
+
+
+class TestVoteLeaderboard(unittest.TestCase):
+
+    @staticmethod
+    def vote(user_id: int, monthly_votes: int, test: bool = False, voted_at: str = None) -> UserBotVote:
+        return UserBotVote(f"{user_id}-{monthly_votes}", str(user_id), "99", since_vote=None if voted_at else "0",
+                           test=test, monthly_votes=monthly_votes, voted_at=voted_at)
+
+    def test_top_and_rank(self):
+        leaderboard = VoteLeaderboard()
+
+        for user_id, monthly_votes in [(1, 1), (2, 1), (3, 1), (1, 2), (2, 2), (1, 3), (4, 200)]:
+            leaderboard.observe_vote(self.vote(user_id, monthly_votes))
+
+        # retries and test votes do not change the leaderboard
+        leaderboard.observe_vote(self.vote(1, 2))
+        leaderboard.observe_vote(self.vote(3, 50, test=True))
+        # neither do votes from a previous month
+        leaderboard.observe_vote(self.vote(3, 60, voted_at="2020-01-31T23:59:59+00:00"))
+
+        self.assertEqual(leaderboard.top(3), [(4, 200), (1, 3), (2, 2)])
+        self.assertEqual(leaderboard.top(10)[-1], (3, 1))
+        self.assertEqual([leaderboard.rank(user_id) for user_id in (4, 1, 2, 3, 5)], [1, 2, 3, 4, None])
+        self.assertEqual(leaderboard.votes("1"), 3)
+
+        leaderboard.observe_vote(self.vote(5, 2))
+        self.assertEqual((leaderboard.rank(2), leaderboard.rank(5), leaderboard.rank(3)), (3, 3, 5))
+
+    def test_resets_at_month_boundary(self):
+        leaderboard = VoteLeaderboard()
+        leaderboard.observe_vote(self.vote(1, 5))
+
+        with mock.patch("time.time", return_value=time.time() + 32 * 24 * 3600):
+            self.assertEqual(leaderboard.top(), [])
+            self.assertIsNone(leaderboard.rank(1))
+
+    def test_snapshot_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "leaderboard.json")
+
+            leaderboard = VoteLeaderboard(path=path)
+            for user_id, monthly_votes in [(1, 2), (2, 2), (3, 1)]:
+                leaderboard.observe_vote(self.vote(user_id, monthly_votes))
+            leaderboard.close()
+
+            restored = VoteLeaderboard(path=path)
+            self.assertEqual(restored.top(), [(1, 2), (2, 2), (3, 1)])
+            self.assertEqual(len(restored), 3)
+
+    def test_attached_to_listener(self):
+        leaderboard = VoteLeaderboard()
+        listener = VoteWebhookListener(0, print, host="127.0.0.1", silent=True, engine="asyncio",
+                                       leaderboard=leaderboard)
+
+        self.assertIn(leaderboard.observe_vote, listener.vote_observers)
@@ -0,0 +1,90 @@
+import datetime
+import unittest
+
+import aiohttp
+
+from diffcord import Client, MetricsRegistry, StatsReporter, UserBotVote, VoteWebhookListener
+from diffcord.testing import FakeDiffcordServer
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    __PORT = 31412
+
+    def test_render_prometheus_text(self):
+        metrics = MetricsRegistry()
+        forwarded = []
+        metrics.add_callback(lambda name, labels, value: forwarded.append((name, labels, value)))
+
+        requests = metrics.counter("requests_total", "Requests", ("status",))
+        latency = metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+        requests.inc(status=200)
+        requests.inc(2, status=200)
+        latency.observe(0.05)
+        latency.observe(0.5)
+
+        self.assertIs(metrics.counter("requests_total", "Requests", ("status",)), requests)
+        with self.assertRaises(ValueError):
+            metrics.histogram("requests_total", "Requests")
+
+        self.assertEqual(metrics.render(), "\n".join([
+            "# HELP diffcord_requests_total Requests",
+            "# TYPE diffcord_requests_total counter",
+            'diffcord_requests_total{status="200"} 3',
+            "# HELP diffcord_latency_seconds Latency",
+            "# TYPE diffcord_latency_seconds histogram",
+            'diffcord_latency_seconds_bucket{le="0.1"} 1',
+            'diffcord_latency_seconds_bucket{le="1"} 2',
+            'diffcord_latency_seconds_bucket{le="+Inf"} 2',
+            "diffcord_latency_seconds_sum 0.55",
+            "diffcord_latency_seconds_count 2",
+        ]) + "\n")
+
+        self.assertEqual(forwarded[0], ("diffcord_requests_total", {"status": 200}, 1.0))
+        self.assertEqual(len(forwarded), 4)
+
+    async def test_client_listener_and_stats_metrics(self):
+        metrics = MetricsRegistry()
+
+        async def handle_vote(vote: UserBotVote):
+            if vote.test:
+                raise ValueError("test vote")
+
+        listener = VoteWebhookListener(TestMetrics.__PORT, handle_vote, host="127.0.0.1", silent=True,
+                                       verify_code="secret", metrics=metrics, metrics_path="/metrics")
+        await listener.start()
+        self.addAsyncCleanup(listener.stop)
+
+        async with FakeDiffcordServer() as server, Client(None, "token", None, base_url=server.base_url,
+                                                          metrics=metrics) as client:
+            url = f"http://127.0.0.1:{TestMetrics.__PORT}/"
+
+            await server.send_vote(url, "secret")
+            await server.send_vote(url, "secret", test=True)
+            await server.send_vote(url, "wrong")
+
+            server.inject(429, retry_after=datetime.timedelta(milliseconds=10))
+            await client.bot_votes_this_month()
+            await client.get_user_vote_info(1234)
+
+            reporter = StatsReporter(lambda count: client.make_request("POST", "/v1/stats", params={"guilds": count}),
+                                     lambda: 5, metrics=metrics)
+            await reporter.report()
+            await reporter.report()
+
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url + "metrics") as response:
+                    self.assertEqual(response.status, 200)
+                    text = await response.text()
+
+        self.assertIn('diffcord_webhook_requests_total{status="200"} 1', text)
+        self.assertIn('diffcord_webhook_requests_total{status="500"} 1', text)
+        self.assertIn('diffcord_webhook_requests_total{status="403"} 1', text)
+        self.assertIn("diffcord_vote_handler_failures_total 1", text)
+        self.assertIn("diffcord_vote_handler_duration_seconds_count 2", text)
+        self.assertIn('diffcord_api_requests_total{route="GET /v1/votes",status="429"} 1', text)
+        self.assertIn('diffcord_api_requests_total{route="GET /v1/votes",status="200"} 1', text)
+        self.assertIn('diffcord_api_requests_total{route="GET /v1/users/{id}/votes",status="200"} 1', text)
+        self.assertIn('diffcord_api_rate_limited_total{route="GET /v1/votes"} 1', text)
+        self.assertIn('diffcord_stats_checks_total{result="success"} 1', text)
+        self.assertIn('diffcord_stats_checks_total{result="skipped"} 1', text)
@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import json
+import socket
+import unittest
+import uuid
+
+import aiohttp
+import httpx
+
+from diffcord import Client, MetricsRegistry, OpenTelemetryEmitter, Profiler, SlowHandlerWatchdog, UserBotVote, \
+    VoteWebhookListener
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeSpan:
+
+    def __init__(self, spans: list, name: str, start_time: int, attributes: dict):
+        self.spans = spans
+        self.span = {"name": name, "start_time": start_time, "attributes": attributes}
+
+    def end(self, end_time: int = None):
+        self.span["end_time"] = end_time
+        self.spans.append(self.span)
+
+
+class FakeTracer:
+
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name: str, start_time: int = None, attributes: dict = None) -> FakeSpan:
+        return FakeSpan(self.spans, name, start_time, attributes)
+
+
+class TestProfiling(unittest.IsolatedAsyncioTestCase):
+
+    async def open_listener(self, handle_vote, **kwargs) -> str:
+        port = free_port()
+        listener = VoteWebhookListener(port, handle_vote, host="127.0.0.1", silent=True, verify_code="secret",
+                                       engine="asyncio", **kwargs)
+        await listener.start()
+        self.addAsyncCleanup(listener.stop)
+        return f"http://127.0.0.1:{port}/"
+
+    @staticmethod
+    async def post(url: str, body: bytes, authorization: str = "secret") -> int:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, data=body, headers={"Authorization": authorization}) as response:
+                return response.status
+
+    @staticmethod
+    def vote_body(user_id: str = "1234") -> bytes:
+        return json.dumps({"vote_id": str(uuid.uuid4()), "user_id": user_id, "bot_id": "5678", "rewarded": False,
+                           "test": False, "monthly_votes": 1}).encode()
+
+    async def test_webhook_stages(self):
+        timings = []
+        tracer = FakeTracer()
+        metrics = MetricsRegistry()
+        profiler = Profiler([timings.append, OpenTelemetryEmitter(tracer)], metrics=metrics)
+
+        async def handle_vote(vote: UserBotVote):
+            if vote.user_id == 666:
+                raise RuntimeError("handler failed")
+
+        url = await self.open_listener(handle_vote, profiler=profiler)
+
+        self.assertEqual(await self.post(url, self.vote_body()), 200)
+        self.assertEqual([timing.stage for timing in timings],
+                         ["webhook.auth", "webhook.parse", "webhook.vote", "webhook.handler"])
+        self.assertTrue(all(timing.duration >= 0 for timing in timings))
+
+        timings.clear()
+        self.assertEqual(await self.post(url, self.vote_body(), authorization="wrong"), 403)
+        self.assertEqual(await self.post(url, b"not json"), 400)
+        self.assertEqual(await self.post(url, b"[]"), 400)
+        self.assertEqual(await self.post(url, self.vote_body("666")), 500)
+
+        self.assertEqual([timing.stage for timing in timings],
+                         ["webhook.auth", "webhook.auth", "webhook.parse", "webhook.auth", "webhook.parse",
+                          "webhook.auth", "webhook.parse", "webhook.vote", "webhook.handler"])
+        self.assertFalse(timings[0].attributes["authorized"])
+        self.assertEqual(timings[-1].attributes["error"], "RuntimeError")
+        self.assertEqual(metrics.get("stage_duration_seconds").count(stage="webhook.auth"), 5)
+
+        span = tracer.spans[-1]
+        self.assertEqual((span["name"], span["attributes"]["message"]), ("webhook.handler", "handler failed"))
+        self.assertGreaterEqual(span["end_time"], span["start_time"])
+
+    async def test_api_stages(self):
+        timings = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"data": {"month_votes": 7}})
+
+        async with Client(None, "token", None, base_url="http://diffcord.test/api",
+                          transport=httpx.MockTransport(handler), profiler=Profiler([timings.append])) as client:
+            self.assertEqual(await client.bot_votes_this_month(), 7)
+
+        self.assertEqual([timing.stage for timing in timings],
+                         ["api.rate_limit_wait", "api.http", "api.parse", "api.request"])
+        self.assertEqual(timings[1].attributes["status"], 200)
+        self.assertGreaterEqual(timings[-1].duration, timings[1].duration)
+
+    async def test_conditional_api_stages(self):
+        timings = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"data": {"month_votes": 7}}, headers={"ETag": '"1"'})
+
+        async with Client(None, "token", None, base_url="http://diffcord.test/api",
+                          transport=httpx.MockTransport(handler), profiler=Profiler([timings.append])) as client:
+            self.assertEqual(await client.make_conditional_request("/v1/votes"), ({"month_votes": 7}, '"1"'))
+
+        self.assertEqual([timing.stage for timing in timings],
+                         ["api.rate_limit_wait", "api.http", "api.parse", "api.request"])
+
+    async def test_watchdog_flags_slow_handlers(self):
+        reports = []
+        profiles = []
+        release = asyncio.Event()
+
+        async def handle_vote(vote: UserBotVote):
+            if vote.user_id == 1:
+                await release.wait()
+
+        watchdog = SlowHandlerWatchdog(threshold=datetime.timedelta(milliseconds=50), on_slow=reports.append,
+                                       sample_duration=datetime.timedelta(milliseconds=250),
+                                       sample_interval=datetime.timedelta(milliseconds=1), on_profile=profiles.append)
+        url = await self.open_listener(handle_vote, watchdog=watchdog)
+        # runs before the listener stops, which waits for the handler
+        self.addCleanup(release.set)
+
+        self.assertEqual(await self.post(url, self.vote_body("2")), 200)
+        slow = asyncio.ensure_future(self.post(url, self.vote_body("1")))
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(len(reports), 1)
+        self.assertEqual((reports[0].vote.user_id, watchdog.running, watchdog.flagged), (1, 1, 1))
+        self.assertGreaterEqual(reports[0].elapsed, 0.05)
+        self.assertIn("handle_vote", reports[0].stack)
+        self.assertTrue(watchdog.sampling)
+
+        release.set()
+        self.assertEqual(await slow, 200)
+        self.assertEqual(watchdog.running, 0)
+
+        await asyncio.sleep(0.25)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(any("asyncio" in stack for stack in profiles[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+
+import httpx
+
+from diffcord import Priority, RequestScheduler
+
+
+class TestRequestScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_route_key_collapses_ids(self):
+        self.assertEqual(RequestScheduler.route_key("get", "/v1/users/1234/votes"), "GET /v1/users/{id}/votes")
+
+    async def test_interactive_requests_overtake_background_requests(self):
+        scheduler = RequestScheduler()
+        route = scheduler.route_key("GET", "/v1/votes")
+        order = []
+
+        # block the route for a short while
+        scheduler.update(route, httpx.Response(429, headers={"Retry-After": "0.05"}))
+
+        async def request(name: str, priority: Priority):
+            await scheduler.acquire(route, priority)
+            order.append(name)
+            scheduler.release(route)
+
+        await asyncio.gather(request("stats", Priority.BACKGROUND), request("default", Priority.DEFAULT),
+                             request("command", Priority.INTERACTIVE))
+
+        self.assertEqual(order, ["command", "default", "stats"])
+
+    async def test_concurrency_limit(self):
+        scheduler = RequestScheduler(max_concurrency=2)
+        peak = 0
+
+        async def request():
+            nonlocal peak
+            await scheduler.acquire("GET /v1/votes")
+            peak = max(peak, scheduler.in_flight)
+            await asyncio.sleep(0.01)
+            scheduler.release("GET /v1/votes")
+
+        await asyncio.gather(*(request() for _ in range(10)))
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(scheduler.in_flight, 0)
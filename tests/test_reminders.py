@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+import unittest
+
+from diffcord import UserBotVote, UserVoteInformation, VoteReminderScheduler
+
+
+class TestVoteReminderScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_reminds_users_in_order(self):
+        reminded = []
+
+        async def on_vote_available(user_id: int):
+            reminded.append(user_id)
+
+        scheduler = VoteReminderScheduler(on_vote_available, vote_cooldown=datetime.timedelta(milliseconds=60))
+        scheduler.start()
+        self.addAsyncCleanup(scheduler.stop)
+
+        scheduler.observe_vote(UserBotVote("a", "1", "99", since_vote="0"))
+        scheduler.observe_vote(UserBotVote("b", "2", "99", since_vote="0.03"))
+        # test votes do not count towards the cooldown
+        scheduler.observe_vote(UserBotVote("c", "3", "99", since_vote="0", test=True))
+        scheduler.observe_vote_info(UserVoteInformation("4", "99", 1, 10, 0))
+        scheduler.observe_vote_info(UserVoteInformation("5", "99", 1, 0, 0.01))
+
+        self.assertEqual(scheduler.pending, 3)
+        self.assertIsNotNone(scheduler.next_vote(1))
+
+        await asyncio.sleep(0.15)
+        self.assertEqual(reminded, [5, 2, 1])
+        self.assertEqual((scheduler.pending, scheduler.fired), (0, 3))
+
+    async def test_newer_vote_replaces_reminder(self):
+        reminded = []
+
+        async def on_vote_available(user_id: int):
+            reminded.append((user_id, time.time()))
+
+        scheduler = VoteReminderScheduler(on_vote_available)
+        scheduler.start()
+        self.addAsyncCleanup(scheduler.stop)
+
+        scheduler.schedule(1, time.time() + 0.02)
+        scheduler.schedule(1, time.time() + 0.06)
+        scheduler.schedule(2, time.time() + 0.02)
+        scheduler.cancel(2)
+
+        await asyncio.sleep(0.1)
+        self.assertEqual([user_id for user_id, _ in reminded], [1])
+
+    async def test_snapshot_survives_restart(self):
+        reminded = []
+
+        async def on_vote_available(user_id: int):
+            reminded.append(user_id)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "reminders")
+
+            scheduler = VoteReminderScheduler(on_vote_available, path=path)
+            scheduler.start()
+            scheduler.schedule(1, time.time() + 0.05)
+            scheduler.schedule(2, time.time() + 3600)
+            await scheduler.stop()
+
+            # the first reminder became due while stopped
+            await asyncio.sleep(0.06)
+
+            restarted = VoteReminderScheduler(on_vote_available, path=path)
+            self.assertEqual(restarted.pending, 2)
+
+            restarted.start()
+            await asyncio.sleep(0.02)
+            await restarted.stop()
+
+            self.assertEqual(reminded, [1])
+            self.assertIn(2, restarted)
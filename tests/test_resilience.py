@@ -0,0 +1,250 @@
+import asyncio
+import datetime
+import gc
+import time
+import unittest
+
+import httpx
+
+from diffcord import CircuitBreaker, CircuitOpenException, CircuitState, Client, RequestScheduler, \
+    RequestTimeoutException, ServerException, VoteInfoCache
+
+
+class TestResilience(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def create_client(handler, **kwargs) -> Client:
+        return Client(None, "token", None, base_url="http://diffcord.test/api", transport=httpx.MockTransport(handler),
+                      **kwargs)
+
+    def test_circuit_breaker_transitions(self):
+        transitions = []
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=datetime.timedelta(seconds=0.05),
+                                 on_state_change=lambda old, new: transitions.append((old, new)))
+
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertIs(breaker.state, CircuitState.CLOSED)
+
+        breaker.record_failure()
+        self.assertIs(breaker.state, CircuitState.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after, 0)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertIs(breaker.state, CircuitState.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertIs(breaker.state, CircuitState.CLOSED)
+
+        open_, closed, half_open = CircuitState.OPEN, CircuitState.CLOSED, CircuitState.HALF_OPEN
+        self.assertEqual(transitions, [(closed, open_), (open_, half_open), (half_open, open_), (open_, half_open),
+                                       (half_open, closed)])
+
+    async def test_open_circuit_serves_stale_vote_info(self):
+        requests = 0
+        failing = False
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+
+            if failing:
+                return httpx.Response(500, json={"error": {"message": "Server error", "code": "ERR_SERVER"}})
+
+            return httpx.Response(200, json={"data": {"user_id": "1", "bot_id": "5678", "monthly_votes": 4,
+                                                      "since_last_vote": None, "until_next_vote": 0}})
+
+        cache = VoteInfoCache(eligible_ttl=datetime.timedelta(seconds=0.01), stale_ttl=datetime.timedelta(minutes=1))
+        breaker = CircuitBreaker(failure_threshold=2)
+
+        async with self.create_client(handler, vote_info_cache=cache, circuit_breaker=breaker) as client:
+            self.assertEqual((await client.get_user_vote_info(1)).monthly_votes, 4)
+            await asyncio.sleep(0.02)
+            failing = True
+
+            # served from the expired entry while the API fails, then without asking the API once the circuit opened
+            for _ in range(3):
+                self.assertEqual((await client.get_user_vote_info(1)).monthly_votes, 4)
+
+            self.assertEqual(requests, 3)
+            self.assertEqual(cache.stale_hits, 3)
+            self.assertIs(breaker.state, CircuitState.OPEN)
+
+            with self.assertRaises(CircuitOpenException):
+                await client.get_user_vote_info(1, allow_stale=False)
+
+            with self.assertRaises(CircuitOpenException):
+                await client.get_user_vote_info(2)
+
+        failing = False
+        breaker = CircuitBreaker(failure_threshold=1)
+
+        async with self.create_client(handler, circuit_breaker=breaker) as client:
+            failing = True
+
+            with self.assertRaises(ServerException):
+                await client.bot_votes_this_month()
+
+            with self.assertRaises(CircuitOpenException):
+                await client.bot_votes_this_month()
+
+    async def test_request_deadline(self):
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.5)
+            return httpx.Response(200, json={"data": {"month_votes": 7}})
+
+        breaker = CircuitBreaker(failure_threshold=1)
+
+        async with self.create_client(handler, circuit_breaker=breaker, request_deadline=0.05) as client:
+            with self.assertRaises(RequestTimeoutException):
+                await client.bot_votes_this_month()
+
+            await asyncio.sleep(0.01)
+            self.assertIs(breaker.state, CircuitState.OPEN)
+
+        async with self.create_client(handler) as client:
+            with self.assertRaises(RequestTimeoutException):
+                await client.make_request("GET", "/v1/votes", deadline=0.05)
+
+    async def test_deadline_counts_one_failure_per_request(self):
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.3)
+            return httpx.Response(200, json={"data": {"month_votes": 7}})
+
+        breaker = CircuitBreaker(failure_threshold=2)
+
+        # ten callers waiting on one coalesced request which is slower than the deadline
+        async with self.create_client(handler, circuit_breaker=breaker, request_deadline=0.05) as client:
+            results = await asyncio.gather(*(client.bot_votes_this_month() for _ in range(10)),
+                                           return_exceptions=True)
+
+            self.assertTrue(all(isinstance(result, RequestTimeoutException) for result in results))
+            # the shared request is abandoned at its own deadline, right after the callers gave up on it
+            await asyncio.sleep(0.01)
+            self.assertEqual(breaker.failures, 1)
+            self.assertIs(breaker.state, CircuitState.CLOSED)
+
+    async def test_coalesced_reads_keep_their_own_deadline(self):
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json={"data": {"month_votes": 7}})
+
+        async with self.create_client(handler) as client:
+            short, long = await asyncio.gather(client.make_request("GET", "/v1/votes", deadline=0.05),
+                                               client.make_request("GET", "/v1/votes", deadline=1),
+                                               return_exceptions=True)
+
+            self.assertIsInstance(short, RequestTimeoutException)
+            self.assertEqual(long, {"month_votes": 7})
+
+    async def test_rate_limit_wait_is_not_a_failure(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"data": {"month_votes": 7}},
+                                  headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "5"})
+
+        breaker = CircuitBreaker(failure_threshold=1)
+
+        async with self.create_client(handler, circuit_breaker=breaker) as client:
+            self.assertEqual(await client.bot_votes_this_month(), 7)
+
+            with self.assertRaises(RequestTimeoutException):
+                await client.make_request("GET", "/v1/votes", deadline=0.05)
+
+            self.assertEqual(breaker.failures, 0)
+            self.assertIs(breaker.state, CircuitState.CLOSED)
+
+    async def test_hedge_failures_are_retrieved(self):
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        answer = asyncio.Event()
+        requests = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+            copy = requests
+
+            # both copies of the 21st request complete together, the hedge fails
+            if copy > 20:
+                await answer.wait()
+
+                if copy == 22:
+                    raise httpx.ConnectError("unreachable", request=request)
+            else:
+                await asyncio.sleep(0.001)
+
+            return httpx.Response(200, json={"data": {"month_votes": copy}})
+
+        async with self.create_client(handler, hedge_requests=True) as client:
+            for _ in range(20):
+                await client.bot_votes_this_month()
+
+            asyncio.get_running_loop().call_later(0.2, answer.set)
+            self.assertEqual(await client.bot_votes_this_month(), 21)
+            self.assertEqual(client.hedged, 1)
+
+        await asyncio.sleep(0)
+        gc.collect()
+        self.assertEqual(errors, [])
+
+    async def test_hedges_slow_reads(self):
+        requests = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+
+            # the first copy of the 21st request hangs, its hedge answers right away
+            if requests == 21:
+                await asyncio.sleep(5)
+
+            await asyncio.sleep(0.001)
+            return httpx.Response(200, json={"data": {"month_votes": requests}})
+
+        async with self.create_client(handler, hedge_requests=True) as client:
+            for _ in range(20):
+                await client.bot_votes_this_month()
+
+            self.assertEqual(client.hedged, 0)
+
+            start = time.perf_counter()
+            self.assertEqual(await client.bot_votes_this_month(), 22)
+            self.assertLess(time.perf_counter() - start, 1)
+            self.assertEqual(client.hedged, 1)
+
+    async def test_hedges_need_a_free_slot(self):
+        requests = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal requests
+            requests += 1
+
+            if requests == 21:
+                await asyncio.sleep(0.1)
+
+            await asyncio.sleep(0.001)
+            return httpx.Response(200, json={"data": {"month_votes": requests}})
+
+        scheduler = RequestScheduler(max_concurrency=1)
+
+        async with self.create_client(handler, hedge_requests=True, scheduler=scheduler) as client:
+            for _ in range(20):
+                await client.bot_votes_this_month()
+
+            # the slow request holds the only slot, so it is not hedged
+            self.assertEqual(await client.bot_votes_this_month(), 21)
+            self.assertEqual(client.hedged, 0)
+            self.assertEqual(requests, 21)
+            self.assertEqual(scheduler.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+from typing import List
+
+from diffcord import GuildCountBackend, SharedMemoryGuildCountBackend, StatsReporter, UnixSocketGuildCountBackend
+
+
+class TestStatsReporter(unittest.IsolatedAsyncioTestCase):
+
+    def create_reporter(self, **kwargs) -> StatsReporter:
+        self.guild_count = 10
+        self.uploads = []
+
+        async def upload(guild_count: int):
+            self.uploads.append(guild_count)
+
+        reporter = StatsReporter(upload, lambda: self.guild_count, jitter=0, **kwargs)
+        reporter.start()
+        self.addAsyncCleanup(reporter.stop)
+        return reporter
+
+    async def test_skips_unchanged_guild_count(self):
+        reporter = self.create_reporter(poll_interval=datetime.timedelta(milliseconds=10))
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.uploads, [10])
+        self.assertGreater(reporter.skipped, 0)
+
+        self.guild_count = 11
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.uploads, [10, 11])
+
+    async def test_survives_guild_count_and_callback_errors(self):
+        failures = []
+        ready = False
+
+        def guild_count() -> int:
+            if not ready:
+                raise AttributeError("the bot is not ready")
+
+            return 10
+
+        async def upload(guild_count: int):
+            self.uploads.append(guild_count)
+
+        async def on_failure(e: Exception):
+            failures.append(e)
+            raise RuntimeError("callback failed")
+
+        async def on_success():
+            raise RuntimeError("callback failed")
+
+        self.uploads = []
+        reporter = StatsReporter(upload, guild_count, poll_interval=datetime.timedelta(milliseconds=10), jitter=0,
+                                 on_success=on_success, on_failure=on_failure)
+        reporter.start()
+        self.addAsyncCleanup(reporter.stop)
+
+        await asyncio.sleep(0.05)
+        self.assertGreater(len(failures), 0)
+        self.assertIsInstance(failures[0], AttributeError)
+
+        # still reporting once the bot is ready
+        ready = True
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.uploads, [10])
+
+        reporter.notify()
+        await asyncio.sleep(0.02)
+        self.assertFalse(reporter.start().done())
+
+    async def test_coalesces_guild_changes(self):
+        reporter = self.create_reporter(debounce=datetime.timedelta(milliseconds=30))
+        await asyncio.sleep(0)
+
+        for _ in range(5):
+            self.guild_count += 1
+            reporter.notify()
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(self.uploads, [10])
+
+        await asyncio.sleep(0.06)
+        self.assertEqual(self.uploads, [10, 15])
+
+    async def test_max_staleness(self):
+        reporter = self.create_reporter(debounce=datetime.timedelta(milliseconds=30),
+                                        max_staleness=datetime.timedelta(milliseconds=50))
+        await asyncio.sleep(0)
+
+        # a steady stream of changes never leaves a quiet period
+        for _ in range(10):
+            self.guild_count += 1
+            reporter.notify()
+            await asyncio.sleep(0.01)
+
+        self.assertGreaterEqual(len(self.uploads), 2)
+
+    async def test_stop(self):
+        reporter = self.create_reporter()
+        await asyncio.sleep(0)
+        await reporter.stop()
+
+        reporter.notify()
+        self.assertEqual(self.uploads, [10])
+
+    async def test_shared_memory_aggregation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "guilds")
+            await self.assert_aggregates([SharedMemoryGuildCountBackend(path, slot) for slot in range(3)])
+
+    async def test_unix_socket_aggregation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "guilds.sock")
+            await self.assert_aggregates([UnixSocketGuildCountBackend(path, str(shard)) for shard in range(3)])
+
+    async def test_unix_socket_concurrent_start(self):
+        open_unix_connection = asyncio.open_unix_connection
+
+        async def slow_open_unix_connection(*args, **kwargs):
+            # every process finds no reporter listening before any of them binds the socket
+            try:
+                return await open_unix_connection(*args, **kwargs)
+            finally:
+                await asyncio.sleep(0.02)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "guilds.sock")
+            backends = [UnixSocketGuildCountBackend(path, str(shard)) for shard in range(5)]
+
+            with mock.patch("asyncio.open_unix_connection", slow_open_unix_connection):
+                await asyncio.gather(*(backend.open() for backend in backends))
+
+            for backend in backends:
+                self.addAsyncCleanup(backend.close)
+                await backend.publish(10)
+
+            await asyncio.sleep(0.05)
+            reporters = [backend for backend in backends if backend.is_reporter()]
+
+            self.assertEqual(len(reporters), 1)
+            self.assertEqual(await reporters[0].total(), 50)
+
+    async def assert_aggregates(self, backends: List[GuildCountBackend]):
+        for backend in backends:
+            await backend.open()
+            self.addAsyncCleanup(backend.close)
+
+        for guild_count, backend in enumerate(backends, 1):
+            await backend.publish(guild_count * 100)
+
+        await asyncio.sleep(0.05)
+        reporters = [backend for backend in backends if backend.is_reporter()]
+
+        self.assertEqual(len(reporters), 1)
+        self.assertEqual(await reporters[0].total(), 600)
+
+        # another process takes over once the reporter is gone
+        await reporters[0].close()
+        others = [backend for backend in backends if backend is not reporters[0]]
+
+        for _ in range(2):
+            await asyncio.sleep(0.05)
+
+            for backend in others:
+                await backend.publish(50)
+
+        await asyncio.sleep(0.05)
+        reporters = [backend for backend in others if backend.is_reporter()]
+
+        self.assertEqual(len(reporters), 1)
+        self.assertEqual(await reporters[0].total(), 100)
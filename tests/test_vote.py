@@ -0,0 +1,44 @@
+import datetime
+import pickle
+import unittest
+
+from diffcord import UserBotVote, UserVoteInformation
+
+
+class TestVote(unittest.TestCase):
+
+    def test_since_vote_payload(self):
+        vote = UserBotVote.from_json(b'{"vote_id": "vote", "user_id": "1234", "bot_id": "5678", "since_vote": "30",'
+                                     b' "rewarded": false, "test": true, "monthly_votes": 3}')
+
+        self.assertEqual((vote.user_id, vote.bot_id, vote.monthly_votes, vote.test), (1234, 5678, 3, True))
+        self.assertEqual(vote.since_voted, datetime.timedelta(seconds=30))
+        self.assertEqual(vote.voted_at, datetime.datetime.utcfromtimestamp(vote.received_at - 30))
+
+    def test_voted_at_payload(self):
+        vote = UserBotVote("vote", "1234", "5678", voted_at="2023-03-05T20:29:46.315604-05:00")
+
+        self.assertEqual(vote.voted_at.isoformat(), "2023-03-05T20:29:46.315604-05:00")
+        self.assertAlmostEqual(vote.since_voted.total_seconds(), vote.received_at - vote.voted_at.timestamp(), 5)
+
+    def test_invalid_payload(self):
+        with self.assertRaises(ValueError):
+            UserBotVote.from_json(b"{")
+
+        with self.assertRaises(TypeError):
+            UserBotVote.from_json(b"[]")
+
+    def test_compact_models(self):
+        vote = UserBotVote("vote", "1234", "5678", "30", False, False, 1)
+
+        self.assertFalse(hasattr(vote, "__dict__"))
+        self.assertEqual(pickle.loads(pickle.dumps(vote)).voted_at, vote.voted_at)
+
+    def test_vote_information(self):
+        vote_info = UserVoteInformation("1234", "5678", 2, None, 60)
+
+        self.assertFalse(hasattr(vote_info, "__dict__"))
+        self.assertIsNone(vote_info.last_vote)
+        self.assertFalse(vote_info.can_vote)
+        self.assertEqual(vote_info.next_vote, datetime.datetime.fromtimestamp(vote_info.fetched_at + 60))
+        self.assertTrue(UserVoteInformation("1234", "5678", 2, 60, 0).can_vote)
@@ -1,19 +1,25 @@
+import asyncio
+import datetime
+import json
 import random
+import tempfile
 import unittest
 import uuid
+from typing import List
 
 import aiohttp
 
-from diffcord import VoteWebhookListener, UserBotVote
+from diffcord import VoteWebhookListener, UserBotVote, VoteDeduplicator, VoteJournal
 
 
 class TestWebhookListener(unittest.IsolatedAsyncioTestCase):
     __PORT = 31412
+    engine = "tornado"
 
-    @staticmethod
-    async def open_webhook(*args, **kwargs) -> VoteWebhookListener:
-        listener = VoteWebhookListener(TestWebhookListener.__PORT, *args, **kwargs, silent=True)
+    async def open_webhook(self, *args, **kwargs) -> VoteWebhookListener:
+        listener = VoteWebhookListener(TestWebhookListener.__PORT, *args, **kwargs, silent=True, engine=self.engine)
         await listener.start()
+        self.addAsyncCleanup(listener.stop)
         return listener
 
     @staticmethod
@@ -22,6 +28,21 @@ class TestWebhookListener(unittest.IsolatedAsyncioTestCase):
             async with session.request(method, url, **kwargs) as response:
                 return response
 
+    async def exchange(self, request: bytes) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", TestWebhookListener.__PORT)
+
+        try:
+            writer.write(request)
+            await writer.drain()
+            return await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+
+    @staticmethod
+    def post(body: bytes, connection: str = "keep-alive") -> bytes:
+        return (b"POST / HTTP/1.1\r\nHost: localhost\r\nConnection: %s\r\nContent-Length: %d\r\n\r\n"
+                % (connection.encode(), len(body))) + body
+
     @staticmethod
     def create_vote(test: bool) -> dict:
         return {
@@ -49,7 +70,6 @@ class TestWebhookListener(unittest.IsolatedAsyncioTestCase):
 
         async def handle_vote(vote: UserBotVote):
             nonlocal entered_handle_vote
-            nonlocal created_vote
 
             entered_handle_vote = True
 
@@ -106,3 +126,265 @@ class TestWebhookListener(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(response.status, 200)
         self.assertEqual(enters_handle_vote, 1)
+
+    async def test_queued_votes_are_acknowledged_before_handling(self):
+        release = asyncio.Event()
+        handled = []
+
+        async def handle_vote(vote: UserBotVote):
+            await release.wait()
+            handled.append(vote.vote_id)
+
+        listener = await self.open_webhook(handle_vote=handle_vote, queue_size=2, workers=1)
+        url = f"http://localhost:{TestWebhookListener.__PORT}"
+
+        # one vote is picked up by the worker, two wait in the queue
+        statuses = [(await self.send_webhook(url, "POST", json=self.create_vote(False))).status for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(listener.queue_depth, 2)
+
+        response = await self.send_webhook(url, "POST", json=self.create_vote(False))
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.headers["Retry-After"], "5")
+        self.assertEqual(listener.rejected, 1)
+
+        release.set()
+        await listener.stop()
+
+        self.assertEqual(len(handled), 3)
+        self.assertEqual(listener.queue_depth, 0)
+
+    async def test_duplicate_votes_are_acknowledged_once(self):
+        enters_handle_vote: int = 0
+
+        async def handle_vote(vote: UserBotVote):
+            nonlocal enters_handle_vote
+            enters_handle_vote += 1
+
+        listener = await self.open_webhook(handle_vote=handle_vote, deduplicator=VoteDeduplicator())
+        vote = self.create_vote(False)
+
+        for _ in range(3):
+            response = await self.send_webhook(f"http://localhost:{TestWebhookListener.__PORT}", "POST", json=vote)
+            self.assertEqual(response.status, 200)
+
+        self.assertEqual(enters_handle_vote, 1)
+        self.assertEqual(listener.duplicates, 2)
+
+    async def test_duplicates_in_flight_are_not_acknowledged(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+        attempts = 0
+
+        async def handle_vote(vote: UserBotVote):
+            nonlocal attempts
+            attempts += 1
+
+            if attempts == 1:
+                started.set()
+                await release.wait()
+                raise RuntimeError("database unavailable")
+
+        listener = await self.open_webhook(handle_vote=handle_vote, deduplicator=VoteDeduplicator())
+        url = f"http://localhost:{TestWebhookListener.__PORT}"
+        vote = self.create_vote(False)
+
+        original = asyncio.ensure_future(self.send_webhook(url, "POST", json=vote))
+        await asyncio.wait_for(started.wait(), 5)
+
+        # a retry arriving while the original is handled must not be acknowledged, the original may still fail
+        duplicate = await self.send_webhook(url, "POST", json=vote)
+        self.assertEqual(duplicate.status, 409)
+        self.assertEqual(duplicate.headers["Retry-After"], "5")
+
+        release.set()
+        self.assertEqual((await original).status, 500)
+
+        # the vote was not delivered, so the next retry is handled again
+        response = await self.send_webhook(url, "POST", json=vote)
+        self.assertEqual(response.status, 200)
+        self.assertEqual((attempts, listener.duplicates), (2, 1))
+
+    async def test_replays_journaled_votes_on_start(self):
+        with tempfile.TemporaryDirectory() as directory:
+            vote = self.create_vote(False)
+
+            journal = VoteJournal(directory)
+            journal.open()
+            await journal.append(vote["vote_id"], json.dumps(vote).encode())
+            journal.close()
+
+            handled = asyncio.Event()
+
+            async def handle_vote(vote: UserBotVote):
+                handled.set()
+
+            journal = VoteJournal(directory)
+            await self.open_webhook(handle_vote=handle_vote, journal=journal)
+            await asyncio.wait_for(handled.wait(), 1)
+
+            self.assertEqual(journal.pending, 0)
+
+    async def test_retries_of_failing_replayed_votes_are_handled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            vote = self.create_vote(False)
+
+            journal = VoteJournal(directory)
+            journal.open()
+            await journal.append(vote["vote_id"], json.dumps(vote).encode())
+            journal.close()
+
+            started = asyncio.Event()
+            release = asyncio.Event()
+            attempts = 0
+
+            async def handle_vote(vote: UserBotVote):
+                nonlocal attempts
+                attempts += 1
+
+                if attempts == 1:
+                    started.set()
+                    await release.wait()
+                    raise RuntimeError("database unavailable")
+
+            await self.open_webhook(handle_vote=handle_vote, journal=VoteJournal(directory),
+                                    deduplicator=VoteDeduplicator())
+            await asyncio.wait_for(started.wait(), 5)
+            url = f"http://localhost:{TestWebhookListener.__PORT}"
+
+            # the replayed vote may still fail, so a retry is not acknowledged while it is handled
+            response = await self.send_webhook(url, "POST", json=vote)
+            self.assertEqual(response.status, 409)
+
+            release.set()
+            await asyncio.sleep(0.01)
+
+            response = await self.send_webhook(url, "POST", json=vote)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(attempts, 2)
+
+    async def test_multi_process_listener(self):
+        handled = []
+
+        async def handle_vote(vote: UserBotVote):
+            if vote.monthly_votes == 0:
+                raise ValueError("database unavailable")
+
+            handled.append(vote.vote_id)
+
+        verify_code = "thisisanexampleverifycode"
+        listener = await self.open_webhook(handle_vote=handle_vote, verify_code=verify_code, processes=2,
+                                           deduplicator=VoteDeduplicator())
+        url = f"http://localhost:{TestWebhookListener.__PORT}"
+        headers = {"Authorization": verify_code}
+
+        # wait for the listener processes to bind the port
+        for _ in range(100):
+            try:
+                await self.send_webhook(url, "GET")
+                break
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.05)
+
+        votes = [self.create_vote(False) for _ in range(20)]
+        responses = await asyncio.gather(*(self.send_webhook(url, "POST", json=vote, headers=headers)
+                                           for vote in votes))
+
+        # webhooks are answered once the bot process handled their vote
+        self.assertEqual({response.status for response in responses}, {200})
+        self.assertEqual(sorted(handled), sorted(vote["vote_id"] for vote in votes))
+
+        # the bot process reports failures and duplicates back to the listener processes
+        failing_vote = dict(self.create_vote(False), monthly_votes=0)
+        response = await self.send_webhook(url, "POST", json=failing_vote, headers=headers)
+        self.assertEqual(response.status, 500)
+
+        response = await self.send_webhook(url, "POST", json=votes[0], headers=headers)
+        self.assertEqual(response.status, 200)
+        self.assertEqual((len(handled), listener.duplicates), (20, 1))
+
+        response = await self.send_webhook(url, "POST", json=self.create_vote(False))
+        self.assertEqual(response.status, 403)
+
+    async def test_micro_batched_votes(self):
+        batches = []
+
+        async def handle_votes(votes: List[UserBotVote]):
+            batches.append(len(votes))
+
+            if any(vote.monthly_votes == 0 for vote in votes):
+                raise ValueError("database unavailable")
+
+        await self.open_webhook(handle_votes=handle_votes, batch_max_size=5,
+                                batch_max_delay=datetime.timedelta(milliseconds=20))
+        url = f"http://localhost:{TestWebhookListener.__PORT}"
+
+        responses = await asyncio.gather(*(self.send_webhook(url, "POST", json=self.create_vote(False))
+                                           for _ in range(12)))
+
+        self.assertEqual({response.status for response in responses}, {200})
+        self.assertEqual(sum(batches), 12)
+        self.assertLess(len(batches), 12)
+
+        failing_vote = dict(self.create_vote(False), monthly_votes=0)
+        response = await self.send_webhook(url, "POST", json=failing_vote)
+        self.assertEqual(response.status, 500)
+
+    async def test_rejects_oversized_body(self):
+        handled = []
+
+        async def handle_vote(vote: UserBotVote):
+            handled.append(vote)
+
+        await self.open_webhook(handle_vote=handle_vote, host="127.0.0.1", max_body_size=128)
+
+        # answered the same by both engines, before the body is read (so it is not sent, which would make the
+        # connection reset once the server closes it with unread data)
+        for size in (129, 1000000):
+            response = await self.exchange(self.post(b"x" * size)[:-size])
+            self.assertTrue(response.startswith(b"HTTP/1.1 413 "))
+
+        vote = json.dumps({"vote_id": "a", "user_id": "1", "bot_id": "2", "monthly_votes": 1}).encode()
+        response = await self.exchange(self.post(vote, "close"))
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 "))
+        self.assertEqual(len(handled), 1)
+
+    def test_requires_exactly_one_handler(self):
+        with self.assertRaises(ValueError):
+            VoteWebhookListener(TestWebhookListener.__PORT)
+
+
+class TestAsyncioWebhookListener(TestWebhookListener):
+    __PORT = 31412
+    engine = "asyncio"
+
+    async def test_pipelined_keep_alive_requests(self):
+        handled = []
+
+        async def handle_vote(vote: UserBotVote):
+            # the first vote takes longest, responses must still come back in order
+            await asyncio.sleep(0.05 if not handled else 0)
+            handled.append(vote.vote_id)
+
+        await self.open_webhook(handle_vote=handle_vote, host="127.0.0.1")
+        votes = [json.dumps(self.create_vote(False)).encode() for _ in range(3)]
+
+        response = await self.exchange(self.post(votes[0]) + self.post(b"{}") + self.post(votes[1]) +
+                                       b"GET /missing HTTP/1.1\r\n\r\n" + self.post(votes[2], "close"))
+
+        statuses = [line.split(b" ")[1] for line in response.split(b"\r\n") if line.startswith(b"HTTP/1.1")]
+        self.assertEqual(statuses, [b"200", b"400", b"200", b"404", b"200"])
+        self.assertEqual(len(handled), 3)
+
+    async def test_rejects_chunked_body(self):
+        async def handle_vote(vote: UserBotVote):
+            pass
+
+        await self.open_webhook(handle_vote=handle_vote, host="127.0.0.1", max_body_size=128)
+
+        response = await self.exchange(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 501 "))
+
+    def test_rejects_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            VoteWebhookListener(TestAsyncioWebhookListener.__PORT, print, engine="twisted")